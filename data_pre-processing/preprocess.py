@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Builds the model inputs of a region from the raw county files, the steps of data_preprocessing.ipynb as one
+# command: us-counties.txt is read once, the daily new cases of every selected county come from a single
+# pivot over (state, fips), and the graphs are filled with vectorized index lookups.
+#
+#   python preprocess.py --states CA --threshold 3000                  ../data/ts/ca48-548.txt, fips/ca48-fips.txt,
+#                                                                      adj/ca48-adj.txt, sci/ca48-sci.txt, svi/ca48-svi.txt
+#   python preprocess.py --threshold 10000 --days 365                  all 50 states, first 365 days
+#   python preprocess.py --fips ../data/fips/ca48-fips.txt --name ca48  exactly these counties, in this order
+#
+# Outputs whose source file (--adjacency, --sci, --svi) does not exist are skipped.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, argparse
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import pdist, squareform
+
+STATES = {'Alabama': 'AL', 'Alaska': 'AK', 'Arizona': 'AZ', 'Arkansas': 'AR', 'California': 'CA',
+          'Colorado': 'CO', 'Connecticut': 'CT', 'Delaware': 'DE', 'Florida': 'FL', 'Georgia': 'GA',
+          'Hawaii': 'HI', 'Idaho': 'ID', 'Illinois': 'IL', 'Indiana': 'IN', 'Iowa': 'IA',
+          'Kansas': 'KS', 'Kentucky': 'KY', 'Louisiana': 'LA', 'Maine': 'ME', 'Maryland': 'MD',
+          'Massachusetts': 'MA', 'Michigan': 'MI', 'Minnesota': 'MN', 'Mississippi': 'MS',
+          'Missouri': 'MO', 'Montana': 'MT', 'Nebraska': 'NE', 'Nevada': 'NV', 'New Hampshire': 'NH',
+          'New Jersey': 'NJ', 'New Mexico': 'NM', 'New York': 'NY', 'North Carolina': 'NC',
+          'North Dakota': 'ND', 'Ohio': 'OH', 'Oklahoma': 'OK', 'Oregon': 'OR', 'Pennsylvania': 'PA',
+          'Rhode Island': 'RI', 'South Carolina': 'SC', 'South Dakota': 'SD', 'Tennessee': 'TN',
+          'Texas': 'TX', 'Utah': 'UT', 'Vermont': 'VT', 'Virginia': 'VA', 'Washington': 'WA',
+          'West Virginia': 'WV', 'Wisconsin': 'WI', 'Wyoming': 'WY'}
+
+SVI_FEATURES = ['EP_POV150', 'EP_UNEMP', 'EP_HBURD', 'EP_NOHSDP', 'EP_UNINSUR', 'EP_AGE65', 'EP_AGE17', 'EP_DISABL',
+                'EP_SNGPNT', 'EP_LIMENG', 'EP_MINRTY', 'EP_MUNIT', 'EP_MOBILE', 'EP_CROWD', 'EP_NOVEH', 'EP_GROUPQ']
+
+def state_names(states):
+    """Full state names of names or abbreviations, in the order of STATES (the column order of the series)."""
+    if not states:
+        return list(STATES)
+    abbr = {v: k for k, v in STATES.items()}
+    names = set()
+    for s in states:
+        if s not in STATES and s.upper() not in abbr:
+            raise LookupError('unknown state {}'.format(s))
+        names.add(s if s in STATES else abbr[s.upper()])
+    return [s for s in STATES if s in names]
+
+def load_cases(path, begin, end, states):
+    """Rows of the selected states and dates of the county case file, read once."""
+    df = pd.read_csv(path, usecols=['date', 'state', 'fips', 'cases'], dtype={'date': str, 'state': str, 'fips': float, 'cases': float})
+    return df[df['fips'].notna() & (df['date'] >= begin) & (df['date'] <= end) & df['state'].isin(states)] # iso dates compare as strings
+
+def new_cases(df, states, threshold=None, fips=None):
+    """[days, counties] daily new cases and the county fips. Counties missing a day are dropped, then those
+    with threshold or fewer new cases in total; columns by state (STATES order) then fips, or in the order of fips."""
+    cumulative = df.pivot_table(index='date', columns=['state', 'fips'], values='cases', aggfunc='sum')
+    cases = cumulative.diff().iloc[1:].dropna(axis=1) # the first day has no new cases
+    cases.columns = pd.MultiIndex.from_arrays([cases.columns.get_level_values(0), cases.columns.get_level_values(1).astype(int)])
+    if fips:
+        by_fips = cases.droplevel('state', axis=1)
+        missing = [f for f in fips if f not in by_fips.columns]
+        if missing:
+            raise LookupError('no complete case series for fips {}'.format(missing))
+        return by_fips[fips].values, list(fips)
+    if threshold:
+        cases = cases.loc[:, cases.sum() > threshold]
+    order = {s: i for i, s in enumerate(states)}
+    columns = sorted(cases.columns, key=lambda c: (order[c[0]], c[1]))
+    return cases[columns].values, [c[1] for c in columns]
+
+def index_pairs(fips, a, b):
+    """Row and column indices of the (a, b) fips pairs with both counties in fips."""
+    idx = pd.Series(np.arange(len(fips)), index=fips)
+    keep = a.isin(idx.index) & b.isin(idx.index)
+    return idx[a[keep]].values, idx[b[keep]].values, keep
+
+def adjacency_graph(fips, path):
+    """0/1 county adjacency (every county is its own neighbor in county_adjacency2010.csv)."""
+    df = pd.read_csv(path, usecols=['fipscounty', 'fipsneighbor'])
+    i, j, _ = index_pairs(fips, df['fipscounty'], df['fipsneighbor'])
+    adj = np.zeros((len(fips), len(fips)))
+    adj[i, j] = 1
+    return adj
+
+def sci_graph(fips, path):
+    """Symmetric scaled social connectedness index between the counties."""
+    df = pd.read_csv(path, sep='\t', usecols=['user_loc', 'fr_loc', 'scaled_sci'])
+    i, j, keep = index_pairs(fips, df['user_loc'], df['fr_loc'])
+    sci = np.zeros((len(fips), len(fips)))
+    sci[i, j] = sci[j, i] = df['scaled_sci'][keep].values
+    return sci
+
+def svi_graph(fips, path):
+    """Similarity of the min-max scaled SVI features (and population density): n_features - euclidean distance."""
+    df = pd.read_csv(path, usecols=['FIPS', 'AREA_SQMI', 'E_TOTPOP'] + SVI_FEATURES).set_index('FIPS')
+    df = df.loc[fips]
+    features = df[['E_TOTPOP'] + SVI_FEATURES].assign(E_POPDEN=df['E_TOTPOP'] / df['AREA_SQMI']).to_numpy(dtype=np.float64)
+    span = features.max(0) - features.min(0)
+    span[span == 0] = 1.
+    scaled = (features - features.min(0)) / span
+    return features.shape[1] - squareform(pdist(scaled, metric='euclidean'))
+
+def save(path, array, fmt):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    np.savetxt(path, array, delimiter=',', fmt=fmt)
+    print('saved', path, array.shape)
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--cases', type=str, default='us-counties.txt', help='cumulative cases per county and date (date,county,state,fips,cases,deaths)')
+    ap.add_argument('--adjacency', type=str, default='../county_adjacency2010.csv', help='')
+    ap.add_argument('--sci', type=str, default='../county_county.tsv', help='')
+    ap.add_argument('--svi', type=str, default='../SVI2020_US_COUNTY.csv', help='')
+    ap.add_argument('--states', type=str, nargs='*', default=[], help='state names or abbreviations, default all 50')
+    ap.add_argument('--fips', type=str, default='', help='file of county fips (one per line) to take instead of the threshold selection')
+    ap.add_argument('--begin', type=str, default='2020-04-06', help='first date (its new cases are not in the series)')
+    ap.add_argument('--end', type=str, default='2021-10-06', help='last date')
+    ap.add_argument('--threshold', type=float, default=10000, help='minimum total new cases of a county, 0 keeps all')
+    ap.add_argument('--days', type=int, default=0, help='keep only the first days of the series')
+    ap.add_argument('--name', type=str, default='', help='output name, default <region><counties> (e.g. ca48), files get -<days> etc.')
+    ap.add_argument('--out', type=str, default='../data', help='')
+    args = ap.parse_args()
+
+    fips = [int(l) for l in open(args.fips).read().split()] if args.fips else None
+    states = state_names(args.states)
+    df = load_cases(args.cases, args.begin, args.end, states)
+    data, fips = new_cases(df, states, args.threshold, fips)
+    if args.days:
+        data = data[:args.days]
+    name = args.name or '%s%d' % (STATES[states[0]].lower() if len(states) == 1 else 'us', len(fips))
+    print('{} counties x {} days'.format(len(fips), data.shape[0]))
+
+    save('%s/ts/%s-%d.txt' % (args.out, name, data.shape[0]), data, '%.1f')
+    save('%s/fips/%s-fips.txt' % (args.out, name), np.array(fips), '%d')
+    if os.path.exists(args.adjacency):
+        save('%s/adj/%s-adj.txt' % (args.out, name), adjacency_graph(fips, args.adjacency), '%d')
+    if os.path.exists(args.sci):
+        save('%s/sci/%s-sci.txt' % (args.out, name), sci_graph(fips, args.sci), '%.1f')
+    if os.path.exists(args.svi):
+        save('%s/svi/%s-svi.txt' % (args.out, name), svi_graph(fips, args.svi), '%.4f')
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Rolling-origin backtest: walk the forecast origin through the series every --step days, retrain on the
+# data known at that origin (warm-started from the previous origin), forecast the next --step windows and
+# collect the metrics of train.py per origin and horizon.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, time, copy, random
+import numpy as np
+import pandas as pd
+import torch
+from multiprocessing import Pool
+import warnings
+
+from models import get_model, NO_TRAIN_MODELS
+from data import DataBasicLoader
+from options import get_parser, get_log_token
+from utils import evaluation_metrics, quantile_levels
+from export import predict
+from training import fit
+
+def origin_splits(data, samples, origin, val_days, step):
+    """Train/val/test windows for a forecast origin (first day not observed yet).
+
+    samples = data._batchify over every target day, built once and sliced here. Train and val targets are
+    all observed before the origin, the test windows are the next `step` forecasts made from day origin-1 on.
+    """
+    X, Y = samples
+    offset = data.P + data.h - 1 # target day of samples[0]
+    def take(start, end):
+        start, end = max(start - offset, 0), min(end - offset, X.size(0))
+        return [X[start:end], Y[start:end]]
+    train = take(offset, origin - val_days)
+    val = take(origin - val_days, origin)
+    test = take(origin + data.h - 1, origin + data.h - 1 + step)
+    return train, val, test
+
+def test_rows(model, data, test, origin, args):
+    """Metrics of the forecasts made at origin, one row per horizon."""
+    model.eval()
+    y_true_states, y_pred_states = predict(model, data, test, args.batch)
+    if args.multi_horizon:
+        horizons = [(k+1, y_true_states[:,k], y_pred_states[:,k]) for k in range(args.horizon)]
+    else:
+        horizons = [(args.horizon, y_true_states, y_pred_states)]
+    rows = []
+    for horizon, y_true, y_pred in horizons:
+        mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluation_metrics(y_true, y_pred, data.peak_thold)
+        rows.append({'origin': origin, 'horizon': horizon, 'n_test': y_true.shape[0], 'mae': mae, 'std_mae': std_mae,
+                     'rmse': rmse, 'rmse_states': rmse_states, 'pcc': pcc, 'pcc_states': pcc_states, 'peak_mae': peak_mae})
+    return rows
+
+# state shared by the pool workers, set once per process
+_worker = {}
+
+def init_worker(args, data, samples, threads):
+    torch.set_num_threads(threads)
+    _worker.update(args=args, data=data, samples=samples)
+
+def run_origins(origins, state, seed, epochs):
+    """Retrain and test at each origin in turn, every origin warm-started from the previous one's weights."""
+    args, data, samples = _worker['args'], _worker['data'], _worker['samples']
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    model = get_model(args, data)
+    if state is not None:
+        model.load_state_dict(state)
+    rows = []
+    for origin in origins:
+        start = time.time()
+        train, val, test = origin_splits(data, samples, origin, args.val_days, args.step)
+        n_epochs = 0
+        if args.model not in NO_TRAIN_MODELS:
+            n_epochs, _, _ = fit(model, data, train, val, epochs, args.patience, args)
+        for row in test_rows(model, data, test, origin, args):
+            row.update(epochs=n_epochs, seconds=time.time() - start)
+            rows.append(row)
+        print('origin {:4d}|epochs {:4d}|time:{:6.2f}s|MAE {:5.4f}'.format(origin, n_epochs, time.time() - start, rows[-1]['mae']))
+        epochs = args.warm_epochs
+    return rows, copy.deepcopy(model.state_dict())
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore") # pearsonr on short test blocks with constant series
+    ap = get_parser()
+    ap.add_argument('--step', type=int, default=7, help='days between forecast origins (retrain every step days)')
+    ap.add_argument('--val_days', type=int, default=14, help='days before each origin used for early stopping')
+    ap.add_argument('--warm_epochs', type=int, default=50, help='max epochs of the warm-started retrains')
+    ap.add_argument('--workers', type=int, default=1, help='processes training origins in parallel')
+    ap.add_argument('--result_dir', type=str, default='backtest', help='dir path to save the backtest metrics')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, backtest.py uses point forecasts')
+    args.cuda = False # the pool trains on cpu
+    print(args)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    # the first origin is the end of the --train split, the normalization of that split is kept for all origins
+    data_loader = DataBasicLoader(args)
+    samples = data_loader._batchify(range(data_loader.P + data_loader.h - 1, data_loader.n), data_loader.h)
+    origins = list(range(int(args.train * data_loader.n), data_loader.n - data_loader.h, args.step)) # at least 2 test windows each
+    print('{} origins from day {} every {} days'.format(len(origins), origins[0], args.step))
+
+    # first origin from scratch, the others warm-started
+    init_worker(args, data_loader, samples, torch.get_num_threads())
+    rows, state = run_origins(origins[:1], None, args.seed, args.epochs)
+    rest = origins[1:]
+    if args.workers > 1 and len(rest) > 1:
+        # contiguous chunks of origins per worker, each chain starts from the first origin's weights
+        chunks = [list(c) for c in np.array_split(rest, min(args.workers, len(rest)))]
+        threads = max(1, torch.get_num_threads() // len(chunks))
+        with Pool(len(chunks), initializer=init_worker, initargs=(args, data_loader, samples, threads)) as pool:
+            results = pool.starmap(run_origins, [(chunk, state, args.seed + i + 1, args.warm_epochs) for i, chunk in enumerate(chunks)])
+        for chunk_rows, _ in results:
+            rows.extend(chunk_rows)
+    elif rest:
+        chunk_rows, _ = run_origins(rest, state, args.seed + 1, args.warm_epochs)
+        rows.extend(chunk_rows)
+
+    df = pd.DataFrame(rows).sort_values(['origin', 'horizon'])
+    if not os.path.exists(args.result_dir):
+        os.makedirs(args.result_dir)
+    path = '%s/%s.step-%s.csv' % (args.result_dir, get_log_token(args), args.step)
+    df.to_csv(path, index=False)
+    print(df.groupby('horizon')[['mae', 'rmse', 'rmse_states', 'pcc', 'pcc_states', 'peak_mae']].mean())
+    print('total train time {:.1f}s, saved to {}'.format(df.groupby('origin')['seconds'].first().sum(), path))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Forward/backward/optimizer-step benchmark of every model on synthetic series and random sparse graphs,
+# over numbers of locations m, windows and batch sizes. Each configuration runs in a fresh child process
+# so its peak memory (max RSS growth, or max allocated on cuda) is its own.
+#
+#   python benchmark.py                                  full grid, writes bench/<commit>.json
+#   python benchmark.py --m 48 500 --models colagnn arma --compare bench/<other commit>.json
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, sys, json, time, resource, argparse, itertools, platform
+import multiprocessing as mp
+import numpy as np
+import torch
+import torch.nn.functional as F
+import warnings
+
+from models import MODELS, NO_TRAIN_MODELS, get_model
+from options import get_parser
+from graph import normalize_graph
+from results import git_commit
+
+class SyntheticData(object):
+    """Stands in for DataBasicLoader when building models: positive seasonal series [n, m], a random
+    symmetric sparse adjacency with self loops (about `degree` neighbors per node) and a dense SCI-like matrix."""
+    def __init__(self, m, n=200, degree=6, seed=0):
+        rng = np.random.RandomState(seed)
+        t = np.arange(n)[:, None]
+        self.rawdat = (1 + np.sin(2 * np.pi * t / rng.uniform(20, 60, m)) + t / n) * rng.uniform(10, 1000, m) + rng.rand(n, m)
+        adj = rng.rand(m, m) < degree / (2. * m)
+        adj = (adj | adj.T | np.eye(m, dtype=bool)).astype(np.float32)
+        sci = rng.rand(m, m)
+        sci = (sci + sci.T).astype(np.float32)
+        self.m = m
+        self.n = n
+        self.d = 0
+        self.multi_horizon = False
+        self.orig_adj = torch.from_numpy(adj)
+        self.adj = torch.from_numpy(normalize_graph(adj, 'sym').astype(np.float32))
+        self.orig_sci = torch.from_numpy(sci)
+        self.sci = torch.from_numpy(normalize_graph(sci, 'sym').astype(np.float32))
+        self.dat = (self.rawdat - self.rawdat.min(0)) / (self.rawdat.max(0) - self.rawdat.min(0))
+
+    def batch(self, window, batch_size, device='cpu'):
+        start = np.random.randint(0, self.n - window - 1, batch_size)
+        X = np.stack([self.dat[s:s + window] for s in start])
+        Y = np.stack([self.dat[s + window] for s in start])
+        return torch.Tensor(X).to(device), torch.Tensor(Y).to(device)
+
+def load_stan():
+    """ColaGNN_STAN from src/stan, its forward also takes the I and R series (the window is reused for both)."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stan'))
+    from colagnn_stan import ColaGNN_STAN
+    class STAN(ColaGNN_STAN):
+        def forward(self, x):
+            out, _, _ = super().forward(x, x, x)
+            return out, None
+    return STAN
+
+def dense_attention_bytes(model, m, batch_size, n_hidden):
+    """Rough activation size of the dense [b, m, m, n_hidden/2] attention of the ColaGNN models with Wb."""
+    if model not in ('colagnn', 'colagnn_thresholding'):
+        return 0
+    return 4 * 3 * batch_size * m * m * max(1, n_hidden // 2) # forward tensor, its activation and the gradient
+
+def peak_memory(device, baseline):
+    if device == 'cuda':
+        return torch.cuda.max_memory_allocated() / 2 ** 20
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 2 ** 10 # kB on linux
+
+def run_config(config):
+    """Time forward, backward and optimizer step of one (model, m, window, batch) configuration."""
+    model_name, m, window, batch_size, repeats, device = config
+    torch.manual_seed(0)
+    np.random.seed(0)
+    data = SyntheticData(m, n=max(200, 3 * window))
+    args = get_parser().parse_args([])
+    args.window, args.cuda, args.graph_cache = window, device == 'cuda', ''
+    if device == 'cuda':
+        torch.cuda.reset_peak_memory_stats()
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    row = {'model': model_name, 'm': m, 'window': window, 'batch': batch_size, 'device': device}
+    try:
+        if model_name == 'colagnn_stan':
+            model = load_stan()(args, data)
+        else:
+            args.model = model_name
+            model = get_model(args, data)
+        model.to(device)
+        params = [p for p in model.parameters() if p.requires_grad]
+        optimizer = torch.optim.Adam(params, lr=args.lr) if params and model_name not in NO_TRAIN_MODELS else None
+        times = {'forward': [], 'backward': [], 'step': []}
+        for i in range(repeats + 1): # the first is a warm up
+            X, Y = data.batch(window, batch_size, device)
+            model.train()
+            if optimizer is not None:
+                optimizer.zero_grad()
+            start = time.perf_counter()
+            with torch.set_grad_enabled(optimizer is not None):
+                output, _ = model(X)
+                loss = F.l1_loss(output.reshape(Y.size()), Y)
+            t_forward = time.perf_counter()
+            if optimizer is not None:
+                loss.backward()
+                t_backward = time.perf_counter()
+                optimizer.step()
+                t_step = time.perf_counter()
+            if i > 0:
+                times['forward'].append(t_forward - start)
+                if optimizer is not None:
+                    times['backward'].append(t_backward - t_forward)
+                    times['step'].append(t_step - t_backward)
+        for k, v in times.items():
+            row[k + '_ms'] = float(np.median(v) * 1000) if v else None
+        row['windows_per_s'] = batch_size / (np.median(times['forward']) + (np.median(times['backward']) + np.median(times['step']) if optimizer else 0))
+        row['params'] = sum(p.numel() for p in params)
+        row['peak_mb'] = peak_memory(device, baseline)
+        row['status'] = 'ok'
+    except (RuntimeError, MemoryError) as e:
+        row['status'] = 'error: ' + str(e).split('\n')[0][:200]
+    return row
+
+def compare(results, path):
+    """Print the time ratio (this run / other run) of the configurations found in both files."""
+    with open(path) as f:
+        other = {(r['model'], r['m'], r['window'], r['batch']): r for r in json.load(f)['results'] if r['status'] == 'ok'}
+    print('ratio to', path)
+    for r in results:
+        o = other.get((r['model'], r['m'], r['window'], r['batch']))
+        if r['status'] != 'ok' or o is None:
+            continue
+        ratios = ['{} {:5.2f}'.format(k, r[k + '_ms'] / o[k + '_ms']) for k in ('forward', 'backward', 'step') if r.get(k + '_ms') and o.get(k + '_ms')]
+        print('{:22s} m {:5d} w {:3d} b {:3d} | {}'.format(r['model'], r['m'], r['window'], r['batch'], ' '.join(ratios)))
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore") # deprecation warnings of the model constructors
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--models', type=str, nargs='+', default=list(MODELS) + ['colagnn_stan'], help='')
+    ap.add_argument('--m', type=int, nargs='+', default=[48, 500, 3000], help='numbers of locations')
+    ap.add_argument('--windows', type=int, nargs='+', default=[7, 14, 28], help='')
+    ap.add_argument('--batches', type=int, nargs='+', default=[1, 8, 32], help='batch sizes')
+    ap.add_argument('--repeats', type=int, default=5, help='timed iterations per configuration (median reported)')
+    ap.add_argument('--max_attn_gb', type=float, default=8, help='skip dense attention configurations estimated above this size')
+    ap.add_argument('--threads', type=int, default=0, help='torch threads, 0 keeps the default')
+    ap.add_argument('--cuda', action='store_true', default=False, help='')
+    ap.add_argument('--out', type=str, default='', help='result file, default bench/<commit>.json')
+    ap.add_argument('--compare', type=str, default='', help='earlier result file to compare the times with')
+    args = ap.parse_args()
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    device = 'cuda' if args.cuda and torch.cuda.is_available() else 'cpu'
+    n_hidden = get_parser().parse_args([]).n_hidden
+
+    run_config(('colagnn', 8, 7, 2, 1, device)) # load the kernels before forking, keeps them out of the peaks
+    results = []
+    ctx = mp.get_context('fork')
+    for model, m, window, batch_size in itertools.product(args.models, args.m, args.windows, args.batches):
+        if dense_attention_bytes(model, m, batch_size, n_hidden) > args.max_attn_gb * 2 ** 30:
+            row = {'model': model, 'm': m, 'window': window, 'batch': batch_size, 'device': device, 'status': 'skipped: dense attention above --max_attn_gb'}
+        else:
+            with ctx.Pool(1) as pool: # fresh process per configuration for its peak memory
+                row = pool.apply(run_config, ((model, m, window, batch_size, args.repeats, device),))
+        results.append(row)
+        if row['status'] == 'ok':
+            print('{:22s} m {:5d} w {:3d} b {:3d} | fwd {:9.2f}ms bwd {} step {} | {:10.1f} windows/s | peak {:8.1f}MB'.format(
+                model, m, window, batch_size, row['forward_ms'],
+                '{:9.2f}ms'.format(row['backward_ms']) if row['backward_ms'] is not None else '        -',
+                '{:7.2f}ms'.format(row['step_ms']) if row['step_ms'] is not None else '      -',
+                row['windows_per_s'], row['peak_mb']))
+        else:
+            print('{:22s} m {:5d} w {:3d} b {:3d} | {}'.format(model, m, window, batch_size, row['status']))
+
+    commit = git_commit()
+    path = args.out or 'bench/%s.json' % commit
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        json.dump({'commit': commit, 'torch': torch.__version__, 'threads': torch.get_num_threads(), 'device': device,
+                   'machine': platform.platform(), 'processor': platform.processor(), 'results': results}, f, indent=1)
+    print('saved', path)
+    if args.compare:
+        compare(results, args.compare)
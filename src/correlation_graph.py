@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Data-driven graph from lagged Pearson correlations between the series of all location pairs.
+# The correlations are computed a block of locations at a time ([block, m] per lag, never [m, m] per lag),
+# every block keeps only its edges (top-k per node and/or above a threshold), and the graph is written
+# as ../data/adj/<name>.txt in the format of the shipped adjacency files, usable with --sim_mat <name>.
+#
+#   python correlation_graph.py --dataset ca48-548 --max_lag 7 --topk 5 --name ca48-pcc
+#   python train.py --sim_mat ca48-pcc
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import numpy as np
+import scipy.sparse as sp
+
+from utils import movemedian_6, movemean_7
+
+def standardize(x):
+    """Columns of x with zero mean and unit norm (constant columns stay 0), so a.T @ b is the correlation."""
+    x = x - x.mean(0)
+    norm = np.sqrt((x ** 2).sum(0))
+    norm[norm == 0] = np.inf
+    return x / norm
+
+def lagged_correlation_edges(ts, max_lag=0, topk=0, threshold=None, block=512, absolute=False):
+    """Edges (rows, cols, weights, lags) of the strongest lagged correlation of every location pair.
+
+    ts [n, m]; the weight of (i, j) is max over lag in 0..max_lag of corr(ts[t, i], ts[t + lag, j]) (i leads j),
+    absolute: rank |corr| instead. Per row keeps the topk largest (0 for all) and those above threshold.
+    """
+    n, m = ts.shape
+    if max_lag >= n - 1:
+        raise ValueError('max_lag {} needs more than {} time steps'.format(max_lag, n))
+    leads = [standardize(ts[:n - lag]) for lag in range(max_lag + 1)]
+    follows = [standardize(ts[lag:]) for lag in range(max_lag + 1)]
+    rows, cols, weights, lags = [], [], [], []
+    for start in range(0, m, block):
+        stop = min(m, start + block)
+        best = np.full((stop - start, m), -np.inf)
+        best_lag = np.zeros((stop - start, m), dtype=np.int64)
+        for lag in range(max_lag + 1):
+            corr = leads[lag][:, start:stop].T @ follows[lag] # [block, m]
+            if absolute:
+                corr = np.abs(corr)
+            better = corr > best
+            best[better] = corr[better]
+            best_lag[better] = lag
+        best[np.arange(stop - start), np.arange(start, stop)] = -np.inf # self loops are added by the caller
+        keep = np.ones_like(best, dtype=bool) if threshold is None else best > threshold
+        if 0 < topk < m:
+            top = np.argpartition(-best, topk - 1, axis=1)[:, :topk]
+            in_top = np.zeros_like(keep)
+            np.put_along_axis(in_top, top, True, axis=1)
+            keep &= in_top
+        keep &= np.isfinite(best)
+        r, c = np.nonzero(keep)
+        rows.append(r + start)
+        cols.append(c)
+        weights.append(best[r, c])
+        lags.append(best_lag[r, c])
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(weights), np.concatenate(lags)
+
+def edges_to_graph(m, rows, cols, weights, weighted=False, self_loops=True):
+    """Symmetric sparse [m, m] graph of the edges (an edge in either direction), 0/1 unless weighted."""
+    values = weights if weighted else np.ones(len(rows))
+    graph = sp.coo_matrix((values, (rows, cols)), shape=(m, m)).tocsr()
+    graph = graph.maximum(graph.T)
+    if self_loops:
+        graph = graph.tolil()
+        graph.setdiag(1.)
+    return graph.tocsr()
+
+def write_graph(graph, path, weighted=False, block=512):
+    """Comma delimited dense rows as ../data/adj/*.txt, written a block of rows at a time."""
+    fmt = '%.4f' if weighted else '%d'
+    with open(path, 'w') as f:
+        for start in range(0, graph.shape[0], block):
+            np.savetxt(f, graph[start:start + block].toarray(), fmt=fmt, delimiter=',')
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--dataset', type=str, default='ca48-548', help='../data/ts/<dataset>.txt')
+    ap.add_argument('--name', type=str, default='', help='written to ../data/adj/<name>.txt, default <dataset>-pcc')
+    ap.add_argument('--max_lag', type=int, default=7, help='largest lead of one series over the other, in days')
+    ap.add_argument('--topk', type=int, default=5, help='strongest correlations kept per location, 0 for no limit')
+    ap.add_argument('--threshold', type=float, default=None, help='keep only correlations above this')
+    ap.add_argument('--abs', action='store_true', default=False, help='rank by absolute correlation')
+    ap.add_argument('--weighted', action='store_true', default=False, help='write the correlations instead of 0/1')
+    ap.add_argument('--train', type=float, default=.7, help='leading fraction of the series used, as the train split of train.py')
+    ap.add_argument('--smoothf', type=str, default='movemean_7', help='movemean_7, movemedian_6 or none, as train.py')
+    ap.add_argument('--block', type=int, default=512, help='locations per block')
+    args = ap.parse_args()
+    if args.topk <= 0 and args.threshold is None:
+        raise LookupError('set --topk and/or --threshold, otherwise every pair is an edge')
+
+    ts = np.loadtxt(open("../data/ts/{}.txt".format(args.dataset)), delimiter=',')
+    if args.smoothf != 'none':
+        ts = eval(args.smoothf)(ts)
+    ts = ts[:int(args.train * ts.shape[0])]
+    n, m = ts.shape
+    rows, cols, weights, lags = lagged_correlation_edges(ts, args.max_lag, args.topk, args.threshold, args.block, args.abs)
+    graph = edges_to_graph(m, rows, cols, weights, args.weighted)
+    path = "../data/adj/{}.txt".format(args.name or args.dataset + '-pcc')
+    write_graph(graph, path, args.weighted, args.block)
+    degree = np.diff(graph.indptr) - 1
+    print('{} series x {} days: {} edges, degree mean {:.1f} min {} max {}, correlation mean {:.3f}'.format(
+        m, n, (graph.nnz - m) // 2, degree.mean(), degree.min(), degree.max(), weights.mean() if len(weights) else 0.))
+    print('lag of the kept edges:', {int(lag): int(count) for lag, count in zip(*np.unique(lags, return_counts=True))})
+    print('saved', path)
@@ -7,21 +7,28 @@ import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 
 from utils import movemedian_6, movemean_7
+from graph import load_graph
 
 class DataBasicLoader(object):
-    def __init__(self, args):
+    def __init__(self, args, rawdata=None, scale=None):
+        # rawdata: already smoothed series [n, m] instead of ../data/ts/<dataset>.txt
+        # scale: (min, max, peak_thold) of a trained model, keeps its normalization and skips the splits
         self.cuda = args.cuda
         self.P = args.window 
         self.h = args.horizon 
+        self.multi_horizon = args.multi_horizon # targets [n, h, m] for horizons 1..h
         self.d = 0 # not needed
         self.add_his_day = False
-        self.rawdat = np.loadtxt(open("../data/ts/{}.txt".format(args.dataset)), delimiter=',')
-        print('data shape', self.rawdat.shape)
-        
-        # Smooth data using args.smoothf
-        if args.smoothf != "none":
-            smoothf = eval(args.smoothf)
-            self.rawdat = smoothf(self.rawdat)
+        if rawdata is None:
+            self.rawdat = np.loadtxt(open("../data/ts/{}.txt".format(args.dataset)), delimiter=',')
+            print('data shape', self.rawdat.shape)
+            
+            # Smooth data using args.smoothf
+            if args.smoothf != "none":
+                smoothf = eval(args.smoothf)
+                self.rawdat = smoothf(self.rawdat)
+        else:
+            self.rawdat = rawdata
             
         if args.sim_mat:
             self.load_sim_mat(args)
@@ -43,27 +50,25 @@ class DataBasicLoader(object):
 
         self.scale = np.ones(self.m) # node needed
 
+        if scale is not None:
+            self.min, self.max, self.peak_thold = scale
+            self.dat = (self.rawdat - self.min ) / (self.max - self.min + 1e-12)
+            return
         self._pre_train(int(args.train * self.n), int((args.train + args.val) * self.n), self.n)
         self._split(int(args.train * self.n), int((args.train + args.val) * self.n), self.n)
         print('size of train/val/test sets',len(self.train[0]),len(self.val[0]),len(self.test[0]))
     
     def load_sim_mat(self, args):
-        self.adj = torch.Tensor(np.loadtxt(open("../data/adj/{}.txt".format(args.sim_mat)), delimiter=','))
-        self.orig_adj = self.adj
-        rowsum = 1. / torch.sqrt(self.adj.sum(dim=0)) # 1/sqrt(degree)
-        self.adj = rowsum[:, np.newaxis] * self.adj * rowsum[np.newaxis, :] # equation (4)
-        self.adj = Variable(self.adj) # not needed
+        self.orig_adj = load_graph('adj', args.sim_mat, 'raw', cache_dir=args.graph_cache)
+        self.adj = load_graph('adj', args.sim_mat, 'sym', cache_dir=args.graph_cache) # equation (4)
         if args.cuda:
             self.adj = self.adj.cuda()
             self.orig_adj = self.orig_adj.cuda()
             
     # Load SCI data
     def load_sci(self, args):
-        self.sci= torch.Tensor(np.loadtxt(open("../data/sci/{}.txt".format(args.sci)), delimiter=','))
-        self.orig_sci = self.sci
-        rowsum = 1. / torch.sqrt(self.sci.sum(dim=0)) # 1/sqrt(degree)
-        self.sci = rowsum[:, np.newaxis] * self.sci * rowsum[np.newaxis, :]
-        self.sci = Variable(self.sci) # not needed
+        self.orig_sci = load_graph('sci', args.sci, 'raw', cache_dir=args.graph_cache)
+        self.sci = load_graph('sci', args.sci, 'sym', cache_dir=args.graph_cache)
         if args.cuda:
             self.sci = self.sci.cuda()
             self.orig_sci = self.orig_sci.cuda()
@@ -88,7 +93,8 @@ class DataBasicLoader(object):
         self.valid_set = valid_set = range(train, valid)
         self.test_set = test_set = range(valid, self.n)
         self.tmp_train = self._batchify(train_set, self.h, useraw=True)
-        train_mx = torch.cat((self.tmp_train[0][0], self.tmp_train[1]), 0).numpy() #199, 47
+        train_y = self.tmp_train[1][:, -1, :] if self.multi_horizon else self.tmp_train[1] # same scale as the single horizon model
+        train_mx = torch.cat((self.tmp_train[0][0], train_y), 0).numpy() #199, 47
         self.max = np.max(train_mx, 0)
         self.min = np.min(train_mx, 0) 
         self.peak_thold = np.mean(train_mx, 0)
@@ -105,7 +111,10 @@ class DataBasicLoader(object):
     def _batchify(self, idx_set, horizon, useraw=False): ###tonights work
 
         n = len(idx_set)
-        Y = torch.zeros((n, self.m))
+        if self.multi_horizon:
+            Y = torch.zeros((n, horizon, self.m))
+        else:
+            Y = torch.zeros((n, self.m))
         if self.add_his_day and not useraw:
             X = torch.zeros((n, self.P+1, self.m))
         else:
@@ -117,7 +126,10 @@ class DataBasicLoader(object):
 
             if useraw: # for normalization
                 X[i,:self.P,:] = torch.from_numpy(self.rawdat[start:end, :])
-                Y[i,:] = torch.from_numpy(self.rawdat[idx_set[i], :])
+                if self.multi_horizon:
+                    Y[i,:horizon,:] = torch.from_numpy(self.rawdat[end:idx_set[i]+1, :])
+                else:
+                    Y[i,:] = torch.from_numpy(self.rawdat[idx_set[i], :])
             else:
                 his_window = self.dat[start:end, :]
                 if self.add_his_day:
@@ -131,7 +143,10 @@ class DataBasicLoader(object):
                     X[i,:self.P+1,:] = torch.from_numpy(his_window) # size (window+1, m)
                 else:
                     X[i,:self.P,:] = torch.from_numpy(his_window) # size (window, m)
-                Y[i,:] = torch.from_numpy(self.dat[idx_set[i], :])
+                if self.multi_horizon:
+                    Y[i,:horizon,:] = torch.from_numpy(self.dat[end:idx_set[i]+1, :]) # size (horizon, m)
+                else:
+                    Y[i,:] = torch.from_numpy(self.dat[idx_set[i], :])
         return [X, Y]
 
     # original
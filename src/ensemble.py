@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Seed ensemble: the same configuration trained with several seeds at once. The dataset is loaded once and
+# forked worker processes share it read-only, each trains one seed exactly as train.py --seed <seed> would
+# (same initialization and batch order, early stopping on the validation loss) and returns its test forecast.
+# Reports every member, the ensemble mean forecast and its spread over the seeds.
+#
+#   python ensemble.py --dataset ca48-548 --model colagnn --seeds 42 43 44 45 --workers 4
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, time, random, copy
+import multiprocessing as mp
+import numpy as np
+import torch
+
+from data import DataBasicLoader
+from models import get_model, NO_TRAIN_MODELS
+from options import get_parser, get_log_token
+from utils import evaluation_metrics, quantile_levels
+from export import predict
+from training import fit
+from results import ResultStore
+
+_data = None # set before the workers fork, shared copy-on-write
+
+def train_member(task):
+    """Train one seed, returns its checkpoint path, best epoch, validation loss, seconds and test forecast."""
+    args, seed, threads = task
+    torch.set_num_threads(threads)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    data = _data
+    model = get_model(args, data)
+    start = time.time()
+    _, best_epoch, best_val = fit(model, data, data.train, data.val, args.epochs, args.patience, args)
+    seconds = time.time() - start
+    model.eval()
+    path = '%s/%s.seed-%d.pt' % (args.save_dir, get_log_token(args), seed)
+    with open(path, 'wb') as f:
+        torch.save(model.state_dict(), f)
+    _, y_pred = predict(model, data, data.test, args.batch)
+    return {'seed': seed, 'path': path, 'best_epoch': best_epoch, 'val_loss': best_val, 'seconds': seconds, 'y_pred': y_pred}
+
+def metrics_line(y_true, y_pred, peak_thold):
+    mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluation_metrics(y_true, y_pred, peak_thold)
+    return mae, 'MAE {:5.4f} RMSE {:5.4f} PCC {:5.4f} R2 {:5.4f} Peak {:5.4f}'.format(mae, rmse, pcc, r2, peak_mae)
+
+if __name__ == '__main__':
+    ap = get_parser()
+    ap.add_argument('--seeds', type=int, nargs='+', default=[42, 43, 44, 45, 46], help='one ensemble member per seed')
+    ap.add_argument('--workers', type=int, default=0, help='members trained at once, default min(seeds, cores)')
+    ap.add_argument('--threads', type=int, default=0, help='torch threads per worker, default cores / workers')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, ensemble.py uses point forecasts')
+    args.cuda = False # forked workers, cpu only
+    if args.model in NO_TRAIN_MODELS:
+        raise LookupError('{} has nothing to train'.format(args.model))
+    print(args)
+    if not os.path.exists(args.save_dir):
+        os.makedirs(args.save_dir)
+
+    start = time.time()
+    _data = DataBasicLoader(args)
+    workers = args.workers or min(len(args.seeds), os.cpu_count() or 1)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    tasks = [(args, seed, threads) for seed in args.seeds]
+    if workers > 1:
+        with mp.get_context('fork').Pool(workers) as pool:
+            members = pool.map(train_member, tasks, chunksize=1)
+    else:
+        members = [train_member(task) for task in tasks]
+    seconds = time.time() - start
+    print('trained {} seeds with {} workers x {} threads in {:.1f}s'.format(len(members), workers, threads, seconds))
+
+    y_true = _data.test[1].numpy() * (_data.max - _data.min) * 1.0 + _data.min
+    m = _data.m
+    preds = np.stack([r['y_pred'] for r in members]) # [seeds, n_samples, (horizons,) m]
+    member_mae = []
+    for r in members:
+        mae, line = metrics_line(y_true.reshape(-1, m), r['y_pred'].reshape(-1, m), _data.peak_thold)
+        member_mae.append(mae)
+        print('seed {:4d} epoch {:4d} val {:.8f} {:6.1f}s | TEST {}'.format(r['seed'], r['best_epoch'], r['val_loss'], r['seconds'], line))
+    mean, std = preds.mean(0), preds.std(0)
+    print('members    TEST MAE {:5.4f} +- {:5.4f}'.format(np.mean(member_mae), np.std(member_mae)))
+    _, line = metrics_line(y_true.reshape(-1, m), mean.reshape(-1, m), _data.peak_thold)
+    print('ensemble   TEST {}'.format(line))
+    print('spread     std over seeds {:5.4f} (mean), {:5.4f} relative to the mean forecast'.format(std.mean(), std.mean() / max(np.abs(mean).mean(), 1e-12)))
+
+    log_token = get_log_token(args)
+    path = 'result/%s.ensemble.npz' % log_token
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    np.savez(path, seeds=np.array(args.seeds), y_true=y_true, members=preds, mean=mean, std=std)
+    print('saved', path)
+    if args.results_db:
+        if args.multi_horizon:
+            predictions = {k+1: (y_true[:, k], mean[:, k]) for k in range(args.horizon)}
+        else:
+            predictions = {args.horizon: (y_true, mean)}
+        metrics = dict(zip(['mae', 'std_mae', 'rmse', 'rmse_states', 'pcc', 'pcc_states', 'r2', 'r2_states', 'var', 'var_states', 'peak_mae'],
+                           map(float, evaluation_metrics(y_true.reshape(-1, m), mean.reshape(-1, m), _data.peak_thold))))
+        metrics['member_mae_std'] = float(np.std(member_mae))
+        run_args = copy.copy(args)
+        run_args.model = args.model + '_ensemble'
+        run_id = ResultStore(args.results_db).add_run(run_args, metrics, {'seconds': seconds, 'workers': workers}, log_token + '.ensemble', predictions=predictions)
+        print('saved run {} to {}'.format(run_id, args.results_db))
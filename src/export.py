@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Export a trained save/<log_token>.pt as a self-contained inference module (TorchScript, torch.export
+# or ONNX) that can be served with infer.py without the training code.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, json
+import torch
+import torch.nn as nn
+
+from models import get_model, NO_TRAIN_MODELS
+from data import DataBasicLoader
+from options import get_parser, get_log_token
+from utils import quantile_levels
+from infer import load_inference_module
+
+class InferenceModel(nn.Module):
+    """Forecasting model with the loader normalization folded in.
+
+    Takes smoothed case counts [b, window, m] (as in DataBasicLoader.rawdat) and returns
+    the forecast for the horizon in case counts [b, m], also for b == 1
+    ([b, horizon, m] for horizons 1..horizon with --multi_horizon).
+    """
+    def __init__(self, model, data):
+        super().__init__()
+        self.model = model
+        self.multi_horizon = data.multi_horizon
+        self.register_buffer('min', torch.Tensor(data.min))
+        self.register_buffer('max', torch.Tensor(data.max))
+
+    def forward(self, x):
+        scale = self.max - self.min
+        x = (x - self.min) / (scale + 1e-12)
+        out, _ = self.model(x)
+        out = out.reshape(x.size(0), -1, self.min.size(0))
+        if not self.multi_horizon:
+            out = out.squeeze(1)
+        return out * scale + self.min
+
+def load_model(args, data, model_path=None):
+    """Build args.model and load its trained weights (models without parameters are returned as is)."""
+    model = get_model(args, data)
+    if args.model not in NO_TRAIN_MODELS:
+        if model_path is None:
+            model_path = '%s/%s.pt' % (args.save_dir, get_log_token(args))
+        with open(model_path, 'rb') as f:
+            model.load_state_dict(torch.load(f, map_location='cpu'))
+    return model.eval()
+
+def predict(model, data_loader, data, batch_size):
+    """Run model over a split, returns denormalized (y_true_states, y_pred_states) as in train.evaluate."""
+    y_true_mx, y_pred_mx = [], []
+    with torch.no_grad():
+        for X, Y in data_loader.get_batches(data, batch_size, False):
+            output, _ = model(X)
+            y_true_mx.append(Y.data.cpu())
+            y_pred_mx.append(output.data.cpu().view(Y.size()))
+    y_true_states = torch.cat(y_true_mx).numpy() * (data_loader.max - data_loader.min ) * 1.0 + data_loader.min
+    y_pred_states = torch.cat(y_pred_mx).numpy() * (data_loader.max - data_loader.min ) * 1.0 + data_loader.min
+    return y_true_states, y_pred_states
+
+def get_meta(args, data):
+    return {
+        'model': args.model,
+        'dataset': args.dataset,
+        'window': args.window,
+        'horizon': args.horizon,
+        'multi_horizon': args.multi_horizon,
+        'rnn_model': args.rnn_model,
+        'smoothf': args.smoothf,
+        'm': data.m,
+        'log_token': get_log_token(args),
+    }
+
+EXTENSIONS = {'trace': 'ts', 'export': 'pt2', 'onnx': 'onnx'}
+
+def export_module(module, example, path, meta, method='trace'):
+    """Save module as TorchScript (method='trace', *.ts), as an ExportedProgram (method='export', *.pt2)
+    or as ONNX with a dynamic batch dimension (method='onnx', *.onnx)."""
+    module = module.eval()
+    extra_files = {'meta.json': json.dumps(meta)}
+    with torch.no_grad():
+        if method == 'trace':
+            scripted = torch.jit.freeze(torch.jit.trace(module, example))
+            torch.jit.save(scripted, path, _extra_files=extra_files)
+        elif method == 'export':
+            batch = torch.export.Dim('batch')
+            dynamic_shapes = tuple({0: batch} for _ in example)
+            program = torch.export.export(module, example, dynamic_shapes=dynamic_shapes)
+            torch.export.save(program, path, extra_files=extra_files)
+        elif method == 'onnx':
+            import onnx
+            torch.onnx.export(module, example, path, input_names=['x'], output_names=['y'],
+                              dynamic_axes={'x': {0: 'batch'}, 'y': {0: 'batch'}})
+            proto = onnx.load(path)
+            onnx.helper.set_model_props(proto, extra_files)
+            onnx.save(proto, path)
+        else:
+            raise LookupError('only support trace, export and onnx')
+    return path
+
+def check_parity(module, exported, data, rtol=1e-4, inputs=None):
+    """Compare the exported module with the eager one on the test split windows, in case counts.
+
+    inputs replaces the (X,) of the test windows for modules with other arguments (stan/export.py),
+    the first output is compared for modules returning a tuple.
+    """
+    if inputs is None:
+        inputs = (data._batchify(data.test_set, data.h, useraw=True)[0],)
+    X = inputs[0]
+    with torch.no_grad():
+        y = module(*inputs)
+        y_exp = exported(*inputs)
+    if isinstance(y, tuple):
+        y, y_exp = y[0], y_exp[0]
+    max_diff = (y - y_exp).abs().max().item()
+    max_rel = max_diff / max(y.abs().max().item(), 1e-12)
+    print('parity on {} test windows: max abs diff {:.3e} max rel diff {:.3e}'.format(X.size(0), max_diff, max_rel))
+    if max_rel > rtol:
+        raise ValueError('exported module does not match the pytorch model (rel diff {:.3e} > {:.0e})'.format(max_rel, rtol))
+    return max_diff
+
+if __name__ == '__main__':
+    ap = get_parser()
+    ap.add_argument('--method', type=str, default='trace', choices=['trace', 'export', 'onnx'], help='TorchScript trace (*.ts), torch.export (*.pt2) or ONNX (*.onnx)')
+    ap.add_argument('--rtol', type=float, default=1e-4, help='max relative difference allowed on the test split')
+    ap.add_argument('--export_dir', type=str, default='export', help='dir path to save the inference module')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, export.py uses point forecasts')
+    args.cuda = False # export on cpu, the module can be moved with map_location when loading
+
+    data_loader = DataBasicLoader(args)
+    model = load_model(args, data_loader)
+    module = InferenceModel(model, data_loader)
+
+    if not os.path.exists(args.export_dir):
+        os.makedirs(args.export_dir)
+    path = '%s/%s.%s' % (args.export_dir, get_log_token(args), EXTENSIONS[args.method])
+    example = (torch.Tensor(data_loader.rawdat[:2 * args.window]).view(2, args.window, data_loader.m),)
+    export_module(module, example, path, get_meta(args, data_loader), args.method)
+    print('exported', path)
+
+    exported, _ = load_inference_module(path)
+    check_parity(module, exported, data_loader, args.rtol)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# LRU/TTL cache of served forecasts, keyed by
+#   (checkpoint hashes, dataset, dataset version, origin, horizon, FIPS in the requested order).
+# serve.py invalidates the entries of a dataset when days are appended and the entries of a checkpoint
+# when a new one is promoted (/reload).
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import time, hashlib, threading, collections
+
+def file_hash(path):
+    """Short sha1 of a checkpoint or exported module file."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+def make_key(checkpoints, dataset, version, origin, horizon, fips):
+    return (tuple(checkpoints), dataset, version, origin, horizon, tuple(fips) if fips else None)
+
+class ForecastCache(object):
+    """Thread safe LRU of at most max_size entries, each expiring ttl seconds after it was stored (ttl 0: never)."""
+    def __init__(self, max_size=4096, ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict() # key -> (stored time, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, dataset=None, checkpoint=None):
+        """Drop the entries of a dataset and/or computed with a checkpoint hash, returns how many."""
+        with self.lock:
+            stale = [k for k in self.entries if (dataset is not None and k[1] == dataset) or (checkpoint is not None and checkpoint in k[0])]
+            for k in stale:
+                del self.entries[k]
+            return len(stale)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / total if total else None}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Normalized graph matrices, computed once per source file and cached to disk.
+#
+#   load_graph('adj', 'ca48-adj', 'sym')                    D^-1/2 A D^-1/2 of ../data/adj/ca48-adj.txt
+#   load_graph('sci', 'ca48-sci', 'row', layout='csr')      D^-1 S of ../data/sci/ca48-sci.txt as a sparse CSR tensor
+#   load_graph('adj', 'ca48-adj', 'sym', weight='ca48-sci')  adjacency weighted by SCI, then normalized
+#
+# The cache file name holds a hash of the source (and weight) file path, size and mtime, so an edited
+# graph file is normalized again.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, hashlib
+import numpy as np
+import torch
+
+VARIANTS = ['raw', 'sym', 'row', 'sym_loop', 'row_loop', 'threshold']
+LAYOUTS = ['dense', 'coo', 'csr']
+
+# in process cache, every model of a run gets the same tensor without reading the disk again
+_graphs = {}
+
+def graph_path(source, name):
+    return "../data/{}/{}.txt".format(source, name)
+
+def normalize_graph(adj, variant='sym', threshold=0.):
+    """Normalize a dense numpy graph [m, m].
+
+    sym: D^-1/2 A D^-1/2 with the row degrees, as normalize_adj2 (nodes without edges get 0)
+    row: D^-1 A
+    sym_loop, row_loop: the same on A + I
+    threshold: sym on the entries of A above threshold
+    """
+    if variant not in VARIANTS:
+        raise LookupError('only support graph variants {}'.format(VARIANTS))
+    adj = np.asarray(adj, dtype=np.float64)
+    if variant == 'raw':
+        return adj
+    if variant.endswith('_loop'):
+        adj = adj + np.eye(adj.shape[0])
+    if variant == 'threshold':
+        adj = adj * (adj > threshold)
+    deg = adj.sum(1)
+    with np.errstate(divide='ignore'):
+        d = np.power(deg, -1.) if variant.startswith('row') else np.power(deg, -0.5)
+    d[np.isinf(d)] = 0.
+    if variant.startswith('row'):
+        return d[:, None] * adj
+    return d[:, None] * adj.T * d[None, :]
+
+def to_layout(mx, layout='dense'):
+    """float32 torch tensor of a dense numpy matrix in the dense, coo or csr layout."""
+    if layout not in LAYOUTS:
+        raise LookupError('only support graph layouts {}'.format(LAYOUTS))
+    mx = torch.tensor(mx, dtype=torch.float32) # a copy, the cached matrix is shared by every call
+    if layout == 'coo':
+        return mx.to_sparse().coalesce()
+    if layout == 'csr':
+        return mx.to_sparse_csr()
+    return mx
+
+def cache_key(paths, variant, threshold):
+    h = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        h.update(('%s:%d:%d;' % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)).encode())
+    h.update(('%s:%r' % (variant, threshold)).encode())
+    return h.hexdigest()[:12]
+
+def load_graph(source, name, variant='sym', layout='dense', threshold=0., weight='', cache_dir='cache/graph'):
+    """Normalized graph of ../data/<source>/<name>.txt (source adj or sci) as a float32 tensor.
+
+    weight: name of a ../data/sci matrix multiplied elementwise with the graph before the normalization.
+    cache_dir: where the normalized matrices are kept as .npy, '' to disable the disk cache.
+    """
+    paths = [graph_path(source, name)] + ([graph_path('sci', weight)] if weight else [])
+    key = cache_key(paths, variant, threshold)
+    if key not in _graphs:
+        cache_file = '%s/%s%s.%s.%s.npy' % (cache_dir, name, '.' + weight if weight else '', variant, key)
+        if cache_dir and os.path.exists(cache_file):
+            mx = np.load(cache_file)
+        else:
+            adj = np.loadtxt(open(paths[0]), delimiter=',', ndmin=2)
+            if weight:
+                adj = adj * np.loadtxt(open(paths[1]), delimiter=',', ndmin=2)
+            mx = normalize_graph(adj, variant, threshold).astype(np.float32)
+            if cache_dir:
+                if not os.path.exists(cache_dir):
+                    os.makedirs(cache_dir)
+                np.save(cache_file, mx)
+        _graphs[key] = mx
+    return to_layout(_graphs[key], layout)
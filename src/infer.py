@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Run a module exported by export.py. Only needs torch and numpy (and onnxruntime for *.onnx),
+# not the models or the training code.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import argparse, json
+import numpy as np
+import torch
+
+from utils import movemedian_6, movemean_7
+
+class OrtModule(object):
+    """ONNX Runtime CPU session called like the torch modules: [b, window, m] tensor in, [b, m] tensor out."""
+    def __init__(self, path, threads=0):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.meta = self.session.get_modelmeta().custom_metadata_map
+
+    def __call__(self, x):
+        out = self.session.run(None, {self.input_name: x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(out)
+
+def load_inference_module(path, device='cpu', threads=0):
+    """Load an exported module (*.ts TorchScript, *.pt2 torch.export or *.onnx) and its metadata."""
+    extra_files = {'meta.json': ''}
+    if path.endswith('.onnx'):
+        module = OrtModule(path, threads)
+        extra_files['meta.json'] = module.meta['meta.json']
+    elif path.endswith('.pt2'):
+        module = torch.export.load(path, extra_files=extra_files).module().to(device)
+    else:
+        module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    return module, json.loads(extra_files['meta.json'])
+
+def forecast(module, series, window):
+    """Forecast from the last `window` days of smoothed series [n, m], returns [m] case counts ([horizon, m] for multi horizon modules)."""
+    x = torch.Tensor(np.asarray(series[-window:], dtype=np.float32)).unsqueeze(0)
+    with torch.no_grad():
+        return module(x)[0].cpu().numpy()
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--path', type=str, required=True, help='exported module (export/<log_token>.ts, .pt2 or .onnx)')
+    ap.add_argument('--threads', type=int, default=0, help='onnxruntime intra-op threads, 0 lets onnxruntime decide')
+    ap.add_argument('--dataset', type=str, default='', help='time series to forecast from, default the training dataset')
+    ap.add_argument('--out', type=str, default='', help='optional csv to write the forecast to')
+    args = ap.parse_args()
+
+    module, meta = load_inference_module(args.path, threads=args.threads)
+    dataset = args.dataset or meta['dataset']
+    rawdat = np.loadtxt(open("../data/ts/{}.txt".format(dataset)), delimiter=',')
+    if meta['smoothf'] != "none":
+        rawdat = eval(meta['smoothf'])(rawdat)
+    pred = forecast(module, rawdat, meta['window'])
+    horizon = '1-{}'.format(meta['horizon']) if meta.get('multi_horizon') else meta['horizon']
+    print('{} day ahead forecast ({})'.format(horizon, meta['log_token']))
+    print(np.array2string(pred, precision=2))
+    if args.out:
+        np.savetxt(args.out, pred.reshape(1, -1), fmt='%.4f', delimiter=',')
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Memory accounting of the training loop and a preflight check of the peak memory of a training step.
+#
+# MemoryMonitor records the peak memory of every training step above the memory resident when it starts
+# (sampled RSS on cpu, allocator stats on cuda) and the memory each top level sub-block of the model (rnn, convs, graph convs, output) adds in its
+# forward; what the forward adds outside them is the attention ([b, m, m] and [b, m, m, n_hidden/2]).
+#
+# preflight() measures one training step the same way at two small batch sizes, extrapolates linearly to
+# --batch, adds the weights and optimizer state and refuses (MemoryError) or, with --mem_auto_batch, lowers --batch when the estimate is above the limit.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, resource, collections
+import multiprocessing as mp
+import torch
+
+from models import get_model
+
+def rss_mb():
+    """Current resident memory of the process."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10 # kB on linux
+
+def available_mb(cuda=False):
+    """Memory a training step may use: free device memory on cuda, MemAvailable otherwise."""
+    if cuda:
+        free, _ = torch.cuda.mem_get_info()
+        return free / 2 ** 20
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable'):
+                return int(line.split()[1]) / 2 ** 10
+    raise OSError('can not read the available memory')
+
+class MemoryMonitor(object):
+    """Peak memory per training step and memory added by each sub-block of the forward, in MB.
+
+    The peak of a step is measured above the memory resident when it starts (weights, optimizer state, data):
+    allocator peak on cuda, on cpu the largest RSS sampled at the start, around every sub-block in the forward,
+    when their gradients are computed in the backward and at the end of the step.
+    """
+    def __init__(self, model, enabled=True, cuda=False):
+        self.enabled = enabled
+        self.cuda = cuda
+        self.steps = []
+        self.resident = 0.
+        self.blocks = collections.defaultdict(float) # largest growth seen per sub-block
+        self._start = {}
+        self._peak = None # set during a step
+        if enabled:
+            for name, module in list(model.named_children()) + [('forward', model)]:
+                module.register_forward_pre_hook(self._pre_hook(name))
+                module.register_forward_hook(self._hook(name))
+
+    def current(self):
+        return torch.cuda.memory_allocated() / 2 ** 20 if self.cuda else rss_mb()
+
+    def _sample(self, *args):
+        if self._peak is not None:
+            self._peak = max(self._peak, self.current())
+
+    def _pre_hook(self, name):
+        def hook(module, inputs):
+            self._start[name] = self.current()
+            self._sample()
+        return hook
+
+    def _hook(self, name):
+        def hook(module, inputs, output):
+            self.blocks[name] = max(self.blocks[name], self.current() - self._start.pop(name, self.current()))
+            self._sample()
+            if self._peak is not None and not self.cuda:
+                for t in output if isinstance(output, tuple) else (output,):
+                    if torch.is_tensor(t) and t.requires_grad:
+                        t.register_hook(self._sample) # samples the backward
+        return hook
+
+    def start_step(self):
+        if self.enabled:
+            if self.cuda:
+                torch.cuda.reset_peak_memory_stats()
+            self.resident = self.current()
+            self._peak = self.resident
+
+    def end_step(self):
+        if self.enabled:
+            self._sample()
+            peak = torch.cuda.max_memory_allocated() / 2 ** 20 if self.cuda else self._peak
+            self.steps.append(peak - self.resident)
+            self._peak = None
+
+    def log(self):
+        """Peak of the steps since the last log and the sub-block growths, resets both."""
+        blocks = ' '.join('{} +{:.1f}'.format(k, v) for k, v in self.blocks.items())
+        line = 'mem peak step +{:.1f}MB over {:.1f}MB resident ({} steps) | forward blocks MB: {}'.format(
+            max(self.steps) if self.steps else 0., self.resident, len(self.steps), blocks)
+        self.steps = []
+        self.blocks.clear()
+        return line
+
+def _train_step(model, optimizer, X):
+    optimizer.zero_grad()
+    output, _ = model(X)
+    output.abs().mean().backward() # any loss, the memory does not depend on it
+    optimizer.step()
+
+def _measure_step(args, data, batch_size):
+    """Peak memory (MB) of a training step on batch_size windows as MemoryMonitor reports it, after a warm-up step
+    that loads the kernels, and the weights and Adam moments resident during the training. Run in a forked child."""
+    model = get_model(args, data)
+    X = data.train[0][:batch_size]
+    if args.cuda:
+        model.cuda()
+        X = X.cuda()
+    optimizer = torch.optim.Adam([p for p in model.parameters() if p.requires_grad], lr=args.lr)
+    _train_step(model, optimizer, X)
+    monitor = MemoryMonitor(model, True, args.cuda)
+    monitor.start_step()
+    _train_step(model, optimizer, X)
+    monitor.end_step()
+    state = 3 * sum(p.numel() * p.element_size() for p in model.parameters() if p.requires_grad) / 2 ** 20
+    return monitor.steps[0], state
+
+def estimate_step_mb(args, data, batch_size, probes=(8, 32)):
+    """Linear estimate of the peak memory of a training step above the resident memory (as MemoryMonitor
+    reports it): a fixed part (gradients, workspaces) plus a part per window, from steps at the probe batch sizes.
+    Also returns the weights and optimizer state resident besides."""
+    if args.cuda:
+        measured = [_measure_step(args, data, b) for b in probes]
+    else:
+        ctx = mp.get_context('fork')
+        measured = []
+        for b in probes:
+            with ctx.Pool(1) as pool: # fresh process per probe, keeps the parent clean
+                measured.append(pool.apply(_measure_step, (args, data, b)))
+    (small, state), (large, _) = measured
+    per_window = max(0., (large - small) / (probes[1] - probes[0]))
+    fixed = max(0., small - per_window * probes[0])
+    return fixed + per_window * batch_size, fixed, per_window, state
+
+def preflight(args, data):
+    """Check that a training step at args.batch fits in --mem_limit_gb (default the available memory).
+    The step estimate is the "mem peak step" of --mem_profile, the check adds the weights and optimizer state.
+    Lowers args.batch with --mem_auto_batch, raises MemoryError otherwise. Returns the step estimate in MB."""
+    small = max(1, min(args.batch, 32, data.train[0].size(0)) // 4)
+    probes = (small, 4 * small)
+    step, fixed, per_window, state = estimate_step_mb(args, data, args.batch, probes)
+    estimate = state + step
+    limit = args.mem_limit_gb * 2 ** 10 if args.mem_limit_gb > 0 else available_mb(args.cuda)
+    print('preflight: step at batch {} peaks ~+{:.1f}MB ({:.1f}MB fixed + {:.2f}MB per window) over {:.1f}MB weights and optimizer state, limit {:.1f}MB'.format(
+        args.batch, step, fixed, per_window, state, limit))
+    if estimate <= limit:
+        return step
+    fit = int((limit - state - fixed) / per_window) if per_window > 0 else 0
+    if not args.mem_auto_batch or fit < 1:
+        raise MemoryError('a training step at batch {} needs ~{:.1f}MB, above the {:.1f}MB limit (largest batch that fits: {})'.format(
+            args.batch, estimate, limit, max(fit, 0)))
+    print('preflight: --batch {} -> {}'.format(args.batch, fit))
+    args.batch = fit
+    return fixed + per_window * fit
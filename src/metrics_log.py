@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Buffered per-epoch metrics log. Scalars are kept in memory and a background thread appends them in
+# batches to a single <run_dir>/metrics.csv (or .jsonl), one row per step and one column per scalar, and
+# optionally to one tensorboard event file.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, csv, json, time, threading
+
+FORMATS = ['csv', 'jsonl']
+
+class MetricsLogger(object):
+    """log(step, {name: value}) is a list append; rows reach the disk every flush_secs, when max_rows are
+    buffered and on close(). The csv columns are the scalars of the first flushed row."""
+    def __init__(self, run_dir, fmt='csv', tensorboard=False, flush_secs=10, max_rows=100):
+        if fmt not in FORMATS:
+            raise LookupError('unknown metrics log format {}, one of {}'.format(fmt, FORMATS))
+        if not os.path.exists(run_dir):
+            os.makedirs(run_dir)
+        self.run_dir = run_dir
+        self.fmt = fmt
+        self.path = os.path.join(run_dir, 'metrics.' + fmt)
+        self.flush_secs = flush_secs
+        self.max_rows = max_rows
+        self.columns = None
+        self.writer = None
+        if tensorboard:
+            from tensorboardX import SummaryWriter
+            self.writer = SummaryWriter(run_dir)
+        self._rows = []
+        self._lock = threading.Lock() # buffer swap
+        self._io_lock = threading.Lock() # file writes of the thread and close()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def log(self, step, scalars):
+        row = {'step': step, 'time': time.time()}
+        row.update((k, float(v)) for k, v in scalars.items())
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_rows
+        if full:
+            self._wake.set()
+
+    def _loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_secs)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return
+        with self._io_lock:
+            with open(self.path, 'a') as f:
+                if self.fmt == 'jsonl':
+                    f.write(''.join(json.dumps(row) + '\n' for row in rows))
+                else:
+                    new = self.columns is None
+                    if new:
+                        self.columns = list(rows[0])
+                    out = csv.DictWriter(f, self.columns, extrasaction='ignore')
+                    if new:
+                        out.writeheader()
+                    out.writerows(rows)
+            if self.writer is not None:
+                for row in rows:
+                    for k, v in row.items():
+                        if k not in ('step', 'time'):
+                            self.writer.add_scalar(k, v, row['step'], walltime=row['time'])
+                self.writer.flush()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
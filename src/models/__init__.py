@@ -0,0 +1,24 @@
+from .colagnn import ColaGNN
+from .colagnn_mod import ColaGNN_NoAttn, ColaGNN_Thresholding, ColaGNN_NoAttn_SCI, ColaGNN_IdentityADJ
+from .dummy import Dummy
+from .arma import ARMA
+from .linear import Linear
+
+MODELS = {
+    'colagnn': ColaGNN,
+    'arma': ARMA,
+    'dummy': Dummy,
+    'linear': Linear,
+    'colagnn_noattn': ColaGNN_NoAttn,
+    'colagnn_thresholding': ColaGNN_Thresholding,
+    'colagnn_noattn_sci': ColaGNN_NoAttn_SCI,
+    'colagnn_identityadj': ColaGNN_IdentityADJ,
+}
+
+# Models without trainable parameters, evaluated directly
+NO_TRAIN_MODELS = ('dummy', 'linear')
+
+def get_model(args, data):
+    if args.model not in MODELS:
+        raise LookupError('can not find the model')
+    return MODELS[args.model](args, data)
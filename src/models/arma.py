@@ -1,16 +1,24 @@
 import torch
 import torch.nn as nn
 from torch.nn import Parameter
+from utils import quantile_levels
 
 class ARMA(nn.Module): 
     def __init__(self, args, data):
         super(ARMA, self).__init__()
+        if args.multi_horizon:
+            raise LookupError('ARMA only supports a single horizon')
         self.m = data.m
         self.w = args.window
         self.n = 2 # larger worse
         self.w = 2*self.w - self.n + 1 
-        self.weight = Parameter(torch.Tensor(self.w, self.m)) # 20 * 49
-        self.bias = Parameter(torch.zeros(self.m)) # 49
+        self.n_quantiles = len(quantile_levels(args))
+        if self.n_quantiles: # one set of weights per quantile
+            self.weight = Parameter(torch.Tensor(self.w, self.n_quantiles, self.m))
+            self.bias = Parameter(torch.zeros(self.n_quantiles, self.m))
+        else:
+            self.weight = Parameter(torch.Tensor(self.w, self.m)) # 20 * 49
+            self.bias = Parameter(torch.zeros(self.m)) # 49
         nn.init.xavier_normal(self.weight)
 
         args.output_fun = None;
@@ -29,7 +37,11 @@ class ARMA(nn.Module):
         x = cumsum[:,:,n - 1:] / n
         x = x.permute(0,2,1).contiguous()
         x = torch.cat((x_o,x), dim=1)
-        x = torch.sum(x * self.weight, dim=1) + self.bias
+        if self.n_quantiles:
+            x = torch.sum(x.unsqueeze(2) * self.weight, dim=1) + self.bias # [b, q, m]
+            x = torch.sort(x, dim=1)[0]
+        else:
+            x = torch.sum(x * self.weight, dim=1) + self.bias
         if (self.output != None):
             x = self.output(x)
         return x, None
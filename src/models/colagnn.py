@@ -20,12 +20,15 @@ class ColaGNN(nn.Module):
         self.d = data.d 
         self.w = args.window
         self.h = args.horizon
-        self.adj = data.adj
         self.o_adj = data.orig_adj
-        if args.cuda:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense().cuda()
+        adj = data.adj # symmetric normalized, computed once by graph.load_graph
+        self.register_buffer('adj', adj, persistent=False) # moved by .cuda() and kept by export, not in state_dict
+        self.attn_topk = args.attn_topk # > 0: sparse top-k attention and graph convs
+        self.attn_chunk = args.attn_chunk
+        if self.attn_topk > 0 and args.attn_candidates == 'adj':
+            self.register_buffer('attn_candidates', neighbor_candidates(adj), persistent=False)
         else:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense()
+            self.attn_candidates = None
         self.dropout = args.dropout
         self.n_hidden = args.n_hidden
         half_hid = int(self.n_hidden/2)
@@ -56,7 +59,10 @@ class ColaGNN(nn.Module):
             raise LookupError (' only support LSTM, GRU and RNN')
 
         hidden_size = (int(args.bi) + 1) * self.n_hidden
-        self.out = nn.Linear(hidden_size + self.n_spatial, 1)  
+        self.multi_horizon = args.multi_horizon
+        self.n_quantiles = len(quantile_levels(args))
+        self.n_out = (self.h if self.multi_horizon else 1) * max(1, self.n_quantiles) # all horizons 1..h and quantiles from one forward
+        self.out = nn.Linear(hidden_size + self.n_spatial, self.n_out)  
 
         self.residual_window = 0
         self.ratio = 1.0
@@ -84,28 +90,17 @@ class ColaGNN(nn.Module):
         x = x.permute(0, 2, 1).contiguous().view(-1, x.size(1), 1) 
         r_out, hc = self.rnn(x, None)
         last_hid = r_out[:,-1,:]
-        last_hid = last_hid.view(-1,self.m, self.n_hidden)
+        last_hid = last_hid.view(-1,m, self.n_hidden)
         out_temporal = last_hid  # [b, m, 20]
-        hid_rpt_m = last_hid.repeat(1,self.m,1).view(b,self.m,self.m,self.n_hidden) # b,m,m,w continuous m
-        hid_rpt_w = last_hid.repeat(1,1,self.m).view(b,self.m,self.m,self.n_hidden) # b,m,m,w continuous w one window data
-        a_mx = self.act( hid_rpt_m @ self.W1.t()  + hid_rpt_w @ self.W2.t() + self.b1 ) @ self.V + self.bv # row, all states influence one state 
+        if self.attn_topk > 0:
+            out_spatial = self.sparse_spatial(orig_x, last_hid)
+            return self.output(orig_x, out_spatial, out_temporal)
+        hid_m = (last_hid @ self.W1.t()).unsqueeze(1) # b,1,m,half_hid continuous m (broadcast over rows)
+        hid_w = (last_hid @ self.W2.t()).unsqueeze(2) # b,m,1,half_hid continuous w one window data
+        a_mx = self.act( hid_m + hid_w + self.b1 ) @ self.V + self.bv # row, all states influence one state 
         a_mx = F.normalize(a_mx, p=2, dim=1, eps=1e-12, out=None)
-        r_l = []
-        r_long_l = []
-        h_mids = orig_x
-        for i in range(self.m):
-            h_tmp = h_mids[:,:,i:i+1].permute(0,2,1).contiguous() 
-            r = self.conv(h_tmp) # [32, 10/k, 1]
-            r_long = self.conv_long(h_tmp)
-            r_l.append(r)
-            r_long_l.append(r_long)
-        r_l = torch.stack(r_l,dim=1)
-        r_long_l = torch.stack(r_long_l,dim=1)
-        r_l = torch.cat((r_l,r_long_l),-1)
-        r_l = r_l.view(r_l.size(0),r_l.size(1),-1)
-        r_l = torch.relu(r_l)
-        adjs = self.adj.repeat(b,1)
-        adjs = adjs.view(b,self.m, self.m)
+        r_l = self.temporal_conv(orig_x)
+        adjs = self.adj.expand(b, m, m)
         c = torch.sigmoid(a_mx @ self.Wb + self.wb)
         a_mx = adjs * c + a_mx * (1-c) 
         adj = a_mx 
@@ -113,15 +108,47 @@ class ColaGNN(nn.Module):
         x = F.relu(self.conv1(x, adj))
         x = F.dropout(x, self.dropout, training=self.training)
         out_spatial = F.relu(self.conv2(x, adj))
+        return self.output(orig_x, out_spatial, out_temporal)
+
+    def temporal_conv(self, orig_x):
+        b, w, m = orig_x.size()
+        h_mids = orig_x.permute(0,2,1).contiguous().view(-1, 1, w) # [b*m, 1, w] kernels are shared by all locations
+        r = self.conv(h_mids) # [b*m, 10/k, 1]
+        r_long = self.conv_long(h_mids)
+        r_l = torch.cat((r,r_long),-1)
+        return torch.relu(r_l.view(b,m,-1))
+
+    def sparse_spatial(self, orig_x, last_hid):
+        """Graph convs on the top-k attention weights of every location mixed with the adjacency at
+        the same pairs, as one block diagonal sparse [b*m, b*m] matrix."""
+        b, m = orig_x.size(0), orig_x.size(2)
+        a_v, a_i, valid = topk_attention(last_hid, self.W1, self.W2, self.b1, self.V, self.bv, self.act,
+                                         self.attn_topk, self.attn_candidates, self.attn_chunk) # b,m,k
+        # F.normalize over dim 1 (column norms) on the kept entries
+        col_norm = a_v.new_zeros(b, m).scatter_add_(1, a_i.view(b, -1), (a_v ** 2).view(b, -1)).sqrt()
+        a_v = a_v / col_norm.gather(1, a_i.view(b, -1)).view_as(a_v).clamp(min=1e-12)
+        # (a_mx @ Wb) at the kept pairs only: sum over the kept columns s of row i of a[i,s] * Wb[s,t]
+        wb = self.Wb[a_i.unsqueeze(-1), a_i.unsqueeze(-2)] # b,m,k,k
+        c = torch.sigmoid(torch.einsum('bis,bist->bit', a_v, wb) + self.wb)
+        rows = torch.arange(m, device=a_i.device).view(1, -1, 1).expand_as(a_i)
+        a_v = (self.adj[rows, a_i] * c + a_v * (1-c)) * valid
+        offset = (torch.arange(b, device=a_i.device) * m).view(-1, 1, 1)
+        indices = torch.stack(((rows + offset).reshape(-1), (a_i + offset).reshape(-1)))
+        adj = torch.sparse_coo_tensor(indices, a_v.reshape(-1), (b * m, b * m))
+        x = self.temporal_conv(orig_x).view(b * m, -1)
+        x = F.relu(self.conv1(x, adj))
+        x = F.dropout(x, self.dropout, training=self.training)
+        return F.relu(self.conv2(x, adj)).view(b, m, -1)
+
+    def output(self, orig_x, out_spatial, out_temporal):
         out = torch.cat((out_spatial, out_temporal),dim=-1)
-        out = self.out(out)
-        out = torch.squeeze(out)
+        out = head_output(self.out(out), self.h, self.multi_horizon, self.n_quantiles)
 
         if (self.residual_window > 0):
             z = orig_x[:, -self.residual_window:, :]; #Step backward # [batch, res_window, m]
             z = z.permute(0,2,1).contiguous().view(-1, self.residual_window); #[batch*m, res_window]
             z = self.residual(z); #[batch*m, 1]
-            z = z.view(-1,self.m); #[batch, m]
+            z = z.view(-1,orig_x.size(2)); #[batch, m]
             out = out * self.ratio + z; #[batch, m]
 
         return out, None
\ No newline at end of file
@@ -20,12 +20,9 @@ class ColaGNN_NoAttn(nn.Module):
         self.d = data.d 
         self.w = args.window
         self.h = args.horizon
-        self.adj = data.adj
         self.o_adj = data.orig_adj
-        if args.cuda:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense().cuda()
-        else:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense()
+        adj = data.adj # symmetric normalized, computed once by graph.load_graph
+        self.register_buffer('adj', adj, persistent=False) # moved by .cuda() and kept by export, not in state_dict
         self.dropout = args.dropout
         self.n_hidden = args.n_hidden
         self.act = F.elu 
@@ -48,7 +45,10 @@ class ColaGNN_NoAttn(nn.Module):
             raise LookupError (' only support LSTM, GRU and RNN')
 
         hidden_size = (int(args.bi) + 1) * self.n_hidden
-        self.out = nn.Linear(hidden_size + self.n_spatial, 1)  
+        self.multi_horizon = args.multi_horizon
+        self.n_quantiles = len(quantile_levels(args))
+        self.n_out = (self.h if self.multi_horizon else 1) * max(1, self.n_quantiles) # all horizons 1..h and quantiles from one forward
+        self.out = nn.Linear(hidden_size + self.n_spatial, self.n_out)  
 
         self.residual_window = 0
         self.ratio = 1.0
@@ -76,25 +76,16 @@ class ColaGNN_NoAttn(nn.Module):
         x = x.permute(0, 2, 1).contiguous().view(-1, x.size(1), 1) 
         r_out, hc = self.rnn(x, None)
         last_hid = r_out[:,-1,:]
-        last_hid = last_hid.view(-1,self.m, self.n_hidden)
+        last_hid = last_hid.view(-1,m, self.n_hidden)
         out_temporal = last_hid  # [b, m, 20]
         
-        r_l = []
-        r_long_l = []
-        h_mids = orig_x
-        for i in range(self.m):
-            h_tmp = h_mids[:,:,i:i+1].permute(0,2,1).contiguous() 
-            r = self.conv(h_tmp) # [32, 10/k, 1]
-            r_long = self.conv_long(h_tmp)
-            r_l.append(r)
-            r_long_l.append(r_long)
-        r_l = torch.stack(r_l,dim=1)
-        r_long_l = torch.stack(r_long_l,dim=1)
-        r_l = torch.cat((r_l,r_long_l),-1)
-        r_l = r_l.view(r_l.size(0),r_l.size(1),-1)
+        h_mids = orig_x.permute(0,2,1).contiguous().view(-1, 1, w) # [b*m, 1, w] kernels are shared by all locations
+        r = self.conv(h_mids) # [b*m, 10/k, 1]
+        r_long = self.conv_long(h_mids)
+        r_l = torch.cat((r,r_long),-1)
+        r_l = r_l.view(b,m,-1)
         r_l = torch.relu(r_l)
-        adjs = self.adj.repeat(b,1)
-        adjs = adjs.view(b,self.m, self.m)
+        adjs = self.adj.expand(b, m, m)
         adj = adjs
         
         x = r_l
@@ -102,14 +93,13 @@ class ColaGNN_NoAttn(nn.Module):
         x = F.dropout(x, self.dropout, training=self.training)
         out_spatial = F.relu(self.conv2(x, adj))
         out = torch.cat((out_spatial, out_temporal),dim=-1)
-        out = self.out(out)
-        out = torch.squeeze(out)
+        out = head_output(self.out(out), self.h, self.multi_horizon, self.n_quantiles)
 
         if (self.residual_window > 0):
             z = orig_x[:, -self.residual_window:, :]; #Step backward # [batch, res_window, m]
             z = z.permute(0,2,1).contiguous().view(-1, self.residual_window); #[batch*m, res_window]
             z = self.residual(z); #[batch*m, 1]
-            z = z.view(-1,self.m); #[batch, m]
+            z = z.view(-1,m); #[batch, m]
             out = out * self.ratio + z; #[batch, m]
 
         return out, None
@@ -125,12 +115,9 @@ class ColaGNN_Thresholding(nn.Module):
         self.d = data.d 
         self.w = args.window
         self.h = args.horizon
-        self.adj = data.adj
         self.o_adj = data.orig_adj
-        if args.cuda:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense().cuda()
-        else:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense()
+        adj = data.adj # symmetric normalized, computed once by graph.load_graph
+        self.register_buffer('adj', adj, persistent=False) # moved by .cuda() and kept by export, not in state_dict
         self.dropout = args.dropout
         self.n_hidden = args.n_hidden
         half_hid = int(self.n_hidden/2)
@@ -165,7 +152,10 @@ class ColaGNN_Thresholding(nn.Module):
             raise LookupError (' only support LSTM, GRU and RNN')
 
         hidden_size = (int(args.bi) + 1) * self.n_hidden
-        self.out = nn.Linear(hidden_size + self.n_spatial, 1)  
+        self.multi_horizon = args.multi_horizon
+        self.n_quantiles = len(quantile_levels(args))
+        self.n_out = (self.h if self.multi_horizon else 1) * max(1, self.n_quantiles) # all horizons 1..h and quantiles from one forward
+        self.out = nn.Linear(hidden_size + self.n_spatial, self.n_out)  
 
         self.residual_window = 0
         self.ratio = 1.0
@@ -193,30 +183,21 @@ class ColaGNN_Thresholding(nn.Module):
         x = x.permute(0, 2, 1).contiguous().view(-1, x.size(1), 1) 
         r_out, hc = self.rnn(x, None)
         last_hid = r_out[:,-1,:]
-        last_hid = last_hid.view(-1,self.m, self.n_hidden)
+        last_hid = last_hid.view(-1,m, self.n_hidden)
         out_temporal = last_hid  # [b, m, 20]
-        hid_rpt_m = last_hid.repeat(1,self.m,1).view(b,self.m,self.m,self.n_hidden) # b,m,m,w continuous m
-        hid_rpt_w = last_hid.repeat(1,1,self.m).view(b,self.m,self.m,self.n_hidden) # b,m,m,w continuous w one window data
-        a_mx = self.act( hid_rpt_m @ self.W1.t()  + hid_rpt_w @ self.W2.t() + self.b1 ) @ self.V + self.bv # row, all states influence one state 
+        hid_m = (last_hid @ self.W1.t()).unsqueeze(1) # b,1,m,half_hid continuous m (broadcast over rows)
+        hid_w = (last_hid @ self.W2.t()).unsqueeze(2) # b,m,1,half_hid continuous w one window data
+        a_mx = self.act( hid_m + hid_w + self.b1 ) @ self.V + self.bv # row, all states influence one state 
         # Thresholding implementation
         a_mx = F.normalize(a_mx, p=2, dim=2, eps=1e-12, out=None)
         
-        r_l = []
-        r_long_l = []
-        h_mids = orig_x
-        for i in range(self.m):
-            h_tmp = h_mids[:,:,i:i+1].permute(0,2,1).contiguous() 
-            r = self.conv(h_tmp) # [32, 10/k, 1]
-            r_long = self.conv_long(h_tmp)
-            r_l.append(r)
-            r_long_l.append(r_long)
-        r_l = torch.stack(r_l,dim=1)
-        r_long_l = torch.stack(r_long_l,dim=1)
-        r_l = torch.cat((r_l,r_long_l),-1)
-        r_l = r_l.view(r_l.size(0),r_l.size(1),-1)
+        h_mids = orig_x.permute(0,2,1).contiguous().view(-1, 1, w) # [b*m, 1, w] kernels are shared by all locations
+        r = self.conv(h_mids) # [b*m, 10/k, 1]
+        r_long = self.conv_long(h_mids)
+        r_l = torch.cat((r,r_long),-1)
+        r_l = r_l.view(b,m,-1)
         r_l = torch.relu(r_l)
-        adjs = self.adj.repeat(b,1)
-        adjs = adjs.view(b,self.m, self.m)
+        adjs = self.adj.expand(b, m, m)
         c = torch.sigmoid(a_mx @ self.Wb + self.wb)
         a_mx = adjs * c + a_mx * (1-c) 
         adj = a_mx 
@@ -232,14 +213,13 @@ class ColaGNN_Thresholding(nn.Module):
         x = F.dropout(x, self.dropout, training=self.training)
         out_spatial = F.relu(self.conv2(x, adj))
         out = torch.cat((out_spatial, out_temporal),dim=-1)
-        out = self.out(out)
-        out = torch.squeeze(out)
+        out = head_output(self.out(out), self.h, self.multi_horizon, self.n_quantiles)
 
         if (self.residual_window > 0):
             z = orig_x[:, -self.residual_window:, :]; #Step backward # [batch, res_window, m]
             z = z.permute(0,2,1).contiguous().view(-1, self.residual_window); #[batch*m, res_window]
             z = self.residual(z); #[batch*m, 1]
-            z = z.view(-1,self.m); #[batch, m]
+            z = z.view(-1,m); #[batch, m]
             out = out * self.ratio + z; #[batch, m]
 
         return out, None
@@ -254,12 +234,9 @@ class ColaGNN_NoAttn_SCI(nn.Module):
         self.d = data.d 
         self.w = args.window
         self.h = args.horizon
-        self.adj = data.sci
         self.o_adj = data.orig_sci
-        if args.cuda:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_sci.cpu().numpy())).to_dense().cuda()
-        else:
-            self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_sci.cpu().numpy())).to_dense()
+        adj = data.sci # symmetric normalized, computed once by graph.load_graph
+        self.register_buffer('adj', adj, persistent=False) # moved by .cuda() and kept by export, not in state_dict
         self.dropout = args.dropout
         self.n_hidden = args.n_hidden
         self.act = F.elu 
@@ -282,7 +259,10 @@ class ColaGNN_NoAttn_SCI(nn.Module):
             raise LookupError (' only support LSTM, GRU and RNN')
 
         hidden_size = (int(args.bi) + 1) * self.n_hidden
-        self.out = nn.Linear(hidden_size + self.n_spatial, 1)  
+        self.multi_horizon = args.multi_horizon
+        self.n_quantiles = len(quantile_levels(args))
+        self.n_out = (self.h if self.multi_horizon else 1) * max(1, self.n_quantiles) # all horizons 1..h and quantiles from one forward
+        self.out = nn.Linear(hidden_size + self.n_spatial, self.n_out)  
 
         self.residual_window = 0
         self.ratio = 1.0
@@ -310,40 +290,29 @@ class ColaGNN_NoAttn_SCI(nn.Module):
         x = x.permute(0, 2, 1).contiguous().view(-1, x.size(1), 1) 
         r_out, hc = self.rnn(x, None)
         last_hid = r_out[:,-1,:]
-        last_hid = last_hid.view(-1,self.m, self.n_hidden)
+        last_hid = last_hid.view(-1,m, self.n_hidden)
         out_temporal = last_hid  # [b, m, 20]
         
-        r_l = []
-        r_long_l = []
-        h_mids = orig_x
-        for i in range(self.m):
-            h_tmp = h_mids[:,:,i:i+1].permute(0,2,1).contiguous() 
-            r = self.conv(h_tmp) # [32, 10/k, 1]
-            r_long = self.conv_long(h_tmp)
-            r_l.append(r)
-            r_long_l.append(r_long)
-        r_l = torch.stack(r_l,dim=1)
-        r_long_l = torch.stack(r_long_l,dim=1)
-        r_l = torch.cat((r_l,r_long_l),-1)
-        r_l = r_l.view(r_l.size(0),r_l.size(1),-1)
+        h_mids = orig_x.permute(0,2,1).contiguous().view(-1, 1, w) # [b*m, 1, w] kernels are shared by all locations
+        r = self.conv(h_mids) # [b*m, 10/k, 1]
+        r_long = self.conv_long(h_mids)
+        r_l = torch.cat((r,r_long),-1)
+        r_l = r_l.view(b,m,-1)
         r_l = torch.relu(r_l)
-        adjs = self.adj.repeat(b,1)
-        adjs = adjs.view(b,self.m, self.m)
+        adjs = self.adj.expand(b, m, m)
         adj = adjs
-        print(adj[0])
         x = r_l
         x = F.relu(self.conv1(x, adj))
         x = F.dropout(x, self.dropout, training=self.training)
         out_spatial = F.relu(self.conv2(x, adj))
         out = torch.cat((out_spatial, out_temporal),dim=-1)
-        out = self.out(out)
-        out = torch.squeeze(out)
+        out = head_output(self.out(out), self.h, self.multi_horizon, self.n_quantiles)
 
         if (self.residual_window > 0):
             z = orig_x[:, -self.residual_window:, :]; #Step backward # [batch, res_window, m]
             z = z.permute(0,2,1).contiguous().view(-1, self.residual_window); #[batch*m, res_window]
             z = self.residual(z); #[batch*m, 1]
-            z = z.view(-1,self.m); #[batch, m]
+            z = z.view(-1,m); #[batch, m]
             out = out * self.ratio + z; #[batch, m]
 
         return out, None
@@ -358,9 +327,7 @@ class ColaGNN_IdentityADJ(nn.Module):
         self.d = data.d 
         self.w = args.window
         self.h = args.horizon
-        self.adj = torch.eye(self.m)
-        if args.cuda:
-            self.adj = self.adj.cuda()
+        self.register_buffer('adj', torch.eye(self.m), persistent=False)
         self.dropout = args.dropout
         self.n_hidden = args.n_hidden
         self.act = F.elu 
@@ -383,7 +350,10 @@ class ColaGNN_IdentityADJ(nn.Module):
             raise LookupError (' only support LSTM, GRU and RNN')
 
         hidden_size = (int(args.bi) + 1) * self.n_hidden
-        self.out = nn.Linear(hidden_size + self.n_spatial, 1)  
+        self.multi_horizon = args.multi_horizon
+        self.n_quantiles = len(quantile_levels(args))
+        self.n_out = (self.h if self.multi_horizon else 1) * max(1, self.n_quantiles) # all horizons 1..h and quantiles from one forward
+        self.out = nn.Linear(hidden_size + self.n_spatial, self.n_out)  
 
         self.residual_window = 0
         self.ratio = 1.0
@@ -411,25 +381,16 @@ class ColaGNN_IdentityADJ(nn.Module):
         x = x.permute(0, 2, 1).contiguous().view(-1, x.size(1), 1) 
         r_out, hc = self.rnn(x, None)
         last_hid = r_out[:,-1,:]
-        last_hid = last_hid.view(-1,self.m, self.n_hidden)
+        last_hid = last_hid.view(-1,m, self.n_hidden)
         out_temporal = last_hid  # [b, m, 20]
         
-        r_l = []
-        r_long_l = []
-        h_mids = orig_x
-        for i in range(self.m):
-            h_tmp = h_mids[:,:,i:i+1].permute(0,2,1).contiguous() 
-            r = self.conv(h_tmp) # [32, 10/k, 1]
-            r_long = self.conv_long(h_tmp)
-            r_l.append(r)
-            r_long_l.append(r_long)
-        r_l = torch.stack(r_l,dim=1)
-        r_long_l = torch.stack(r_long_l,dim=1)
-        r_l = torch.cat((r_l,r_long_l),-1)
-        r_l = r_l.view(r_l.size(0),r_l.size(1),-1)
+        h_mids = orig_x.permute(0,2,1).contiguous().view(-1, 1, w) # [b*m, 1, w] kernels are shared by all locations
+        r = self.conv(h_mids) # [b*m, 10/k, 1]
+        r_long = self.conv_long(h_mids)
+        r_l = torch.cat((r,r_long),-1)
+        r_l = r_l.view(b,m,-1)
         r_l = torch.relu(r_l)
-        adjs = self.adj.repeat(b,1)
-        adjs = adjs.view(b, self.m, self.m)
+        adjs = self.adj.expand(b, m, m)
         adj = adjs
 
         x = r_l
@@ -437,14 +398,13 @@ class ColaGNN_IdentityADJ(nn.Module):
         x = F.dropout(x, self.dropout, training=self.training)
         out_spatial = F.relu(self.conv2(x, adj))
         out = torch.cat((out_spatial, out_temporal),dim=-1)
-        out = self.out(out)
-        out = torch.squeeze(out)
+        out = head_output(self.out(out), self.h, self.multi_horizon, self.n_quantiles)
 
         if (self.residual_window > 0):
             z = orig_x[:, -self.residual_window:, :]; #Step backward # [batch, res_window, m]
             z = z.permute(0,2,1).contiguous().view(-1, self.residual_window); #[batch*m, res_window]
             z = self.residual(z); #[batch*m, 1]
-            z = z.view(-1,self.m); #[batch, m]
+            z = z.view(-1,m); #[batch, m]
             out = out * self.ratio + z; #[batch, m]
             
         return out, None
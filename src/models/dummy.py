@@ -1,12 +1,34 @@
 # Dummy model that always use the last value of the input as the prediction
+import math
 import torch
 import torch.nn as nn
+from utils import quantile_levels
 
 class Dummy(nn.Module): 
     def __init__(self, args, data):
         super().__init__()
+        self.multi_horizon = args.multi_horizon
+        self.h = args.horizon
+        self.quantiles = quantile_levels(args)
 
     def forward(self, x):
         x = x.permute(0, 2, 1)
         out = x[:, :, -1]
+        if self.quantiles:
+            # last value plus the quantiles of the k-day changes seen in the window
+            horizons = range(1, self.h + 1) if self.multi_horizon else [self.h]
+            out = torch.stack([out.unsqueeze(1) + self.change_quantiles(x, k) for k in horizons], 1)
+            return out if self.multi_horizon else out[:, 0], None # [b, (h,) q, m]
+        if self.multi_horizon:
+            out = out.unsqueeze(1).expand(-1, self.h, -1) # same value for every horizon
         return out, None
+
+    def change_quantiles(self, x, k):
+        """[b, q, m] quantiles of x[t + k] - x[t] over the window x [b, m, w], steps longer than the
+        window scaled from the longest available step as a random walk."""
+        step = min(k, x.size(-1) - 1)
+        if step < 1:
+            raise LookupError('quantile forecasts of the dummy model need a window of at least 2')
+        change = x[:, :, step:] - x[:, :, :-step]
+        q = torch.quantile(change, torch.tensor(self.quantiles, dtype=x.dtype, device=x.device), dim=-1) # q, b, m
+        return q.permute(1, 0, 2) * math.sqrt(k / step)
@@ -14,6 +14,53 @@ from torch.nn.modules.module import Module
 import torch.nn.functional as F
 from utils import *
 
+def topk_attention(last_hid, W1, W2, b1, V, bv, act, k, candidates=None, chunk=256):
+    """Top-k columns per row of the ColaGNN location attention act(W2 h_i + W1 h_j + b1) V + bv, scored in
+    chunks of rows so the dense [b, m, m, half_hid] tensor is never built.
+    candidates: optional [m, c] columns to score per row (padded with -1) instead of all m.
+    Returns values [b, m, k], column indices [b, m, k] and the mask of the valid (non padding) entries."""
+    b, m, _ = last_hid.size()
+    hid_m = last_hid @ W1.t() # b,m,half_hid
+    hid_w = last_hid @ W2.t()
+    values, index = [], []
+    for start in range(0, m, chunk):
+        rows = slice(start, min(start + chunk, m))
+        if candidates is None:
+            cols = hid_m.unsqueeze(1) # b,1,m,half_hid
+        else:
+            cand = candidates[rows]
+            cols = hid_m[:, cand.clamp(min=0)] # b,rows,c,half_hid
+        score = act(cols + hid_w[:, rows].unsqueeze(2) + b1) @ V + bv # b,rows,m or c
+        if candidates is not None:
+            score = score.masked_fill(cand < 0, float('-inf'))
+        v, i = score.topk(min(k, score.size(-1)), dim=-1)
+        if candidates is not None:
+            i = cand.expand(b, -1, -1).gather(2, i)
+        values.append(v)
+        index.append(i)
+    values, index = torch.cat(values, 1), torch.cat(index, 1)
+    valid = torch.isfinite(values)
+    return values.masked_fill(~valid, 0.), index.clamp(min=0), valid
+
+def neighbor_candidates(adj):
+    """[m, max degree] column indices of the nonzeros of every row of adj, padded with -1."""
+    mask = adj != 0
+    deg = int(mask.sum(1).max())
+    order = torch.argsort((~mask).to(torch.int8), dim=1, stable=True)[:, :deg] # nonzero columns first
+    return order.masked_fill(~mask.gather(1, order), -1)
+
+def head_output(out, h, multi_horizon, n_quantiles=0):
+    """Output layer result [b, m, n_out] as the forecast: [b, m] (squeezed), [b, h, m], or with quantiles
+    [b, q, m] and [b, h, q, m], the quantiles sorted so they never cross."""
+    if n_quantiles:
+        b, m = out.size(0), out.size(1)
+        out = out.view(b, m, h if multi_horizon else 1, n_quantiles).permute(0, 2, 3, 1)
+        out = torch.sort(out, dim=2)[0]
+        return out if multi_horizon else out[:, 0]
+    if multi_horizon:
+        return out.permute(0, 2, 1).contiguous() # [b, h, m]
+    return torch.squeeze(out)
+
 class GraphConvLayer(Module):
     def __init__(self, in_features, out_features, bias=True):
         super(GraphConvLayer, self).__init__()
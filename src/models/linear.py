@@ -1,28 +1,37 @@
 import torch
 import torch.nn as nn
-import numpy as np
-from sklearn.linear_model import LinearRegression
+from utils import quantile_levels
 
 class Linear(nn.Module): 
     def __init__(self, args, data):
         super().__init__()
-        self.cuda = args.cuda
         self.window = args.window
         self.horizon = args.horizon
+        self.multi_horizon = args.multi_horizon
+        self.quantiles = quantile_levels(args)
 
     def forward(self, x):
-        y_vals = x.permute(0, 2, 1).detach().cpu().numpy()
-        x_vals = np.array(list(range(self.window))).reshape((-1, 1))
-        x_pred = [[self.window + self.horizon - 1]]
-        out = []
-        for batch in y_vals:
-            pred = []
-            for county in batch:
-                model = LinearRegression()
-                model.fit(x_vals, county)
-                pred.append(model.predict(x_pred))
-            out.append(pred)
-        out = torch.squeeze(torch.tensor(out))
-        if self.cuda:
-            out = out.cuda()                         
+        # Closed-form least squares line over the window for every (batch, county) series,
+        # same fit as sklearn LinearRegression but without leaving torch
+        t = torch.arange(self.window, dtype=x.dtype, device=x.device)
+        t_mean = t.mean()
+        t_c = t - t_mean
+        slope = (t_c.view(1, -1, 1) * (x - x.mean(dim=1, keepdim=True))).sum(dim=1) / (t_c * t_c).sum().clamp(min=1e-12)
+        if self.multi_horizon:
+            t_pred = self.window - 1 + torch.arange(1, self.horizon + 1, dtype=x.dtype, device=x.device)
+            out = x.mean(dim=1).unsqueeze(1) + slope.unsqueeze(1) * (t_pred - t_mean).view(1, -1, 1) # [b, h, m]
+        else:
+            out = x.mean(dim=1) + slope * (self.window + self.horizon - 1 - t_mean)
+        if self.quantiles:
+            # the line plus the quantiles of its residuals over the window, widened by the variance of the
+            # extrapolated line, sqrt(n / (n - 2) * (1 + 1/n + (t - t_mean)^2 / sum (t_i - t_mean)^2)), and
+            # by sqrt(k) for the k-th day ahead as the dummy model, the residuals of a smoothed series accumulate
+            residual = x - x.mean(dim=1, keepdim=True) - slope.unsqueeze(1) * t_c.view(1, -1, 1)
+            q = torch.quantile(residual, torch.tensor(self.quantiles, dtype=x.dtype, device=x.device), dim=1).permute(1, 0, 2) # [b, q, m]
+            n = self.window
+            days = torch.arange(1, self.horizon + 1, dtype=x.dtype, device=x.device) if self.multi_horizon else torch.full((1,), float(self.horizon), dtype=x.dtype, device=x.device)
+            extrapolation = 1 + 1. / n + (n - 1 + days - t_mean) ** 2 / (t_c * t_c).sum().clamp(min=1e-12)
+            scale = torch.sqrt(n / max(n - 2, 1) * extrapolation * days) # [h]
+            q = q.unsqueeze(1) * scale.view(1, -1, 1, 1) # [b, h, q, m]
+            out = out.unsqueeze(-2) + (q if self.multi_horizon else q[:, 0]) # [b, (h,) q, m]
         return out, None
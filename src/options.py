@@ -0,0 +1,64 @@
+import argparse
+
+# Training settings shared by train.py and the scripts that reload its checkpoints
+def get_parser():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--dataset', type=str, default='ca48-548', help="Dataset string")
+    ap.add_argument('--sim_mat', type=str, default='ca48-adj', help="adjacency matrix filename (*-adj.txt)")
+    ap.add_argument('--sci', type=str, default='ca48-sci', help="social connectednes index")
+    ap.add_argument('--graph_cache', type=str, default='cache/graph', help="dir path of the cached normalized graphs, '' to disable")
+    ap.add_argument('--svi', type=str, default='', help="social vulnerability index data")
+    ap.add_argument('--n_layer', type=int, default=1, help="number of layers (default 1)") 
+    ap.add_argument('--n_hidden', type=int, default=20, help="rnn hidden states (could be set as any value)") 
+    ap.add_argument('--seed', type=int, default=42, help='random seed')
+    ap.add_argument('--epochs', type=int, default=1500, help='number of epochs to train')
+    ap.add_argument('--lr', type=float, default=1e-3, help='initial learning rate')
+    ap.add_argument('--weight_decay', type=float, default=5e-4, help='weight decay (L2 loss on parameters).')
+    ap.add_argument('--dropout', type=float, default=0.2, help='dropout rate usually 0.2-0.5.')
+    ap.add_argument('--batch', type=int, default=32, help="batch size")
+    ap.add_argument('--check_point', type=int, default=1, help="check point")
+    ap.add_argument('--shuffle', action='store_true', default=False, help="not used, default false")
+    ap.add_argument('--train', type=float, default=.7, help="Training ratio (0, 1)")
+    ap.add_argument('--val', type=float, default=.15, help="Validation ratio (0, 1)")
+    ap.add_argument('--test', type=float, default=.15, help="Testing ratio (0, 1)")
+    ap.add_argument('--model', default='colagnn', help='Model to use')
+    ap.add_argument('--rnn_model', default='RNN', choices=['LSTM','RNN','GRU'], help='')
+    ap.add_argument('--mylog', action='store_false', default=True,  help='save the per-epoch metrics log')
+    ap.add_argument('--log_dir', type=str, default='logs', help='dir path of the metrics logs, one <log_token>-<time> dir per run')
+    ap.add_argument('--log_format', type=str, default='csv', choices=['csv', 'jsonl'], help='metrics log file format')
+    ap.add_argument('--tensorboard', action='store_true', default=False, help='also write the metrics to a tensorboard event file')
+    ap.add_argument('--results_db', type=str, default='result/results.db', help="results store of the runs and test predictions, '' to disable")
+    ap.add_argument('--result_csv', action='store_true', default=False, help='also write the test predictions to result/<dataset>/<window>/<model>/<horizon>/{true,pred}.csv')
+    ap.add_argument('--cuda', action='store_true', default=True,  help='')
+    ap.add_argument('--window', type=int, default=7, help='') 
+    ap.add_argument('--horizon', type=int, default=1, help='leadtime default 1') 
+    ap.add_argument('--multi_horizon', action='store_true', default=False, help='predict all horizons 1..horizon in one forward')
+    ap.add_argument('--quantiles', type=str, default='', help='quantile forecasts trained with the pinball loss, e.g. 0.1,0.5,0.9 (the median is the point forecast)')
+    ap.add_argument('--timing', action='store_true', default=False, help='print the seconds of every training stage per epoch')
+    ap.add_argument('--profile_epochs', type=str, default='', help='torch.profiler capture of these epochs, e.g. 5-7')
+    ap.add_argument('--profile_dir', type=str, default='profile', help='dir path of the profiler trace and operator summary')
+    ap.add_argument('--mem_profile', action='store_true', default=False, help='print the peak memory of the training steps and the memory of every forward sub-block per epoch')
+    ap.add_argument('--mem_preflight', action='store_true', default=False, help='estimate the peak memory of a training step before training, refuse if it does not fit')
+    ap.add_argument('--mem_limit_gb', type=float, default=0, help='memory limit of the preflight check, 0 uses the available memory')
+    ap.add_argument('--mem_auto_batch', action='store_true', default=False, help='lower --batch to fit the preflight limit instead of refusing')
+    ap.add_argument('--save_dir', type=str,  default='save',help='dir path to save the final model')
+    ap.add_argument('--gpu', type=int, default=1,  help='choose gpu 0-10')
+    ap.add_argument('--lamda', type=float, default=0.01,  help='regularize params similarities of states')
+    ap.add_argument('--bi', action='store_true', default=False,  help='bidirectional default false')
+    ap.add_argument('--patience', type=int, default=100, help='patience default 100')
+    ap.add_argument('--k', type=int, default=10,  help='kernels')
+    ap.add_argument('--attn_topk', type=int, default=0, help='colagnn: keep the top-k attention weights per location (sparse graph convs), 0 dense')
+    ap.add_argument('--attn_candidates', type=str, default='adj', choices=['all', 'adj'], help="colagnn top-k attention: score only the adjacent locations (O(m k) compute) or all of them ('all' only bounds the memory by chunks, compute stays O(m^2))")
+    ap.add_argument('--attn_chunk', type=int, default=256, help='colagnn top-k attention: rows scored at once')
+    ap.add_argument('--hidsp', type=int, default=15,  help='spatial dim')
+
+    ap.add_argument('--smoothf', type=str, default="movemean_7", choices=['movemean_7', 'movemedian_6', 'none'], help='util function used to smooth the input time series data')
+    # ap.add_argument('--smoothf', type=str, default="none", choices=['movemean_6', 'movemedian_6', 'none'], help='util function used to smooth the input time series data')
+    return ap
+
+def get_log_token(args):
+    horizon = '1-%s' % args.horizon if args.multi_horizon else args.horizon
+    token = '%s.%s.w-%s.h-%s.%s' % (args.model, args.dataset, args.window, horizon, args.rnn_model)
+    if getattr(args, 'quantiles', ''):
+        token += '.q-' + args.quantiles.replace(',', '-')
+    return token
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Partitioned training for county graphs too large for the dense [b, m, m] attention and adjacency of
+# ColaGNN. The nodes are split into parts (by state, or by recursive spectral bisection of the
+# adjacency), each part is extended by its k-hop halo, and every minibatch of windows is trained part by
+# part on the induced subgraph with the loss on the part's own (core) nodes only. Predictions are
+# stitched from the core nodes of every part for validation and test.
+#
+#   python partition.py --parts spectral --n_parts 4 --halo 1
+#   python partition.py --parts state --fips_file <dataset>-fips
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, random, functools
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from data import DataBasicLoader
+from models import get_model
+from options import get_parser, get_log_token
+from utils import evaluation_metrics, quantile_levels
+from subgraph import k_hop_nodes, node_forward
+from export import predict
+from training import fit
+
+def state_parts(fips):
+    """One part per state (first digits of the county FIPS)."""
+    states = np.asarray(fips) // 1000
+    return [np.flatnonzero(states == s) for s in np.unique(states)]
+
+def spectral_parts(graph, n_parts):
+    """Recursive spectral bisection: split the largest part at the median of the Fiedler vector of its
+    normalized Laplacian until there are n_parts balanced parts."""
+    graph = (np.asarray(graph) != 0).astype(float)
+    graph = np.maximum(graph, graph.T)
+    np.fill_diagonal(graph, 0)
+    parts = [np.arange(graph.shape[0])]
+    while len(parts) < n_parts:
+        parts.sort(key=len)
+        nodes = parts.pop()
+        sub = graph[np.ix_(nodes, nodes)]
+        deg = sub.sum(1)
+        d = 1. / np.sqrt(np.maximum(deg, 1e-12))
+        laplacian = np.eye(len(nodes)) - d[:, None] * sub * d[None, :]
+        _, vectors = np.linalg.eigh(laplacian)
+        order = np.argsort(vectors[:, 1], kind='stable')
+        half = len(nodes) // 2
+        parts += [np.sort(nodes[order[:half]]), np.sort(nodes[order[half:]])]
+    return sorted(parts, key=lambda p: p[0])
+
+def add_halo(graph, parts, hops):
+    """(nodes, core) per part: the part with its hops-hop neighbors, and the positions of the part's own nodes."""
+    halo_parts = []
+    for part in parts:
+        nodes = k_hop_nodes(graph, part, hops)
+        halo_parts.append((nodes, np.searchsorted(nodes, part)))
+    return halo_parts
+
+def stitch_predict(model, X, parts):
+    """Full forecast [b, 1 or h, m] from the core nodes of every part."""
+    out = X.new_zeros(X.size(0), model.n_out if hasattr(model, 'n_out') else 1, X.size(2))
+    for nodes, core in parts:
+        pred = node_forward(model, X[:, :, nodes], nodes)
+        out[:, :, nodes[core]] = pred[:, :, core]
+    return out
+
+def evaluate(model, data, split, parts, batch_size):
+    """Stitched predictions over a split, returns the summed l1 loss of the normalized series and the
+    denormalized (y_true, y_pred)."""
+    model.eval()
+    y_true_states, y_pred_states = predict(lambda X: (stitch_predict(model, X, parts), None), data, split, batch_size)
+    loss = np.abs((y_pred_states - y_true_states) / (data.max - data.min + 1e-12)).sum()
+    return loss, y_true_states, y_pred_states
+
+def train_epoch(model, data, split, optimizer, batch_size, parts):
+    """One pass over the windows of split, one optimizer step per (minibatch, part) in random part order."""
+    model.train()
+    total_loss, n = 0., 0
+    for X, Y in data.get_batches(split, batch_size, True):
+        Y = Y.view(X.size(0), -1, X.size(2))
+        for i in np.random.permutation(len(parts)):
+            nodes, core = parts[i]
+            optimizer.zero_grad()
+            out = node_forward(model, X[:, :, nodes], nodes)
+            loss = F.l1_loss(out[:, :, core], Y[:, :, nodes[core]])
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(core)
+            n += len(core)
+    return total_loss / n
+
+if __name__ == '__main__':
+    ap = get_parser()
+    ap.add_argument('--parts', type=str, default='spectral', help='spectral or state (needs --fips_file)')
+    ap.add_argument('--n_parts', type=int, default=4, help='number of spectral parts')
+    ap.add_argument('--halo', type=int, default=1, help='hops of neighbors added to every part')
+    ap.add_argument('--fips_file', type=str, default='', help='FIPS of the dataset columns (../data/fips/<fips_file>.txt)')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, partition.py uses point forecasts')
+    args.cuda = args.cuda and torch.cuda.is_available()
+    print(args)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    data_loader = DataBasicLoader(args)
+    model = get_model(args, data_loader)
+    if args.cuda:
+        model.cuda()
+    graph = model.adj.cpu().numpy()
+    if args.parts == 'state':
+        fips = np.loadtxt(open('../data/fips/{}.txt'.format(args.fips_file)), ndmin=1).astype(int)
+        parts = state_parts(fips)
+    elif args.parts == 'spectral':
+        parts = spectral_parts(graph, args.n_parts)
+    else:
+        raise LookupError('only support spectral and state partitions')
+    parts = add_halo(graph, parts, args.halo)
+    print('{} parts, core sizes {}, with halo {}'.format(len(parts), [len(c) for _, c in parts], [len(n) for n, _ in parts]))
+
+    fit(model, data_loader, data_loader.train, data_loader.val, args.epochs, args.patience, args,
+        train_epoch=functools.partial(train_epoch, parts=parts),
+        val_loss=lambda model, data, split, batch_size: evaluate(model, data, split, parts, batch_size)[0], verbose=True)
+    if not os.path.exists(args.save_dir):
+        os.makedirs(args.save_dir)
+    model_path = '%s/%s.part.pt' % (args.save_dir, get_log_token(args))
+    with open(model_path, 'wb') as f:
+        torch.save(model.state_dict(), f)
+
+    _, y_true_states, y_pred_states = evaluate(model, data_loader, data_loader.test, parts, args.batch)
+    y_true_states = y_true_states.reshape(-1, data_loader.m)
+    y_pred_states = y_pred_states.reshape(-1, data_loader.m)
+    mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluation_metrics(y_true_states, y_pred_states, data_loader.peak_thold)
+    print('Final evaluation (stitched from {} parts), saved {}'.format(len(parts), model_path))
+    print('TEST MAE {:5.4f} std {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} R2 {:5.4f} R2s {:5.4f} Var {:5.4f} Vars {:5.4f} Peak {:5.4f}'.format( mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae))
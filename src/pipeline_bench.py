@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# End-to-end benchmark of the train.py pipeline stages: loadtxt, smoothing, graph normalization,
+# windowing (_batchify), model build, one training epoch, evaluation, metrics and checkpoint I/O.
+# Runs on the shipped datasets and on synthetic versions with the locations tiled --scales times,
+# and flags the stages over their time budget. Every run is done twice: timed, then traced by tracemalloc
+# for the peak memory of the stages (tracing would inflate the times).
+#
+#   python pipeline_bench.py --scales 4 16 --budget train_epoch=60 evaluate=10
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, time, json, resource, tempfile, tracemalloc
+from contextlib import contextmanager
+import numpy as np
+import torch
+import torch.nn.functional as F
+import warnings
+
+from data import DataBasicLoader
+from models import get_model, NO_TRAIN_MODELS
+from options import get_parser
+from utils import evaluation_metrics, movemedian_6, movemean_7, quantile_levels
+from graph import normalize_graph
+from export import predict
+
+# seconds per stage, override with --budget stage=seconds
+BUDGETS = {'load': 2., 'smooth': 5., 'graph': 1., 'batchify': 5., 'model': 1., 'train_epoch': 30.,
+           'evaluate': 5., 'metrics': 2., 'checkpoint': 1.}
+
+class StageProfile(object):
+    """Seconds and max RSS growth of every stage of a run, or with traced only the numpy/python peak memory
+    of every stage (tracemalloc, which slows python heavy stages several times, so they are timed untraced)."""
+    def __init__(self, traced=False):
+        self.traced = traced
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        if self.traced:
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stages.append({'stage': name, 'peak_mb': peak / 2 ** 20})
+            return
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stages.append({'stage': name, 'seconds': seconds,
+                                'rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 2 ** 10})
+
+def scaled_dataset(raw, adj, scale, seed=0):
+    """raw [n, m] and adj [m, m] with the locations tiled scale times: noisy copies of the series and a
+    block diagonal graph, plus a few random edges between the copies."""
+    rng = np.random.RandomState(seed)
+    m = raw.shape[1]
+    raw = np.tile(raw, (1, scale)) * rng.uniform(0.5, 1.5, m * scale)
+    adj = np.kron(np.eye(scale), adj)
+    links = rng.randint(0, m * scale, (scale * m // 10, 2))
+    adj[links[:, 0], links[:, 1]] = adj[links[:, 1], links[:, 0]] = 1
+    return np.round(raw), adj
+
+def run_pipeline(args, ts_path, adj_path, tmp_dir, timer):
+    with timer.stage('load'):
+        raw = np.loadtxt(open(ts_path), delimiter=',')
+    with timer.stage('smooth'):
+        smoothed = eval(args.smoothf)(raw) if args.smoothf != "none" else raw
+    with timer.stage('graph'):
+        orig_adj = np.loadtxt(open(adj_path), delimiter=',')
+        adj = normalize_graph(orig_adj, 'sym')
+    with timer.stage('batchify'):
+        data = DataBasicLoader(args, rawdata=smoothed)
+    data.orig_adj = torch.Tensor(orig_adj)
+    data.adj = torch.Tensor(adj)
+    with timer.stage('model'):
+        model = get_model(args, data)
+    if args.model not in NO_TRAIN_MODELS:
+        optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=args.lr, weight_decay=args.weight_decay)
+        with timer.stage('train_epoch'):
+            model.train()
+            for X, Y in data.get_batches(data.train, args.batch, True):
+                optimizer.zero_grad()
+                output, _ = model(X)
+                F.l1_loss(output.view(Y.size()), Y).backward()
+                optimizer.step()
+    model.eval()
+    with timer.stage('evaluate'):
+        predict(model, data, data.val, args.batch)
+        y_true_states, y_pred_states = predict(model, data, data.test, args.batch)
+    with timer.stage('metrics'):
+        evaluation_metrics(y_true_states, y_pred_states, data.peak_thold)
+    with timer.stage('checkpoint'):
+        path = os.path.join(tmp_dir, 'model.pt')
+        with open(path, 'wb') as f:
+            torch.save(model.state_dict(), f)
+        with open(path, 'rb') as f:
+            model.load_state_dict(torch.load(f))
+    return data.n, data.m, timer.stages
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    ap = get_parser()
+    ap.add_argument('--datasets', type=str, nargs='+', default=['ca48-548:ca48-adj', 'state360:state-adj'], help='<ts name>:<adj name> pairs')
+    ap.add_argument('--scales', type=int, nargs='*', default=[4, 16], help='synthetic versions of the first dataset with the locations tiled')
+    ap.add_argument('--budget', type=str, nargs='*', default=[], help='stage=seconds overrides of the time budgets')
+    ap.add_argument('--out', type=str, default='bench/pipeline.json', help='')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, pipeline_bench.py uses point forecasts')
+    args.cuda = False
+    args.sim_mat = args.sci = '' # the graph stage loads and normalizes the adjacency
+    budgets = dict(BUDGETS)
+    for b in args.budget:
+        stage, seconds = b.split('=')
+        budgets[stage] = float(seconds)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = []
+        for pair in args.datasets:
+            ts, adj = pair.split(':')
+            inputs.append((ts, "../data/ts/{}.txt".format(ts), "../data/adj/{}.txt".format(adj)))
+        ts, ts_path, adj_path = inputs[0]
+        for scale in args.scales:
+            raw, adj = scaled_dataset(np.loadtxt(open(ts_path), delimiter=','), np.loadtxt(open(adj_path), delimiter=','), scale)
+            name = '%s-x%d' % (ts, scale)
+            np.savetxt(os.path.join(tmp_dir, name + '.txt'), raw, fmt='%d', delimiter=',')
+            np.savetxt(os.path.join(tmp_dir, name + '-adj.txt'), adj, fmt='%d', delimiter=',')
+            inputs.append((name, os.path.join(tmp_dir, name + '.txt'), os.path.join(tmp_dir, name + '-adj.txt')))
+
+        for name, ts_path, adj_path in inputs:
+            stages = []
+            for traced in (False, True): # timed pass, then the same run again for the traced peak memory
+                torch.manual_seed(args.seed)
+                np.random.seed(args.seed)
+                n, m, profile = run_pipeline(args, ts_path, adj_path, tmp_dir, StageProfile(traced))
+                stages = [dict(s, **p) for s, p in zip(stages, profile)] if stages else profile
+            print('{} (n {}, m {}, model {})'.format(name, n, m, args.model))
+            for s in stages:
+                s['over_budget'] = s['seconds'] > budgets.get(s['stage'], float('inf'))
+                print('  {:12s} {:9.3f}s  peak {:8.1f}MB  rss +{:8.1f}MB {}'.format(
+                    s['stage'], s['seconds'], s['peak_mb'], s['rss_growth_mb'], 'OVER BUDGET {:.1f}s'.format(budgets[s['stage']]) if s['over_budget'] else ''))
+            runs.append({'dataset': name, 'n': n, 'm': m, 'model': args.model, 'stages': stages})
+
+    if os.path.dirname(args.out) and not os.path.exists(os.path.dirname(args.out)):
+        os.makedirs(os.path.dirname(args.out))
+    with open(args.out, 'w') as f:
+        json.dump({'budgets': budgets, 'runs': runs}, f, indent=1)
+    print('saved', args.out)
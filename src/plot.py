@@ -1,123 +1,117 @@
+# -*- coding: utf-8 -*-
+# Forecast comparison figures: truth and the test predictions of several models for every (window, county).
+# The predictions are loaded once (results store, or a result/<dataset>/<window>/<model>/<horizon> csv tree),
+# the figures are rendered by --workers processes with the Agg backend and optionally collected in one pdf.
+#
+#   python plot.py --windows 7 14 28 --horizon 7 --counties "Los Angeles" "San Francisco"
+#   python plot.py --windows 7 14 28 --horizon 7 --workers 8 --report figures/report.pdf     all 48 counties
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, argparse, itertools
+import multiprocessing as mp
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
 import pandas as pd
-import os
 
-def plot(dataset, window, model, horizon, county):
-    # y = pd.read_csv(f'result/{dataset}/{model}/{str(horizon)}/true.csv').values
-    # y_hat = pd.read_csv(f'result/{dataset}/{model}/{str(horizon)}/pred.csv').values
-    y = pd.read_csv(f'result/{dataset}/{window}/{model}/{str(horizon)}/true.csv').values
-    y_hat = pd.read_csv(f'result/{dataset}/{window}/{model}/{str(horizon)}/pred.csv').values
-    idx = COUNTY.index(county)
-    if not os.path.exists(f'figures/{window}'):
-        os.makedirs(f'figures/{window}')
-    plt.figure(1)
-    plt.plot(y[:,idx], label='Truth')
-    plt.plot(y_hat[:,idx], label='Prediction')
-    plt.legend()
-    plt.title(f'{model} model {str(horizon)}th day prediction for {county}')
-    plt.savefig(f'figures/{window}/{model}_{str(horizon)}_{county}.png')
-    plt.close(1)
-
-COUNTY = ['Alameda', 'Amador', 'Butte', 'Calaveras', 'Contra Costa', 'Del Norte', 'El Dorado', 'Fresno', 
-          'Glenn', 'Humboldt', 'Imperial', 'Kern', 'Kings', 'Lake', 'Los Angeles', 'Madera', 'Marin', 
-          'Mendocino', 'Merced', 'Monterey', 'Napa', 'Nevada', 'Orange', 'Placer', 'Riverside', 'Sacramento', 
-          'San Benito', 'San Bernardino', 'San Diego', 'San Francisco', 'San Joaquin', 'San Luis Obispo', 
-          'San Mateo', 'Santa Barbara', 'Santa Clara', 'Santa Cruz', 'Shasta', 'Siskiyou', 'Solano', 
+COUNTY = ['Alameda', 'Amador', 'Butte', 'Calaveras', 'Contra Costa', 'Del Norte', 'El Dorado', 'Fresno',
+          'Glenn', 'Humboldt', 'Imperial', 'Kern', 'Kings', 'Lake', 'Los Angeles', 'Madera', 'Marin',
+          'Mendocino', 'Merced', 'Monterey', 'Napa', 'Nevada', 'Orange', 'Placer', 'Riverside', 'Sacramento',
+          'San Benito', 'San Bernardino', 'San Diego', 'San Francisco', 'San Joaquin', 'San Luis Obispo',
+          'San Mateo', 'Santa Barbara', 'Santa Clara', 'Santa Cruz', 'Shasta', 'Siskiyou', 'Solano',
           'Sonoma', 'Stanislaus', 'Sutter', 'Tehama', 'Tulare', 'Tuolumne', 'Ventura', 'Yolo', 'Yuba']
 
-dataset = 'ca48-548'
-
-# horizon = 7
-# window = 7
-
-# model = 'dummy'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'arma'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'colagnn'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'colagnn_noattn'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'colagnn_thresholding'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'colagnn_noattn_sci'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'colagnn_identityadj'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-# model = 'linear'
-# plot(dataset, window, model, horizon, 'Los Angeles')
-# plot(dataset, window, model, horizon, 'San Francisco')
-
-def plot_multiple(dataset, window, models, horizon, county, out_filename):
-    # y = pd.read_csv(f'result/{dataset}/{model}/{str(horizon)}/true.csv').values
-    # y_hat = pd.read_csv(f'result/{dataset}/{model}/{str(horizon)}/pred.csv').values
-    idx = COUNTY.index(county)
-    y = pd.read_csv(f'result/{dataset}/{window}/{models[0]}/{str(horizon)}/true.csv').values
-    plt.figure(1)
+MODELS = ['dummy', 'arma', 'colagnn', 'colagnn_noattn', 'colagnn_noattn_sci', 'colagnn_identityadj']
+
+def load_results(source, dataset, windows, models, horizon):
+    """{(window, model): (y_true, y_pred)} read once, from a results store (.db) or a csv result tree."""
+    if source.endswith('.db'):
+        from results import ResultStore
+        return {k[:2]: v for k, v in ResultStore(source).load(dataset, windows, models, horizon).items()}
+    results = {}
+    for window, model in itertools.product(windows, models):
+        path = f'{source}/{dataset}/{window}/{model}/{horizon}'
+        if os.path.exists(path + '/pred.csv'):
+            results[window, model] = (pd.read_csv(path + '/true.csv').values, pd.read_csv(path + '/pred.csv').values)
+    return results
+
+_results = {} # set before the workers fork, shared copy-on-write
+
+def render(task):
+    """One figure: the truth and every model's prediction of a county for a window. Returns the png path."""
+    window, models, horizon, county, idx, path = task
+    fig, ax = plt.subplots()
     for model in models:
-        y_hat = pd.read_csv(f'result/{dataset}/{window}/{model}/{str(horizon)}/pred.csv').values
-        plt.plot(y_hat[:,idx], label=model)
-    plt.plot(y[:,idx], label='Truth')
-    plt.legend()
-    plt.title(f'{str(horizon)}th day prediction for {county}')
-    plt.savefig(f'figures/{out_filename}.png')
-    plt.close(1)
-    
-# models = ['dummy', 'arma', 'linear', 'colagnn', 'colagnn_noattn', 'colagnn_thresholding', 'colagnn_noattn_sci', 'colagnn_identityadj']
-
-models = ['dummy', 'arma', 'colagnn', 'colagnn_noattn', 'colagnn_noattn_sci', 'colagnn_identityadj']
-
-horizon = 7
-
-plot_multiple(dataset, 7, models, horizon, 'Los Angeles', '7-7-Comparison-LA.png')
-plot_multiple(dataset, 14, models, horizon, 'Los Angeles', '14-7-Comparison-LA.png')
-plot_multiple(dataset, 28, models, horizon, 'Los Angeles', '28-7-Comparison-LA.png')
-
-plot_multiple(dataset, 7, models, horizon, 'San Francisco', '7-7-Comparison-SF.png')
-plot_multiple(dataset, 14, models, horizon, 'San Francisco', '14-7-Comparison-SF.png')
-plot_multiple(dataset, 28, models, horizon, 'San Francisco', '28-7-Comparison-SF.png')
-# model = 'dummy'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'arma'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'colagnn'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'colagnn_noattn'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'colagnn_thresholding'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'colagnn_noattn_sci'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'colagnn_identityadj'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
-
-# model = 'linear'
-# plot(dataset, model, horizon, 'Los Angeles')
-# plot(dataset, model, horizon, 'San Francisco')
\ No newline at end of file
+        ax.plot(_results[window, model][1][:, idx], label=model)
+    ax.plot(_results[window, models[0]][0][:, idx], label='Truth')
+    ax.legend()
+    title = f'{models[0]} model ' if len(models) == 1 else ''
+    ax.set_title(f'{title}{horizon}th day prediction for {county}, window {window}')
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+def report(paths, out):
+    """All pngs as pages of one pdf."""
+    if os.path.dirname(out) and not os.path.exists(os.path.dirname(out)):
+        os.makedirs(os.path.dirname(out))
+    with PdfPages(out) as pdf:
+        for path in paths:
+            image = plt.imread(path)
+            fig = plt.figure(figsize=(image.shape[1] / 100., image.shape[0] / 100.), dpi=100)
+            fig.figimage(image)
+            pdf.savefig(fig)
+            plt.close(fig)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--source', type=str, default='result/results.db', help='results store or root of a csv result tree')
+    ap.add_argument('--dataset', type=str, default='ca48-548', help='')
+    ap.add_argument('--windows', type=int, nargs='+', default=[7, 14, 28], help='')
+    ap.add_argument('--models', type=str, nargs='+', default=MODELS, help='')
+    ap.add_argument('--horizon', type=int, default=7, help='')
+    ap.add_argument('--counties', type=str, nargs='*', default=[], help='county names or location indices, default all')
+    ap.add_argument('--out_dir', type=str, default='figures', help='')
+    ap.add_argument('--workers', type=int, default=0, help='rendering processes, default one per core')
+    ap.add_argument('--report', type=str, default='', help='also collect the figures in this pdf')
+    args = ap.parse_args(argv)
+
+    _results.update(load_results(args.source, args.dataset, args.windows, args.models, args.horizon))
+    if not _results:
+        raise LookupError('no {} results for windows {} models {} horizon {} in {}'.format(args.dataset, args.windows, args.models, args.horizon, args.source))
+    m = next(iter(_results.values()))[0].shape[1]
+    names = COUNTY if m == len(COUNTY) else [str(i) for i in range(m)]
+    counties = args.counties or names
+    tasks = []
+    for window in args.windows:
+        models = [model for model in args.models if (window, model) in _results]
+        missing = set(args.models) - set(models)
+        if missing:
+            print('window {}: no results of {}'.format(window, ', '.join(sorted(missing))))
+        if not models:
+            continue
+        if not os.path.exists(f'{args.out_dir}/{window}'):
+            os.makedirs(f'{args.out_dir}/{window}')
+        prefix = models[0] + '_' if len(models) == 1 else ''
+        for county in counties:
+            idx = names.index(county) if county in names else int(county)
+            tasks.append((window, models, args.horizon, county, idx, f'{args.out_dir}/{window}/{prefix}{args.horizon}_{county}.png'))
+
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and len(tasks) > 1:
+        with mp.get_context('fork').Pool(min(workers, len(tasks))) as pool:
+            paths = pool.map(render, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
+    else:
+        paths = [render(task) for task in tasks]
+    print('{} figures in {}'.format(len(paths), args.out_dir))
+    if args.report:
+        report(paths, args.report)
+        print('report', args.report)
+
+if __name__ == '__main__':
+    main()
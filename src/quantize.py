@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Dynamic int8 quantization of a trained checkpoint for CPU inference.
+# Quantizes the RNN encoder and the nn.Linear heads, compares the test metrics of train.py and the
+# forward latency/throughput against the float model, and exports the int8 model for infer.py.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, json, time, copy
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import quantize_dynamic
+
+from data import DataBasicLoader
+from options import get_parser, get_log_token
+from utils import evaluation_metrics, quantile_levels
+from export import InferenceModel, load_model, predict, export_module, get_meta
+
+class UnrolledRNN(nn.Module):
+    """nn.RNN (unidirectional, batch_first) as a loop of nn.RNNCell with the same weights.
+
+    Dynamic quantization supports nn.RNNCell but not nn.RNN, this lets the default --rnn_model RNN be quantized.
+    """
+    def __init__(self, rnn):
+        super().__init__()
+        assert rnn.batch_first and not rnn.bidirectional, 'only support batch_first unidirectional RNN'
+        self.cells = nn.ModuleList()
+        for layer in range(rnn.num_layers):
+            cell = nn.RNNCell(rnn.input_size if layer == 0 else rnn.hidden_size, rnn.hidden_size, bias=rnn.bias, nonlinearity=rnn.nonlinearity)
+            cell.weight_ih.data.copy_(getattr(rnn, 'weight_ih_l%d' % layer).data)
+            cell.weight_hh.data.copy_(getattr(rnn, 'weight_hh_l%d' % layer).data)
+            if rnn.bias:
+                cell.bias_ih.data.copy_(getattr(rnn, 'bias_ih_l%d' % layer).data)
+                cell.bias_hh.data.copy_(getattr(rnn, 'bias_hh_l%d' % layer).data)
+            self.cells.append(cell)
+
+    def forward(self, x, hx=None):
+        # x: [batch, time_step, input_size], dropout between layers is a no-op at inference
+        h_n = []
+        for cell in self.cells:
+            h = None
+            outputs = []
+            for t in range(x.size(1)):
+                h = cell(x[:, t, :], h)
+                outputs.append(h)
+            x = torch.stack(outputs, dim=1)
+            h_n.append(h)
+        return x, torch.stack(h_n, dim=0)
+
+def quantize_model(model):
+    """Return a dynamically quantized (int8 weights) copy of model for CPU inference."""
+    model = copy.deepcopy(model).cpu().eval()
+    if isinstance(getattr(model, 'rnn', None), nn.RNN):
+        model.rnn = UnrolledRNN(model.rnn)
+    return quantize_dynamic(model, {nn.RNNCell, nn.GRU, nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+def time_forward(model, X, batch_size, repeats=10):
+    """Median latency (seconds) of one forward on batches of batch_size, and throughput in windows per second."""
+    X = X[:batch_size]
+    with torch.no_grad():
+        model(X) # warm up
+        latency = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(X)
+            latency.append(time.perf_counter() - start)
+    latency = float(np.median(latency))
+    return latency, X.size(0) / latency
+
+if __name__ == '__main__':
+    ap = get_parser()
+    ap.add_argument('--repeats', type=int, default=20, help='timed forwards per batch size')
+    ap.add_argument('--threads', type=int, default=0, help='torch intra-op threads, 0 keeps the default')
+    ap.add_argument('--export_dir', type=str, default='export', help='dir path to save the int8 module and report')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, quantize.py uses point forecasts')
+    args.cuda = False # dynamic quantization runs on cpu only
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    data_loader = DataBasicLoader(args)
+    model = load_model(args, data_loader)
+    qmodel = quantize_model(model)
+    print(qmodel)
+
+    report = {'log_token': get_log_token(args), 'threads': torch.get_num_threads()}
+    X = data_loader.test[0]
+    for name, m in [('float', model), ('int8', qmodel)]:
+        y_true_states, y_pred_states = predict(m, data_loader, data_loader.test, args.batch)
+        mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluation_metrics(y_true_states, y_pred_states, data_loader.peak_thold)
+        report[name] = {'mae': float(mae), 'rmse': float(rmse), 'rmse_states': float(rmse_states), 'pcc': float(pcc), 'pcc_states': float(pcc_states), 'peak_mae': float(peak_mae)}
+        for batch_size in [1, args.batch]:
+            latency, throughput = time_forward(m, X, batch_size, args.repeats)
+            report[name]['latency_ms_b%d' % batch_size] = latency * 1000
+            report[name]['throughput_b%d' % batch_size] = throughput
+        print('{:5s} MAE {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} latency b1 {:7.3f}ms b{} {:7.3f}ms throughput {:9.1f} windows/s'.format(
+            name, mae, rmse, rmse_states, pcc, pcc_states, report[name]['latency_ms_b1'], args.batch,
+            report[name]['latency_ms_b%d' % args.batch], report[name]['throughput_b%d' % args.batch]))
+
+    if not os.path.exists(args.export_dir):
+        os.makedirs(args.export_dir)
+    path = '%s/%s.int8.ts' % (args.export_dir, get_log_token(args))
+    example = (torch.Tensor(data_loader.rawdat[:2 * args.window]).view(2, args.window, data_loader.m),)
+    meta = get_meta(args, data_loader)
+    meta['quantized'] = 'dynamic int8'
+    export_module(InferenceModel(qmodel, data_loader), example, path, meta, 'trace')
+    with open('%s/%s.int8.json' % (args.export_dir, get_log_token(args)), 'w') as f:
+        json.dump(report, f, indent=2)
+    print('exported', path)
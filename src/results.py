@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Results store: one sqlite file with a row per run (args, seed, git commit, metrics, timings) and the test
+# predictions of the run as typed arrays, replacing the result/<dataset>/<window>/<model>/<horizon>/{true,pred}.csv
+# tree and the run_log.txt lines for comparisons and plots.
+#
+#   python results.py --dataset ca48-548 --model colagnn          list the matching runs
+#   python results.py --import_csv result                         load an existing csv tree into the store
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, io, json, time, sqlite3, argparse, subprocess
+import numpy as np
+import pandas as pd
+
+SCHEMA = '''
+create table if not exists runs (
+    id integer primary key autoincrement,
+    log_token text, dataset text, window integer, model text, horizon integer, multi_horizon integer,
+    seed integer, git_commit text, created real, args text, metrics text, timings text);
+create index if not exists runs_key on runs (dataset, window, model, horizon);
+create table if not exists predictions (
+    run_id integer references runs (id), horizon integer, y_true blob, y_pred blob,
+    primary key (run_id, horizon));
+'''
+
+RUN_COLUMNS = ['id', 'log_token', 'dataset', 'window', 'model', 'horizon', 'multi_horizon', 'seed', 'git_commit', 'created']
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def to_blob(array):
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(array), allow_pickle=False)
+    return buf.getvalue()
+
+def from_blob(blob):
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+class ResultStore(object):
+    """sqlite store of runs and their test predictions ([n_samples, m] arrays per horizon)."""
+    def __init__(self, path='result/results.db'):
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60) # parallel sweep runs wait for the write lock
+        self.db.executescript(SCHEMA)
+
+    def add_run(self, args, metrics, timings=None, log_token='', commit=None, predictions=None):
+        """Record a run. predictions: {horizon: (y_true, y_pred)}. Returns the run id."""
+        with self.db:
+            cur = self.db.execute(
+                'insert into runs (log_token, dataset, window, model, horizon, multi_horizon, seed, git_commit, created, args, metrics, timings) '
+                'values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (log_token, args.dataset, args.window, args.model, args.horizon, int(getattr(args, 'multi_horizon', False)),
+                 args.seed, commit or git_commit(), time.time(), json.dumps(vars(args)), json.dumps(metrics), json.dumps(timings or {})))
+            run_id = cur.lastrowid
+            for horizon, (y_true, y_pred) in (predictions or {}).items():
+                self.db.execute('insert into predictions values (?, ?, ?, ?)', (run_id, horizon, to_blob(y_true), to_blob(y_pred)))
+        return run_id
+
+    def runs(self, latest=False, **filters):
+        """Runs matching the column filters (a value or a list of values), as a DataFrame with the metrics
+        expanded to columns. latest: only the most recent run per (dataset, window, model, horizon, multi_horizon)."""
+        where, params = [], []
+        for k, v in filters.items():
+            if v is None:
+                continue
+            if k not in RUN_COLUMNS:
+                raise LookupError('can not filter runs on {}, one of {}'.format(k, RUN_COLUMNS))
+            v = list(v) if isinstance(v, (list, tuple, set)) else [v]
+            where.append('%s in (%s)' % (k, ','.join('?' * len(v))))
+            params += v
+        query = 'select %s, metrics, timings from runs' % ', '.join(RUN_COLUMNS)
+        if where:
+            query += ' where ' + ' and '.join(where)
+        rows = self.db.execute(query + ' order by id', params).fetchall()
+        df = pd.DataFrame([r[:len(RUN_COLUMNS)] for r in rows], columns=RUN_COLUMNS)
+        metrics = pd.DataFrame([json.loads(r[-2]) for r in rows], index=df.index)
+        timings = pd.DataFrame([json.loads(r[-1]) for r in rows], index=df.index)
+        df = pd.concat([df, metrics, timings], axis=1)
+        if latest and len(df):
+            df = df.drop_duplicates(['dataset', 'window', 'model', 'horizon', 'multi_horizon'], keep='last')
+        return df
+
+    def args(self, run_id):
+        return json.loads(self.db.execute('select args from runs where id = ?', (run_id,)).fetchone()[0])
+
+    def predictions(self, run_ids, horizon=None):
+        """{(run_id, horizon): (y_true, y_pred)} of the given runs, all horizons unless horizon is set."""
+        run_ids = list(run_ids)
+        if not run_ids:
+            return {}
+        query = 'select run_id, horizon, y_true, y_pred from predictions where run_id in (%s)' % ','.join('?' * len(run_ids))
+        params = run_ids
+        if horizon is not None:
+            query += ' and horizon = ?'
+            params = run_ids + [horizon]
+        return {(r[0], r[1]): (from_blob(r[2]), from_blob(r[3])) for r in self.db.execute(query, params)}
+
+    def load(self, dataset, windows=None, models=None, horizon=None, multi_horizon=False):
+        """Test predictions of the latest run of every (window, model) in one query:
+        {(window, model, horizon): (y_true, y_pred)}. Multi horizon runs give one entry per horizon."""
+        runs = self.runs(latest=True, dataset=dataset, window=windows, model=models, multi_horizon=int(multi_horizon),
+                         horizon=None if multi_horizon else horizon)
+        keys = {r.id: (r.window, r.model) for r in runs.itertuples()}
+        return {keys[run_id] + (h,): v for (run_id, h), v in self.predictions(keys, horizon).items()}
+
+    def import_csv(self, root='result'):
+        """Load a result/<dataset>/<window>/<model>/<horizon>/{true,pred}.csv tree, one run per leaf
+        (model dirs ending in _multi become one multi horizon run)."""
+        n = 0
+        for dataset in sorted(os.listdir(root)):
+            for window in sorted(filter(str.isdigit, os.listdir(os.path.join(root, dataset))) if os.path.isdir(os.path.join(root, dataset)) else []):
+                for model in sorted(os.listdir(os.path.join(root, dataset, window))):
+                    path = os.path.join(root, dataset, window, model)
+                    leaves = {int(h): os.path.join(path, h) for h in os.listdir(path) if h.isdigit()
+                              and os.path.exists(os.path.join(path, h, 'pred.csv'))}
+                    if not leaves:
+                        continue
+                    read = lambda p: (pd.read_csv(p + '/true.csv').values, pd.read_csv(p + '/pred.csv').values)
+                    multi = model.endswith('_multi')
+                    runs = [(max(leaves), {h: read(p) for h, p in leaves.items()})] if multi else [(h, {h: read(p)}) for h, p in leaves.items()]
+                    for horizon, predictions in runs:
+                        args = argparse.Namespace(dataset=dataset, window=int(window), model=model[:-len('_multi')] if multi else model,
+                                                  horizon=horizon, multi_horizon=multi, seed=None)
+                        self.add_run(args, {}, {'imported_from': path}, commit='csv', predictions=predictions)
+                        n += 1
+        return n
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--db', type=str, default='result/results.db', help='')
+    ap.add_argument('--import_csv', type=str, default='', help='csv result tree to load into the store')
+    ap.add_argument('--dataset', type=str, nargs='*', default=None, help='')
+    ap.add_argument('--window', type=int, nargs='*', default=None, help='')
+    ap.add_argument('--model', type=str, nargs='*', default=None, help='')
+    ap.add_argument('--horizon', type=int, nargs='*', default=None, help='')
+    ap.add_argument('--latest', action='store_true', default=False, help='only the latest run per configuration')
+    args = ap.parse_args()
+    store = ResultStore(args.db)
+    if args.import_csv:
+        print('imported {} runs from {}'.format(store.import_csv(args.import_csv), args.import_csv))
+    runs = store.runs(latest=args.latest, dataset=args.dataset, window=args.window, model=args.model, horizon=args.horizon)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(runs.drop(columns=['created']))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Micro-batching of forecast requests. Each request is one input window for one module; the requests
+# pending within max_wait are grouped by module and window shape, each group runs as a single batched
+# forward and every caller gets its row back.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import asyncio, threading, collections
+import numpy as np
+import torch
+
+class MicroBatchScheduler(object):
+    """asyncio scheduler, `await forecast(key, x)` from the loop or `submit(key, x)` from any thread.
+
+    modules: dict key -> callable taking a [b, window, m] tensor and returning [b, ...].
+    max_wait: seconds the first pending request waits for others to join its batch.
+    max_batch: a batch is run as soon as this many requests are pending.
+    """
+    def __init__(self, modules, max_wait=0.002, max_batch=256):
+        self.modules = modules
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.pending = []
+        self.timer = None
+        self.forwards = collections.Counter()
+        self.batched = collections.Counter() # requests served per module
+        self.loop = None
+
+    def start(self):
+        """Run the event loop in a daemon thread, for callers outside asyncio."""
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self
+
+    def submit(self, key, x):
+        """Thread safe, returns a concurrent.futures.Future of the forecast of window x [window, m]."""
+        return asyncio.run_coroutine_threadsafe(self.forecast(key, x), self.loop)
+
+    async def forecast(self, key, x):
+        if key not in self.modules:
+            raise LookupError('can not find the module {}'.format(key))
+        loop = asyncio.get_running_loop()
+        self.loop = self.loop or loop
+        future = loop.create_future()
+        self.pending.append((key, np.asarray(x, dtype=np.float32), future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        groups = collections.defaultdict(list)
+        for key, x, future in batch:
+            groups[(key, x.shape)].append((x, future))
+        for (key, _), requests in groups.items():
+            try:
+                X = torch.from_numpy(np.stack([x for x, _ in requests]))
+                with torch.no_grad():
+                    out = self.modules[key](X).cpu().numpy()
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.forwards[key] += 1
+            self.batched[key] += len(requests)
+            for i, (_, future) in enumerate(requests):
+                if not future.done(): # the caller may have been cancelled
+                    future.set_result(out[i])
+
+    def stats(self):
+        return {key: {'forwards': self.forwards[key], 'requests': self.batched[key],
+                      'mean_batch': self.batched[key] / self.forwards[key] if self.forwards[key] else None}
+                for key in self.modules}
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# Local forecast server for modules exported by export.py.
+# Loads the modules once, keeps the latest smoothed series of each dataset in memory and answers
+#   GET  /forecast?model=<model or log_token>&horizon=H&fips=6037,6075   next H days for these locations
+#                 &origin=d                                           optional, forecast from day d instead of the latest
+#   GET  /models                                                         loaded modules
+#   GET  /stats                                                          request count and p50/p99 latency
+#   POST /append?dataset=<dataset>  body: csv rows of new days            append days to the in-memory series
+#   POST /reload?path=export/<log_token>.ts                              promote a new export of a loaded or new module
+# Concurrent requests are micro-batched by scheduler.py, one forward per module and window shape, and the
+# results are cached by forecast_cache.py until the data or the checkpoint changes.
+#
+#   python serve.py --paths export/colagnn.ca48-548.w-7.h-1-7.RNN.ts --fips ca48-fips
+#   python serve.py --paths export/*.ts --bench 500      (local latency benchmark, no server left running)
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import argparse, json, time, threading, collections
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+import numpy as np
+
+from infer import load_inference_module
+from scheduler import MicroBatchScheduler
+from forecast_cache import ForecastCache, file_hash, make_key
+from utils import movemedian_6, movemean_7, smooth_tail, SMOOTH_HALF_WINDOW
+
+class SeriesStore(object):
+    """Raw and smoothed series of one dataset, the latest windows are read from here."""
+    def __init__(self, dataset, smoothf):
+        self.dataset = dataset
+        self.smoothf = smoothf
+        self.raw = np.loadtxt(open("../data/ts/{}.txt".format(dataset)), delimiter=',', ndmin=2)
+        self.smoothed = eval(smoothf)(self.raw) if smoothf != "none" else self.raw
+        self.lock = threading.Lock()
+
+    @property
+    def n(self):
+        return self.raw.shape[0] # version of the data, grows with every appended day
+
+    def windows(self, Ps, origin=None):
+        """Windows of the lengths Ps forecasting from origin (first day not observed yet, default the day after
+        the last one), all from the same version of the data, and that version."""
+        with self.lock:
+            origin = self.n if origin is None else origin
+            if origin < max(Ps) or origin > self.n:
+                raise ValueError('origin must be in [{}, {}]'.format(max(Ps), self.n))
+            return [self.smoothed[origin-P:origin] for P in Ps], self.n
+
+    def append(self, rows):
+        if rows.ndim != 2 or rows.shape[1] != self.raw.shape[1]:
+            raise ValueError('rows of {} values expected, got shape {}'.format(self.raw.shape[1], rows.shape))
+        with self.lock:
+            n_old = self.n
+            raw = np.concatenate([self.raw, rows], axis=0)
+            if self.smoothf != "none":
+                self.smoothed = smooth_tail(eval(self.smoothf), raw, self.smoothed, max(0, n_old - SMOOTH_HALF_WINDOW))
+            else:
+                self.smoothed = raw
+            self.raw = raw
+            return self.n
+
+class ForecastService(object):
+    def __init__(self, paths, fips=None, max_wait=0.002, max_batch=256, cache_size=4096, cache_ttl=0):
+        self.stores = {}
+        self.metas = {}
+        self.checkpoints = {}
+        self.scheduler = MicroBatchScheduler({}, max_wait, max_batch).start()
+        self.cache = ForecastCache(cache_size, cache_ttl)
+        for path in paths:
+            self.load(path)
+        self.fips = fips
+        self.latency = collections.deque(maxlen=10000)
+
+    def load(self, path):
+        """Load (or promote a new version of) an exported module, dropping the forecasts of the one it replaces."""
+        module, meta = load_inference_module(path)
+        key = meta['log_token']
+        if meta['dataset'] not in self.stores:
+            self.stores[meta['dataset']] = SeriesStore(meta['dataset'], meta['smoothf'])
+        self.scheduler.modules[key] = module
+        self.metas[key] = meta
+        old, self.checkpoints[key] = self.checkpoints.get(key), file_hash(path)
+        dropped = self.cache.invalidate(checkpoint=old) if old is not None else 0
+        print('loaded', path, self.checkpoints[key], 'dropped {} cached forecasts'.format(dropped) if old else '')
+        return {'log_token': key, 'checkpoint': self.checkpoints[key], 'dropped': dropped}
+
+    def append(self, dataset, rows):
+        version = self.stores[dataset].append(rows)
+        return {'dataset': dataset, 'version': version, 'dropped': self.cache.invalidate(dataset=dataset)}
+
+    def horizons(self, meta):
+        return list(range(1, meta['horizon'] + 1)) if meta.get('multi_horizon') else [meta['horizon']]
+
+    def resolve(self, model, horizon):
+        """Modules answering `model` for days 1..horizon: a log_token of a multi horizon module covering the
+        horizon or of a single horizon module of exactly this horizon, or a model name served by one multi
+        horizon module covering the horizon or by single horizon modules for every day."""
+        if model in self.metas:
+            meta = self.metas[model]
+            served = self.horizons(meta)
+            if served[-1] < horizon if meta.get('multi_horizon') else served != [horizon]:
+                raise LookupError('module {} forecasts days {}, asked for horizon {}'.format(model, served, horizon))
+            return [model]
+        candidates = [k for k, meta in self.metas.items() if meta['model'] == model]
+        for k in candidates:
+            if self.metas[k].get('multi_horizon') and self.metas[k]['horizon'] >= horizon:
+                return [k]
+        single = {self.metas[k]['horizon']: k for k in candidates if not self.metas[k].get('multi_horizon')}
+        if all(h in single for h in range(1, horizon + 1)):
+            return [single[h] for h in range(1, horizon + 1)]
+        raise LookupError('no module for model {} up to horizon {}'.format(model, horizon))
+
+    def locations(self, fips):
+        if not fips:
+            return None
+        codes = [int(f) for f in fips.split(',')]
+        if self.fips is None:
+            return codes # column indices
+        return [self.fips.index(c) for c in codes]
+
+    def forecast(self, model, horizon, fips='', origin=None):
+        start = time.perf_counter()
+        keys = self.resolve(model, horizon)
+        idx = self.locations(fips)
+        dataset = self.metas[keys[0]]['dataset']
+        windows, version = self.stores[dataset].windows([self.metas[k]['window'] for k in keys], origin)
+        cache_key = make_key([self.checkpoints[k] for k in keys], dataset, version,
+                             version if origin is None else origin, horizon, fips.split(',') if fips else None)
+        result = self.cache.get(cache_key)
+        if result is not None:
+            self.latency.append(time.perf_counter() - start)
+            return result
+        futures = [self.scheduler.submit(key, window) for key, window in zip(keys, windows)]
+        forecasts = {}
+        for key, future in zip(keys, futures):
+            out = future.result()
+            out = out.reshape(-1, out.shape[-1]) # [horizons, m]
+            for k, h in enumerate(self.horizons(self.metas[key])):
+                if h <= horizon:
+                    forecasts[h] = (out[k] if idx is None else out[k, idx]).tolist()
+        locations = fips.split(',') if fips else list(range(len(forecasts[1 if 1 in forecasts else horizon])))
+        result = {'model': model, 'version': version, 'origin': version if origin is None else origin, 'locations': locations,
+                  'forecast': [forecasts[h] for h in sorted(forecasts)], 'horizons': sorted(forecasts)}
+        self.cache.put(cache_key, result)
+        self.latency.append(time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        latency = np.array(self.latency) * 1000
+        return {'requests': len(latency),
+                'p50_ms': float(np.percentile(latency, 50)) if len(latency) else None,
+                'p99_ms': float(np.percentile(latency, 99)) if len(latency) else None,
+                'modules': self.scheduler.stats(), 'cache': self.cache.stats()}
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == '/forecast':
+                    self._reply(200, service.forecast(q['model'], int(q.get('horizon', 1)), q.get('fips', ''),
+                                                        int(q['origin']) if 'origin' in q else None))
+                elif url.path == '/models':
+                    self._reply(200, service.metas)
+                elif url.path == '/stats':
+                    self._reply(200, service.stats())
+                else:
+                    self._reply(404, {'error': 'unknown path'})
+            except (LookupError, ValueError) as e:
+                self._reply(400, {'error': str(e)})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == '/reload' and 'path' in q:
+                try:
+                    return self._reply(200, service.load(q['path']))
+                except (OSError, RuntimeError) as e:
+                    return self._reply(400, {'error': str(e)})
+            if url.path != '/append' or q.get('dataset') not in service.stores:
+                return self._reply(404, {'error': 'unknown path or dataset'})
+            try:
+                body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+                rows = np.array([[float(v) for v in line.split(',')] for line in body.strip().splitlines()])
+                result = service.append(q['dataset'], rows)
+            except (ValueError, TypeError) as e:
+                return self._reply(400, {'error': str(e)})
+            self._reply(200, result)
+
+        def log_message(self, format, *args):
+            pass # keep the console for the startup and benchmark output
+    return Handler
+
+class ForecastServer(ThreadingHTTPServer):
+    request_queue_size = 128 # the default 5 drops connections of concurrent clients
+
+def bench(url, model, horizon, origins, n_requests, concurrency):
+    """Fire n_requests concurrent GET /forecast at url from random origins, returns the client side latencies in ms."""
+    origins = np.random.RandomState(0).choice(origins, n_requests)
+    def one(i):
+        start = time.perf_counter()
+        urlopen('%s/forecast?model=%s&horizon=%d&origin=%d' % (url, model, horizon, origins[i])).read()
+        return (time.perf_counter() - start) * 1000
+    with ThreadPoolExecutor(concurrency) as pool:
+        return np.array(list(pool.map(one, range(n_requests))))
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--paths', type=str, nargs='+', required=True, help='exported modules (export/<log_token>.ts, .pt2 or .onnx)')
+    ap.add_argument('--fips', type=str, default='', help='FIPS of the dataset columns (../data/fips/<fips>.txt), default column indices')
+    ap.add_argument('--host', type=str, default='127.0.0.1', help='')
+    ap.add_argument('--port', type=int, default=8000, help='')
+    ap.add_argument('--max_wait', type=float, default=2, help='ms to wait for concurrent requests to batch')
+    ap.add_argument('--max_batch', type=int, default=256, help='run a batch as soon as this many requests are pending')
+    ap.add_argument('--cache_size', type=int, default=4096, help='cached forecasts, 0 disables the cache')
+    ap.add_argument('--cache_ttl', type=float, default=0, help='seconds a cached forecast is kept, 0 until invalidated')
+    ap.add_argument('--bench', type=int, default=0, help='run this many local requests (random origins of the last 60 days), print p50/p99 latency and exit')
+    ap.add_argument('--concurrency', type=int, default=16, help='concurrent clients of --bench')
+    args = ap.parse_args()
+
+    fips = [int(f) for f in np.loadtxt(open('../data/fips/{}.txt'.format(args.fips)), ndmin=1)] if args.fips else None
+    service = ForecastService(args.paths, fips, args.max_wait / 1000., args.max_batch, args.cache_size, args.cache_ttl)
+    server = ForecastServer((args.host, args.port), make_handler(service))
+    if args.bench:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        meta = next(iter(service.metas.values()))
+        url = 'http://%s:%d' % (args.host, server.server_address[1])
+        n = service.stores[meta['dataset']].n
+        latency = bench(url, meta['log_token'], meta['horizon'], range(n - 60, n + 1), args.bench, args.concurrency)
+        print('client p50 {:.2f}ms p99 {:.2f}ms'.format(np.percentile(latency, 50), np.percentile(latency, 99)))
+        print('server', json.dumps(service.stats()))
+        server.shutdown()
+    else:
+        print('serving on http://%s:%d' % (args.host, server.server_address[1]))
+        server.serve_forever()
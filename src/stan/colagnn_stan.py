@@ -27,9 +27,7 @@ class ColaGNN_STAN(nn.Module):
         #     self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense().cuda()
         # else:
         #     self.adj = sparse_mx_to_torch_sparse_tensor(normalize_adj2(data.orig_adj.cpu().numpy())).to_dense()
-        self.adj = torch.eye(self.m)
-        if args.cuda:
-            self.adj = self.adj.cuda()
+        self.register_buffer('adj', torch.eye(self.m), persistent=False)
         self.dropout = args.dropout
         self.n_hidden = args.n_hidden
         half_hid = int(self.n_hidden/2)
@@ -98,26 +96,15 @@ class ColaGNN_STAN(nn.Module):
         last_hid = r_out[:,-1,:]
         last_hid = last_hid.view(-1,self.m, self.n_hidden)
         out_temporal = last_hid  # [b, m, 20]
-        hid_rpt_m = last_hid.repeat(1,self.m,1).view(b,self.m,self.m,self.n_hidden) # b,m,m,w continuous m
-        hid_rpt_w = last_hid.repeat(1,1,self.m).view(b,self.m,self.m,self.n_hidden) # b,m,m,w continuous w one window data
         # a_mx = self.act( hid_rpt_m @ self.W1.t()  + hid_rpt_w @ self.W2.t() + self.b1 ) @ self.V + self.bv # row, all states influence one state 
         # a_mx = F.normalize(a_mx, p=2, dim=1, eps=1e-12, out=None)
-        r_l = []
-        r_long_l = []
-        h_mids = orig_x
-        for i in range(self.m):
-            h_tmp = h_mids[:,:,i:i+1].permute(0,2,1).contiguous() 
-            r = self.conv(h_tmp) # [32, 10/k, 1]
-            r_long = self.conv_long(h_tmp)
-            r_l.append(r)
-            r_long_l.append(r_long)
-        r_l = torch.stack(r_l,dim=1)
-        r_long_l = torch.stack(r_long_l,dim=1)
-        r_l = torch.cat((r_l,r_long_l),-1)
-        r_l = r_l.view(r_l.size(0),r_l.size(1),-1)
+        h_mids = orig_x.permute(0,2,1).contiguous().view(-1, 1, w) # [b*m, 1, w] kernels are shared by all locations
+        r = self.conv(h_mids) # [b*m, 10/k, 1]
+        r_long = self.conv_long(h_mids)
+        r_l = torch.cat((r,r_long),-1)
+        r_l = r_l.view(b,self.m,-1)
         r_l = torch.relu(r_l)
-        adjs = self.adj.repeat(b,1)
-        adjs = adjs.view(b,self.m, self.m)
+        adjs = self.adj.expand(b, self.m, self.m)
         # c = torch.sigmoid(a_mx @ self.Wb + self.wb)
         # a_mx = adjs * c + a_mx * (1-c) 
         # adj = a_mx 
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Export a trained ColaGNN_STAN checkpoint as a TorchScript module (see ../export.py for the ColaGNN models).
+# The dI loader is rebuilt from ts.txt (written by train.py) to get m and the normalization of the new cases.
+
+import os, sys, json, argparse
+import numpy as np
+import torch
+import torch.nn as nn
+
+from colagnn_stan import ColaGNN_STAN
+from data import DataBasicLoader
+
+class STANInferenceModel(nn.Module):
+    """Takes the normalized (x, I, R) windows of the three loaders in train.py, returns (dI, new_I, new_R).
+
+    dI is returned in case counts, new_I and new_R stay normalized like the loader targets.
+    """
+    def __init__(self, model, data):
+        super().__init__()
+        self.model = model
+        self.register_buffer('min', torch.Tensor(data.min))
+        self.register_buffer('max', torch.Tensor(data.max))
+
+    def forward(self, x, I, R):
+        out, new_I, new_R = self.model(x, I, R)
+        out = out.reshape(x.size(0), -1)
+        return out * (self.max - self.min) + self.min, new_I, new_R
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from export import check_parity # ../export.py, found before this file
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--dataset', type=str, default='ca48-548', help="Dataset string")
+    ap.add_argument('--sim_mat', type=str, default='ca48-adj', help="adjacency matrix filename (*-adj.txt)")
+    ap.add_argument('--n_layer', type=int, default=1, help="number of layers (default 1)")
+    ap.add_argument('--n_hidden', type=int, default=20, help="rnn hidden states (could be set as any value)")
+    ap.add_argument('--dropout', type=float, default=0.2, help='dropout rate usually 0.2-0.5.')
+    ap.add_argument('--train', type=float, default=.7, help="Training ratio (0, 1)")
+    ap.add_argument('--val', type=float, default=.15, help="Validation ratio (0, 1)")
+    ap.add_argument('--model', default='colagnn_stan', help='Model to use')
+    ap.add_argument('--rnn_model', default='RNN', choices=['LSTM','RNN','GRU'], help='')
+    ap.add_argument('--window', type=int, default=28, help='')
+    ap.add_argument('--horizon', type=int, default=5, help='leadtime default 1')
+    ap.add_argument('--save_dir', type=str,  default='save',help='dir path to save the final model')
+    ap.add_argument('--bi', action='store_true', default=False,  help='bidirectional default false')
+    ap.add_argument('--k', type=int, default=10,  help='kernels')
+    ap.add_argument('--smoothf', type=str, default="movemean_7", choices=['movemean_7', 'none'], help='util function used to smooth the input time series data')
+    ap.add_argument('--export_dir', type=str, default='export', help='dir path to save the inference module')
+    ap.add_argument('--rtol', type=float, default=1e-4, help='max relative difference allowed on the test split')
+    args = ap.parse_args()
+    args.cuda = False
+
+    log_token = '%s.%s.w-%s.h-%s.%s' % (args.model, args.dataset, args.window, args.horizon, args.rnn_model)
+
+    dI_data_loader = DataBasicLoader(args, np.loadtxt(open('ts.txt'), delimiter=','), load_adj=True)
+    model = ColaGNN_STAN(args, dI_data_loader)
+    with open('%s/%s.pt' % (args.save_dir, log_token), 'rb') as f:
+        model.load_state_dict(torch.load(f, map_location='cpu'))
+    module = STANInferenceModel(model, dI_data_loader).eval()
+
+    if not os.path.exists(args.export_dir):
+        os.makedirs(args.export_dir)
+    path = '%s/%s.ts' % (args.export_dir, log_token)
+    example = torch.rand(2, args.window, dI_data_loader.m)
+    meta = {'model': args.model, 'dataset': args.dataset, 'window': args.window, 'horizon': args.horizon,
+            'rnn_model': args.rnn_model, 'smoothf': args.smoothf, 'm': dI_data_loader.m, 'log_token': log_token}
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(module, (example, example, example)))
+    torch.jit.save(scripted, path, _extra_files={'meta.json': json.dumps(meta)})
+    print('exported', path)
+
+    # I and R are not written by train.py, the dI test windows stand in for them in the parity check
+    X = dI_data_loader.test[0]
+    check_parity(module, torch.jit.load(path), dI_data_loader, args.rtol, inputs=(X, X, X))
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Subgraph inference: forecast a few locations by running a ColaGNN-family model only on the k-hop
+# neighborhood of the requested nodes (node_forward slices the node-indexed adjacency and attention
+# weights Wb). The temporal encoder, the location attention and the graph convolutions see the induced
+# subgraph only, so nodes outside it no longer contribute; the approximation error against the
+# full-graph forward is reported per number of hops.
+#
+#   python subgraph.py --fips 6037,6075 --fips_file ca48-fips --hops 1 2 3
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import time
+import numpy as np
+import torch
+from torch.func import functional_call
+
+from data import DataBasicLoader
+from export import load_model
+from models.layers import neighbor_candidates
+
+def hop_graph(model, name=''):
+    """Weighted graph the hops are taken on: the model's adjacency, or ../data/adj/<name>.txt (sci:<name> for ../data/sci)."""
+    if not name:
+        adj = model.adj.cpu().numpy()
+    elif name.startswith('sci:'):
+        adj = np.loadtxt(open("../data/sci/{}.txt".format(name[4:])), delimiter=',')
+    else:
+        adj = np.loadtxt(open("../data/adj/{}.txt".format(name)), delimiter=',')
+    return adj
+
+def k_hop_nodes(graph, nodes, k, topk=0):
+    """Sorted indices of the nodes within k hops of nodes. topk > 0 keeps only the topk strongest
+    edges of every node, for dense graphs such as SCI."""
+    graph = np.asarray(graph)
+    if topk > 0:
+        keep = np.argsort(-graph, axis=1)[:, :topk]
+        graph = np.zeros(graph.shape, dtype=bool)
+        np.put_along_axis(graph, keep, True, axis=1)
+    graph = (graph != 0) | (graph.T != 0)
+    reached = np.zeros(graph.shape[0], dtype=bool)
+    reached[nodes] = True
+    for _ in range(k):
+        reached = reached | graph[reached].any(axis=0)
+    return np.flatnonzero(reached)
+
+def node_forward(model, x, nodes):
+    """Forward of a ColaGNN-family model on the windows x [b, window, len(nodes)] of nodes only. The
+    node-indexed tensors are sliced from the model itself, so gradients reach its full Wb (for training)."""
+    if not hasattr(model, 'adj'):
+        raise LookupError('subgraph inference only supports the ColaGNN models')
+    idx = torch.as_tensor(nodes, dtype=torch.long, device=model.adj.device)
+    tensors = {'adj': model.adj[idx][:, idx]}
+    if hasattr(model, 'Wb'):
+        tensors['Wb'] = model.Wb[idx][:, idx]
+    if getattr(model, 'attn_candidates', None) is not None:
+        tensors['attn_candidates'] = neighbor_candidates(tensors['adj'])
+    out, _ = functional_call(model, tensors, (x,)) # the forward takes the number of nodes from x
+    return out.reshape(x.size(0), -1, len(nodes)) # [b, 1 or h, len(nodes)]
+
+def subgraph_forecast(model, X, nodes, hops, graph, topk=0):
+    """Forecast of nodes [b, len(nodes)] (or [b, h, len(nodes)]) from the k-hop subgraph, and its size."""
+    sub_nodes = k_hop_nodes(graph, nodes, hops, topk)
+    pos = np.searchsorted(sub_nodes, nodes)
+    with torch.no_grad():
+        out = node_forward(model, X[:, :, sub_nodes], sub_nodes)[:, :, pos]
+    return out.squeeze(1) if not model.multi_horizon else out, len(sub_nodes)
+
+if __name__ == '__main__':
+    from options import get_parser
+    from utils import quantile_levels
+    ap = get_parser()
+    ap.add_argument('--nodes', type=str, default='14,29', help='column indices of the requested locations (default Los Angeles, San Francisco)')
+    ap.add_argument('--fips', type=str, default='', help='FIPS of the requested locations, mapped with --fips_file instead of --nodes')
+    ap.add_argument('--fips_file', type=str, default='ca48-fips', help='FIPS of the dataset columns (../data/fips/<fips_file>.txt)')
+    ap.add_argument('--hops', type=int, nargs='+', default=[1, 2, 3], help='neighborhood sizes to compare')
+    ap.add_argument('--hop_graph', type=str, default='', help='graph for the hops, default the model adjacency; ../data/adj name or sci:<name>')
+    ap.add_argument('--hop_topk', type=int, default=0, help='keep only the top-k edges per node of the hop graph (for SCI)')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, subgraph.py uses point forecasts')
+    args.cuda = False
+
+    data_loader = DataBasicLoader(args)
+    model = load_model(args, data_loader)
+    if args.fips:
+        fips = [int(f) for f in np.loadtxt(open('../data/fips/{}.txt'.format(args.fips_file)), ndmin=1)]
+        nodes = [fips.index(int(f)) for f in args.fips.split(',')]
+    else:
+        nodes = [int(i) for i in args.nodes.split(',')]
+    nodes = sorted(set(nodes))
+    graph = hop_graph(model, args.hop_graph)
+
+    X, Y = data_loader.test
+    scale = data_loader.max - data_loader.min
+    start = time.perf_counter()
+    with torch.no_grad():
+        full, _ = model(X)
+    full_time = time.perf_counter() - start
+    full = full.reshape(X.size(0), -1, data_loader.m)[:, :, nodes]
+    full = full.squeeze(1) if not args.multi_horizon else full
+    full_states = full.numpy() * scale[nodes] + data_loader.min[nodes]
+    true_states = Y.reshape(full.shape[0], -1, data_loader.m)[:, :, nodes].reshape(full.shape).numpy() * scale[nodes] + data_loader.min[nodes]
+    print('nodes {} of {}, {} test windows, full graph forward {:.2f}ms, MAE {:.4f}'.format(
+        nodes, data_loader.m, X.size(0), full_time * 1000, np.abs(full_states - true_states).mean()))
+
+    for hops in args.hops:
+        start = time.perf_counter()
+        sub, size = subgraph_forecast(model, X, nodes, hops, graph, args.hop_topk)
+        sub_time = time.perf_counter() - start
+        sub_states = sub.numpy() * scale[nodes] + data_loader.min[nodes]
+        err = np.abs(sub_states - full_states)
+        print('hops {:2d}|nodes {:4d}|time {:8.2f}ms|max abs err vs full {:10.4f}|mean rel err {:8.4f}|MAE {:.4f}'.format(
+            hops, size, sub_time * 1000, err.max(), (err / (np.abs(full_states) + 1)).mean(), np.abs(sub_states - true_states).mean()))
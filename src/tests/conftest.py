@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+# The scripts import each other as top level modules from src/, run the tests from src/:
+#
+#   python -m pytest -q tests
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
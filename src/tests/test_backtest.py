@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import torch
+
+from backtest import origin_splits
+
+def target_days(split):
+    return split[1].tolist()
+
+def test_origin_splits():
+    data = argparse.Namespace(P=5, h=2)
+    offset = data.P + data.h - 1
+    days = torch.arange(offset, 40) # samples[i] holds the target day of window i
+    origin, val_days, step = 30, 4, 3
+    train, val, test = origin_splits(data, (days, days), origin, val_days, step)
+    assert target_days(train) == list(range(offset, origin - val_days))
+    assert target_days(val) == list(range(origin - val_days, origin))
+    # the first test window ends on day origin-1, the last observed day
+    assert target_days(test) == list(range(origin + data.h - 1, origin + data.h - 1 + step))
+    assert all(split[0].tolist() == split[1].tolist() for split in (train, val, test))
+
+def test_origin_splits_clipped_to_samples():
+    data = argparse.Namespace(P=5, h=1)
+    days = torch.arange(5, 20)
+    train, val, test = origin_splits(data, (days, days), 18, 2, 7)
+    assert target_days(train) == list(range(5, 16))
+    assert target_days(test) == [18, 19]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import forecast_cache
+from forecast_cache import ForecastCache, make_key
+
+def test_make_key_keeps_fips_order():
+    key = make_key(['abc'], 'ca48', 1, 100, 2, [6001, 6037])
+    assert key == make_key(('abc',), 'ca48', 1, 100, 2, (6001, 6037))
+    assert key != make_key(['abc'], 'ca48', 1, 100, 2, [6037, 6001])
+    assert make_key(['abc'], 'ca48', 1, 100, 2, None) != key
+    hash(key)
+
+def test_lru_eviction():
+    cache = ForecastCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1 # b is now the least recently used
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 1, 1)
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(forecast_cache.time, 'monotonic', lambda: now[0])
+    cache = ForecastCache(ttl=10)
+    cache.put('a', 1)
+    now[0] += 10
+    assert cache.get('a') == 1
+    now[0] += 1
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+def test_invalidate():
+    cache = ForecastCache()
+    cache.put(make_key(['ck1'], 'ca48', 1, 100, 2, None), 1)
+    cache.put(make_key(['ck2'], 'ca48', 1, 100, 2, None), 2)
+    cache.put(make_key(['ck2'], 'us', 1, 100, 2, None), 3)
+    assert cache.invalidate(checkpoint='ck1') == 1
+    assert cache.invalidate(dataset='ca48') == 1
+    assert cache.stats()['size'] == 1
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from graph import normalize_graph
+from utils import normalize_adj2
+
+def test_normalize_graph_sym_matches_normalize_adj2():
+    adj = np.random.RandomState(0).rand(6, 6) * (np.random.RandomState(1).rand(6, 6) > .4)
+    adj[3] = 0 # a node without (outgoing) edges
+    with np.errstate(divide='ignore'):
+        expected = normalize_adj2(adj).toarray()
+    np.testing.assert_allclose(normalize_graph(adj, 'sym'), expected)
+
+def test_normalize_graph_loop_and_threshold():
+    adj = np.array([[0., 2., .5], [2., 0., 0.], [.5, 0., 0.]])
+    np.testing.assert_allclose(normalize_graph(adj, 'sym_loop'), normalize_adj2(adj + np.eye(3)).toarray())
+    with np.errstate(divide='ignore'): # node 2 has no edge above the threshold
+        expected = normalize_adj2(adj * (adj > 1.)).toarray()
+    np.testing.assert_allclose(normalize_graph(adj, 'threshold', 1.), expected)
+    np.testing.assert_allclose(normalize_graph(adj, 'row').sum(1), [1., 1., 1.])
+
+def test_normalize_graph_unknown_variant():
+    with pytest.raises(LookupError):
+        normalize_graph(np.eye(2), 'lap')
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import torch
+import torch.nn.functional as F
+import pytest
+
+from models.layers import topk_attention, neighbor_candidates
+
+def attention_params(b, m, n_hidden, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    half_hid = n_hidden // 2
+    return (torch.randn(b, m, n_hidden, generator=g), torch.randn(half_hid, n_hidden, generator=g),
+            torch.randn(half_hid, n_hidden, generator=g), torch.randn(half_hid, generator=g),
+            torch.randn(half_hid, generator=g), torch.randn(1, generator=g))
+
+def dense_attention(last_hid, W1, W2, b1, V, bv, act):
+    # the [b, m, m] attention of the dense ColaGNN forward
+    b, m, n_hidden = last_hid.size()
+    hid_rpt_m = last_hid.repeat(1, m, 1).view(b, m, m, n_hidden)
+    hid_rpt_w = last_hid.repeat(1, 1, m).view(b, m, m, n_hidden)
+    return act(hid_rpt_m @ W1.t() + hid_rpt_w @ W2.t() + b1) @ V + bv
+
+def scatter(values, index, m):
+    return values.new_zeros(values.size(0), values.size(1), m).scatter_add_(2, index, values) # padding adds 0 to column 0
+
+@pytest.mark.parametrize('chunk', [3, 256])
+def test_topk_attention_full_k_matches_dense(chunk):
+    last_hid, W1, W2, b1, V, bv = attention_params(2, 7, 8)
+    dense = dense_attention(last_hid, W1, W2, b1, V, bv, F.elu)
+    values, index, valid = topk_attention(last_hid, W1, W2, b1, V, bv, F.elu, 7, chunk=chunk)
+    assert valid.all()
+    torch.testing.assert_close(scatter(values, index, 7), dense)
+    # all candidate columns scores the same pairs
+    values, index, valid = topk_attention(last_hid, W1, W2, b1, V, bv, F.elu, 7, neighbor_candidates(torch.ones(7, 7)), chunk)
+    torch.testing.assert_close(scatter(values, index, 7), dense)
+
+def test_topk_attention_candidates():
+    last_hid, W1, W2, b1, V, bv = attention_params(2, 5, 8)
+    adj = torch.eye(5) + torch.diag(torch.ones(4), 1) + torch.diag(torch.ones(4), -1)
+    dense = dense_attention(last_hid, W1, W2, b1, V, bv, F.elu)
+    values, index, valid = topk_attention(last_hid, W1, W2, b1, V, bv, F.elu, 3, neighbor_candidates(adj))
+    # the end rows have 2 neighbors, their third entry is padding
+    assert valid.sum(-1).tolist() == [[2, 3, 3, 3, 2]] * 2
+    assert (adj[torch.arange(5).view(1, -1, 1), index][valid] != 0).all()
+    torch.testing.assert_close(scatter(values, index, 5), dense * (adj != 0))
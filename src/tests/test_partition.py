@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from partition import spectral_parts, add_halo
+
+def path_graph(m):
+    graph = np.zeros((m, m))
+    graph[np.arange(m-1), np.arange(1, m)] = 1
+    return graph + graph.T
+
+def test_add_halo_coverage():
+    graph = path_graph(12)
+    parts = add_halo(graph, spectral_parts(graph, 3), 2)
+    cores = np.concatenate([nodes[core] for nodes, core in parts])
+    # every node is predicted by exactly one core
+    assert sorted(cores.tolist()) == list(range(12))
+    for nodes, core in parts:
+        assert np.all(np.diff(nodes) > 0)
+        own = set(nodes[core].tolist())
+        # the halo holds the nodes within 2 hops of the core on the path, and nothing else
+        expected = {j for i in own for j in range(i-2, i+3) if 0 <= j < 12}
+        assert set(nodes.tolist()) == expected
+
+def test_add_halo_zero_hops():
+    graph = path_graph(6)
+    parts = add_halo(graph, [np.array([0, 1, 2]), np.array([3, 4, 5])], 0)
+    assert [nodes.tolist() for nodes, _ in parts] == [[0, 1, 2], [3, 4, 5]]
+    assert [core.tolist() for _, core in parts] == [[0, 1, 2], [0, 1, 2]]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import torch
+import pytest
+
+from train_ddp import shard_batches
+
+@pytest.mark.parametrize('n, batch_size, world', [(10, 3, 4), (12, 2, 3), (5, 4, 8)])
+def test_shard_batches_padding(n, batch_size, world):
+    shards = [shard_batches(n, batch_size, rank, world, 2, 42) for rank in range(world)]
+    # every rank runs the same steps with the same batch sizes
+    assert len(set(tuple(len(batch) for batch in batches) for batches in shards)) == 1
+    index = torch.cat([torch.cat(batches) for batches in shards]).tolist()
+    per_rank = -(-n // world)
+    assert len(index) == per_rank * world
+    # every window is trained, padding only repeats windows
+    assert set(index) == set(range(n))
+
+def test_shard_batches_epoch_permutation():
+    first = torch.cat(shard_batches(20, 4, 1, 2, 1, 42))
+    assert torch.equal(first, torch.cat(shard_batches(20, 4, 1, 2, 1, 42)))
+    assert not torch.equal(first, torch.cat(shard_batches(20, 4, 1, 2, 2, 42)))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+from utils import movemedian_6, movemean_7, smooth_tail, SMOOTH_HALF_WINDOW, interval_metrics
+
+@pytest.mark.parametrize('smoothf', [movemean_7, movemedian_6])
+@pytest.mark.parametrize('n_new', [1, 2, 5])
+def test_smooth_tail_matches_full_smoothing(smoothf, n_new):
+    # days appended to an already smoothed series, as in update.py and serve.py
+    raw = np.random.RandomState(0).poisson(20., size=(30, 4)).astype(float)
+    n_old = raw.shape[0] - n_new
+    smoothed = smooth_tail(smoothf, raw, smoothf(raw[:n_old]), max(0, n_old - SMOOTH_HALF_WINDOW))
+    np.testing.assert_allclose(smoothed, smoothf(raw))
+
+def test_interval_metrics_wis():
+    levels = [.1, .25, .5, .75, .9]
+    rs = np.random.RandomState(0)
+    y_true = rs.poisson(20., size=(8, 3)).astype(float)
+    y_quant = np.sort(rs.poisson(20., size=(8, 5, 3)).astype(float), axis=1)
+    coverage, wis = interval_metrics(y_true, y_quant, levels)
+    # WIS from the interval scores of the 80% and 50% intervals and the median
+    score = .5 * np.abs(y_true - y_quant[:, 2])
+    for lower, upper in [(0, 4), (1, 3)]:
+        alpha = 2 * levels[lower]
+        l, u = y_quant[:, lower], y_quant[:, upper]
+        interval_score = (u - l) + 2 / alpha * (l - y_true) * (y_true < l) + 2 / alpha * (y_true - u) * (y_true > u)
+        score += alpha / 2 * interval_score
+    np.testing.assert_allclose(wis, (score / 2.5).mean())
+    assert coverage == np.mean((y_true >= y_quant[:, 0]) & (y_true <= y_quant[:, -1]))
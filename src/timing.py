@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Per-stage timing of the training loop and an optional torch.profiler capture over a range of epochs.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, time, collections
+from contextlib import contextmanager
+import torch
+from torch.profiler import profile, record_function, ProfilerActivity
+
+class StageTimer(object):
+    """Seconds spent per stage (fetch, forward, backward, step, metrics, checkpoint...) since the last reset.
+
+    Stages are also labelled with record_function, so they show up in the profiler trace.
+    sync: wait for cuda kernels at the end of every stage, otherwise the time lands in the next sync point.
+    """
+    def __init__(self, enabled=True, sync=False):
+        self.enabled = enabled
+        self.sync = sync
+        self.seconds = collections.OrderedDict()
+
+    @contextmanager
+    def __call__(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        with record_function(name):
+            yield
+        if self.sync:
+            torch.cuda.synchronize()
+        self.seconds[name] = self.seconds.get(name, 0.) + time.perf_counter() - start
+
+    def timed(self, iterable, name='fetch'):
+        """Iterate over iterable (a get_batches generator) counting the time of each next() as name."""
+        iterator = iter(iterable)
+        while True:
+            with self(name):
+                item = next(iterator, None)
+            if item is None:
+                return
+            yield item
+
+    def reset(self):
+        seconds, self.seconds = self.seconds, collections.OrderedDict()
+        return seconds
+
+    def log(self):
+        return ' '.join('{} {:.3f}s'.format(k, v) for k, v in self.seconds.items())
+
+class EpochProfiler(object):
+    """torch.profiler over epochs first..last (e.g. '5-7'), writes <path>.json (chrome://tracing) and an
+    operator summary <path>.ops.txt when the last epoch ends, or on close() if training stopped before."""
+    def __init__(self, epochs, path, cuda=False, row_limit=30):
+        first, _, last = epochs.partition('-')
+        self.first, self.last = int(first), int(last or first)
+        self.path = path
+        self.row_limit = row_limit
+        self.activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if cuda else [])
+        self.prof = None
+        self.epoch = None # last epoch ended while profiling
+
+    def start_epoch(self, epoch):
+        if epoch == self.first:
+            self.prof = profile(activities=self.activities, record_shapes=True, profile_memory=True)
+            self.prof.__enter__()
+
+    def end_epoch(self, epoch):
+        if self.prof is None:
+            return
+        self.epoch = epoch
+        if epoch == self.last:
+            self.close()
+
+    def close(self):
+        """Stop profiling and write the trace and summary, if still profiling."""
+        if self.prof is None:
+            return
+        self.prof.__exit__(None, None, None)
+        if os.path.dirname(self.path) and not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        self.prof.export_chrome_trace(self.path + '.json')
+        summary = self.prof.key_averages(group_by_input_shape=True).table(sort_by='self_cpu_time_total', row_limit=self.row_limit)
+        with open(self.path + '.ops.txt', 'w') as f:
+            f.write(summary)
+        print(summary)
+        print('profiled epochs {}-{}: {}.json {}.ops.txt'.format(self.first, self.epoch or self.first, self.path, self.path))
+        self.prof = None
@@ -5,68 +5,26 @@ from __future__ import unicode_literals
 from __future__ import division
 from __future__ import print_function
 
-import os, itertools, random, argparse, time, datetime
+import os, random, time
 import numpy as np
-import random
-from sklearn.metrics import mean_squared_error, mean_absolute_error,r2_score,explained_variance_score
-from math import sqrt
+import pandas as pd
 
-import scipy.sparse as sp
-# from scipy.stats.stats import pearsonr
-from scipy.stats import pearsonr
-from models.colagnn import *
-from models.colagnn_mod import *
-from models.dummy import *
-from models.arma import *
-from models.linear import *
-from data import *
+from models import get_model
+from data import DataBasicLoader
+from options import get_parser, get_log_token
+from utils import evaluation_metrics, quantile_levels, point_quantile, pinball_loss, interval_metrics
+from timing import StageTimer, EpochProfiler
+from memory import MemoryMonitor, preflight
+from metrics_log import MetricsLogger
+from results import ResultStore
 
-import shutil
 import logging
-import glob
-import time
-from tensorboardX import SummaryWriter
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s') # include timestamp
 
 # Training settings
-ap = argparse.ArgumentParser()
-ap.add_argument('--dataset', type=str, default='ca48-548', help="Dataset string")
-ap.add_argument('--sim_mat', type=str, default='ca48-adj', help="adjacency matrix filename (*-adj.txt)")
-ap.add_argument('--sci', type=str, default='ca48-sci', help="social connectednes index")
-ap.add_argument('--svi', type=str, default='', help="social vulnerability index data")
-ap.add_argument('--n_layer', type=int, default=1, help="number of layers (default 1)") 
-ap.add_argument('--n_hidden', type=int, default=20, help="rnn hidden states (could be set as any value)") 
-ap.add_argument('--seed', type=int, default=42, help='random seed')
-ap.add_argument('--epochs', type=int, default=1500, help='number of epochs to train')
-ap.add_argument('--lr', type=float, default=1e-3, help='initial learning rate')
-ap.add_argument('--weight_decay', type=float, default=5e-4, help='weight decay (L2 loss on parameters).')
-ap.add_argument('--dropout', type=float, default=0.2, help='dropout rate usually 0.2-0.5.')
-ap.add_argument('--batch', type=int, default=32, help="batch size")
-ap.add_argument('--check_point', type=int, default=1, help="check point")
-ap.add_argument('--shuffle', action='store_true', default=False, help="not used, default false")
-ap.add_argument('--train', type=float, default=.7, help="Training ratio (0, 1)")
-ap.add_argument('--val', type=float, default=.15, help="Validation ratio (0, 1)")
-ap.add_argument('--test', type=float, default=.15, help="Testing ratio (0, 1)")
-ap.add_argument('--model', default='colagnn', help='Model to use')
-ap.add_argument('--rnn_model', default='RNN', choices=['LSTM','RNN','GRU'], help='')
-ap.add_argument('--mylog', action='store_false', default=True,  help='save tensorboad log')
-ap.add_argument('--cuda', action='store_true', default=True,  help='')
-ap.add_argument('--window', type=int, default=7, help='') 
-ap.add_argument('--horizon', type=int, default=1, help='leadtime default 1') 
-ap.add_argument('--save_dir', type=str,  default='save',help='dir path to save the final model')
-ap.add_argument('--gpu', type=int, default=1,  help='choose gpu 0-10')
-ap.add_argument('--lamda', type=float, default=0.01,  help='regularize params similarities of states')
-ap.add_argument('--bi', action='store_true', default=False,  help='bidirectional default false')
-ap.add_argument('--patience', type=int, default=100, help='patience default 100')
-ap.add_argument('--k', type=int, default=10,  help='kernels')
-ap.add_argument('--hidsp', type=int, default=15,  help='spatial dim')
-
-ap.add_argument('--smoothf', type=str, default="movemean_7", choices=['movemean_7', 'movemedian_6', 'none'], help='util function used to smooth the input time series data')
-# ap.add_argument('--smoothf', type=str, default="none", choices=['movemean_6', 'movemedian_6', 'none'], help='util function used to smooth the input time series data')
-
-
+ap = get_parser()
 args = ap.parse_args() 
 print('--------Parameters--------')
 print(args)
@@ -76,47 +34,31 @@ os.environ["CUDA_VISIBLE_DEVICES"]=str(args.gpu)
 
 import torch
 import torch.nn.functional as F
-import torch.optim as optim
-from torch.utils.data import DataLoader
 
 random.seed(args.seed)
 np.random.seed(args.seed)
 torch.manual_seed(args.seed)
 
 args.cuda = args.cuda and torch.cuda.is_available() 
+quantiles = quantile_levels(args) # [] for point forecasts
 logger.info('cuda %s', args.cuda)
 
-time_token = str(time.time()).split('.')[0] # tensorboard model
-log_token = '%s.%s.w-%s.h-%s.%s' % (args.model, args.dataset, args.window, args.horizon, args.rnn_model)
+start_time = time.time()
+time_token = str(time.time()).split('.')[0] # metrics log run dir
+log_token = get_log_token(args)
 
 if args.mylog:
-    tensorboard_log_dir = 'tensorboard/%s' % (log_token)
-    if not os.path.exists(tensorboard_log_dir):
-        os.makedirs(tensorboard_log_dir)
-    writer = SummaryWriter(tensorboard_log_dir)
-    shutil.rmtree(tensorboard_log_dir)
-    logger.info('tensorboard logging to %s', tensorboard_log_dir)
+    metrics_log = MetricsLogger('%s/%s-%s' % (args.log_dir, log_token, time_token), args.log_format, args.tensorboard)
+    logger.info('metrics logging to %s', metrics_log.path)
 
 data_loader = DataBasicLoader(args)
+stage_timer = StageTimer(args.timing or bool(args.profile_epochs), sync=args.cuda)
+profiler = EpochProfiler(args.profile_epochs, '%s/%s' % (args.profile_dir, log_token), args.cuda) if args.profile_epochs else None
 
-if args.model == 'colagnn':
-    model = ColaGNN(args, data_loader)   
-elif args.model == 'arma':
-    model = ARMA(args, data_loader)  
-elif args.model == 'dummy':
-    model = Dummy(args, data_loader)
-elif args.model == 'linear':
-    model = Linear(args, data_loader)
-elif args.model == 'colagnn_noattn':
-    model = ColaGNN_NoAttn(args, data_loader)
-elif args.model == 'colagnn_thresholding':
-    model = ColaGNN_Thresholding(args, data_loader)
-elif args.model == 'colagnn_noattn_sci':
-    model = ColaGNN_NoAttn_SCI(args, data_loader)
-elif args.model == 'colagnn_identityadj':
-    model = ColaGNN_IdentityADJ(args, data_loader)
-else: 
-    raise LookupError('can not find the model')
+if args.mem_preflight and args.model != 'dummy' and args.model != 'linear':
+    preflight(args, data_loader) # may lower args.batch, raises MemoryError if it can not fit
+model = get_model(args, data_loader)
+mem_monitor = MemoryMonitor(model, args.mem_profile, args.cuda)
  
 logger.info('model %s', model)
 if args.model != 'dummy' and args.model != 'linear':
@@ -126,8 +68,30 @@ if args.model != 'dummy' and args.model != 'linear':
     pytorch_total_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
     print('#params:',pytorch_total_params)
 
+def save_result(result_path, y_true_states, y_pred_states):
+    print(result_path)
+    if not os.path.exists(result_path):
+        os.makedirs(result_path)
+    y_pred = pd.DataFrame(y_pred_states) # convert to a dataframe
+    y_pred.to_csv(result_path + "/pred.csv", index=False) # save to file
+    y_true = pd.DataFrame(y_true_states)
+    y_true.to_csv(result_path + "/true.csv", index=False)
+
+def horizon_log(horizon_metrics):
+    lines = []
+    for k, (mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae) in enumerate(horizon_metrics):
+        lines.append('  h-{} MAE {:5.4f} std {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} R2 {:5.4f} R2s {:5.4f} Var {:5.4f} Vars {:5.4f} Peak {:5.4f}'.format(k+1, mae, std_mae, rmse, rmse_states, pcc, pcc_states,r2, r2_states, var, var_states, peak_mae))
+    return '\n'.join(lines)
+
+def interval_log(interval_stats):
+    coverage, wis = interval_stats
+    return 'TEST coverage {:5.4f} of the {:g}-{:g} quantile interval WIS {:5.4f}'.format(coverage, quantiles[0], quantiles[-1], wis)
+
 def evaluate(data_loader, data, tag='val'):
+    """Loss and metrics over a split, and a report dict with the 'horizons' metrics (--multi_horizon),
+    the 'intervals' coverage and WIS (--quantiles) and the per horizon 'predictions' (tag 'test')."""
     model.eval()
+    report = {}
     total = 0.
     n_samples = 0.
     total_loss = 0.
@@ -135,10 +99,11 @@ def evaluate(data_loader, data, tag='val'):
     batch_size = args.batch
     y_pred_mx = []
     y_true_mx = []
-    for inputs in data_loader.get_batches(data, batch_size, False):
+    for inputs in stage_timer.timed(data_loader.get_batches(data, batch_size, False)):
         X, Y = inputs[0], inputs[1]
-        output,_  = model(X)
-        loss_train = F.l1_loss(output, Y) # mse_loss
+        with stage_timer('eval_forward'):
+            output,_  = model(X)
+            loss_train = pinball_loss(output, Y, quantiles) if quantiles else F.l1_loss(output, Y) # mse_loss
         total_loss += loss_train.item()
         n_samples += (output.size(0) * data_loader.m);
 
@@ -150,43 +115,33 @@ def evaluate(data_loader, data, tag='val'):
     
     y_true_states = y_true_mx.numpy() * (data_loader.max - data_loader.min ) * 1.0 + data_loader.min  
     y_pred_states = y_pred_mx.numpy() * (data_loader.max - data_loader.min ) * 1.0 + data_loader.min  #(#n_samples, 47)
+    if quantiles: # the point forecast is the median, the intervals are scored on all quantiles
+        y_quant_states = y_pred_states # [n_samples, (h,) q, 47]
+        y_pred_states = np.take(y_quant_states, point_quantile(quantiles), axis=-2)
+        report['intervals'] = interval_metrics(y_true_states.reshape(-1, data_loader.m), y_quant_states.reshape(-1, len(quantiles), data_loader.m), quantiles)
     
-    # save prediction for the test datset
+    # keep the test predictions for the results store, per horizon
     if tag == 'test':
-        # result_path = f'result/{args.dataset}/{args.model}/{args.horizon}'
-        result_path = f'result/{args.dataset}/{args.window}/{args.model}/{args.horizon}'
-        print(result_path)
-        if not os.path.exists(result_path):
-            os.makedirs(result_path)
-        y_pred = pd.DataFrame(y_pred_states) # convert to a dataframe
-        y_pred.to_csv(result_path + "/pred.csv", index=False) # save to file
-        y_true = pd.DataFrame(y_true_states)
-        y_true.to_csv(result_path + "/true.csv", index=False)
-        
-    rmse_states = np.mean(np.sqrt(mean_squared_error(y_true_states, y_pred_states, multioutput='raw_values'))) # mean of 47
-    raw_mae = mean_absolute_error(y_true_states, y_pred_states, multioutput='raw_values')
-    std_mae = np.std(raw_mae) # Standard deviation of MAEs for all states/places 
-    pcc_tmp = []
-    for k in range(data_loader.m):
-        pcc_tmp.append(pearsonr(y_true_states[:,k],y_pred_states[:,k])[0])
-    pcc_states = np.mean(np.array(pcc_tmp)) 
-    r2_states = np.mean(r2_score(y_true_states, y_pred_states, multioutput='raw_values'))
-    var_states = np.mean(explained_variance_score(y_true_states, y_pred_states, multioutput='raw_values'))
+        if args.multi_horizon:
+            report['predictions'] = {k+1: (y_true_states[:,k], y_pred_states[:,k]) for k in range(args.horizon)}
+        else:
+            report['predictions'] = {args.horizon: (y_true_states, y_pred_states)}
+        if args.result_csv: # the former result/<dataset>/<window>/<model>/<horizon> tree
+            for k, (y_true, y_pred) in report['predictions'].items():
+                save_result(f'result/{args.dataset}/{args.window}/{args.model}{"_multi" if args.multi_horizon else ""}/{k}', y_true, y_pred)
 
-    # convert y_true & y_pred to real data
-    y_true = np.reshape(y_true_states,(-1))
-    y_pred = np.reshape(y_pred_states,(-1))
-    rmse = sqrt(mean_squared_error(y_true, y_pred))
-    mae = mean_absolute_error(y_true, y_pred)
-    pcc = pearsonr(y_true,y_pred)[0]
-    r2 = r2_score(y_true, y_pred,multioutput='uniform_average') #variance_weighted 
-    var = explained_variance_score(y_true, y_pred, multioutput='uniform_average')
-    peak_mae = peak_error(y_true_states.copy(), y_pred_states.copy(), data_loader.peak_thold)
+    with stage_timer('metrics'):
+        if args.multi_horizon:
+            # metrics for each horizon, and over all horizons below
+            report['horizons'] = [evaluation_metrics(y_true_states[:,k], y_pred_states[:,k], data_loader.peak_thold) for k in range(args.horizon)]
+            y_true_states = y_true_states.reshape(-1, data_loader.m)
+            y_pred_states = y_pred_states.reshape(-1, data_loader.m)
+        mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluation_metrics(y_true_states, y_pred_states, data_loader.peak_thold)
     global y_true_t
     global y_pred_t
     y_true_t = y_true_states
     y_pred_t = y_pred_states
-    return float(total_loss / n_samples), mae ,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae
+    return float(total_loss / n_samples), mae ,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae, report
 
 def train(data_loader, data):
     model.train()
@@ -194,16 +149,21 @@ def train(data_loader, data):
     n_samples = 0.
     batch_size = args.batch
 
-    for inputs in data_loader.get_batches(data, batch_size, True):
+    for inputs in stage_timer.timed(data_loader.get_batches(data, batch_size, True)):
         X, Y = inputs[0], inputs[1]
         optimizer.zero_grad()
-        output,_  = model(X) 
-        if Y.size(0) == 1:
-            Y = Y.view(-1)
-        loss_train = F.l1_loss(output, Y) # mse_loss
+        mem_monitor.start_step()
+        with stage_timer('forward'):
+            output,_  = model(X) 
+            if Y.size(0) == 1 and not args.multi_horizon and not quantiles:
+                Y = Y.view(-1)
+            loss_train = pinball_loss(output, Y, quantiles) if quantiles else F.l1_loss(output, Y) # mse_loss
         total_loss += loss_train.item()
-        loss_train.backward()
-        optimizer.step()
+        with stage_timer('backward'):
+            loss_train.backward()
+        with stage_timer('step'):
+            optimizer.step()
+        mem_monitor.end_step()
         n_samples += (output.size(0) * data_loader.m)
     return float(total_loss / n_samples)
 
@@ -211,6 +171,7 @@ def train(data_loader, data):
 if args.model != 'dummy' and args.model != 'linear': 
     bad_counter = 0
     best_epoch = 0
+    train_seconds = 0.
     best_val = 1e+20;
     try:
         print('begin training');
@@ -219,23 +180,20 @@ if args.model != 'dummy' and args.model != 'linear':
         
         for epoch in range(1, args.epochs+1):
             epoch_start_time = time.time()
+            if profiler:
+                profiler.start_epoch(epoch)
             train_loss = train(data_loader, data_loader.train)
-            val_loss, mae,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluate(data_loader, data_loader.val)
+            train_seconds += time.time() - epoch_start_time
+            val_loss, mae,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae, report = evaluate(data_loader, data_loader.val)
             print('Epoch {:3d}|time:{:5.2f}s|train_loss {:5.8f}|val_loss {:5.8f}'.format(epoch, (time.time() - epoch_start_time), train_loss, val_loss))
 
             if args.mylog:
-                writer.add_scalars('data/loss', {'train': train_loss}, epoch )
-                writer.add_scalars('data/loss', {'val': val_loss}, epoch)
-                writer.add_scalars('data/mae', {'val': mae}, epoch)
-                writer.add_scalars('data/rmse', {'val': rmse_states}, epoch)
-                writer.add_scalars('data/rmse_states', {'val': rmse_states}, epoch)
-                writer.add_scalars('data/pcc', {'val': pcc}, epoch)
-                writer.add_scalars('data/pcc_states', {'val': pcc_states}, epoch)
-                writer.add_scalars('data/R2', {'val': r2}, epoch)
-                writer.add_scalars('data/R2_states', {'val': r2_states}, epoch)
-                writer.add_scalars('data/var', {'val': var}, epoch)
-                writer.add_scalars('data/var_states', {'val': var_states}, epoch)
-                writer.add_scalars('data/peak_mae', {'val': peak_mae}, epoch)
+                scalars = {'train_loss': train_loss, 'val_loss': val_loss, 'mae': mae, 'rmse': rmse, 'rmse_states': rmse_states,
+                           'pcc': pcc, 'pcc_states': pcc_states, 'r2': r2, 'r2_states': r2_states, 'var': var,
+                           'var_states': var_states, 'peak_mae': peak_mae}
+                if quantiles:
+                    scalars['coverage'], scalars['wis'] = report['intervals']
+                metrics_log.log(epoch, scalars)
         
             # Save the model if the validation loss is the best we've seen so far.
             if val_loss < best_val:
@@ -243,13 +201,22 @@ if args.model != 'dummy' and args.model != 'linear':
                 best_epoch = epoch
                 bad_counter = 0
                 model_path = '%s/%s.pt' % (args.save_dir, log_token)
-                with open(model_path, 'wb') as f:
+                with stage_timer('checkpoint'), open(model_path, 'wb') as f:
                     torch.save(model.state_dict(), f)
                 print('Best validation epoch:',epoch, time.ctime());
-                test_loss, mae ,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluate(data_loader, data_loader.test)
+                test_loss, mae ,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae, report = evaluate(data_loader, data_loader.test)
                 print('TEST MAE {:5.4f} std {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} R2 {:5.4f} R2s {:5.4f} Var {:5.4f} Vars {:5.4f} Peak {:5.4f}'.format(mae, std_mae, rmse, rmse_states, pcc, pcc_states,r2, r2_states, var, var_states, peak_mae))
+                if quantiles:
+                    print(interval_log(report['intervals']))
             else:
                 bad_counter += 1
+            if profiler:
+                profiler.end_epoch(epoch)
+            if args.timing:
+                print('  ' + stage_timer.log())
+            stage_timer.reset()
+            if args.mem_profile:
+                print('  ' + mem_monitor.log())
 
             if bad_counter == args.patience:
                 break
@@ -257,18 +224,45 @@ if args.model != 'dummy' and args.model != 'linear':
     except KeyboardInterrupt:
         print('-' * 89)
         print('Exiting from training early, epoch',epoch)
+    finally:
+        if profiler:
+            profiler.close() # training stopped before the last profiled epoch
 
 # Load the best saved model.
 if args.model != 'dummy' and args.model != 'linear':
     model_path = '%s/%s.pt' % (args.save_dir, log_token)
     with open(model_path, 'rb') as f:
         model.load_state_dict(torch.load(f));
-test_loss, mae,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluate(data_loader, data_loader.test,tag='test')
+test_loss, mae,std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae, report = evaluate(data_loader, data_loader.test,tag='test')
 print('Final evaluation')
 print('TEST MAE {:5.4f} std {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} R2 {:5.4f} R2s {:5.4f} Var {:5.4f} Vars {:5.4f} Peak {:5.4f}'.format(mae, std_mae, rmse, rmse_states, pcc, pcc_states,r2, r2_states, var, var_states, peak_mae))
+if args.multi_horizon:
+    print(horizon_log(report['horizons']))
+if quantiles:
+    print(interval_log(report['intervals']))
+
+if args.mylog:
+    metrics_log.close()
+
+if args.results_db:
+    timings = {'seconds': time.time() - start_time}
+    if args.model != 'dummy' and args.model != 'linear':
+        timings.update({'epochs': epoch, 'best_epoch': best_epoch, 'train_seconds': train_seconds})
+    metrics = dict(zip(['mae', 'std_mae', 'rmse', 'rmse_states', 'pcc', 'pcc_states', 'r2', 'r2_states', 'var', 'var_states', 'peak_mae'],
+                       map(float, [mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae])))
+    if quantiles:
+        metrics['coverage'], metrics['wis'] = map(float, report['intervals'])
+    run_id = ResultStore(args.results_db).add_run(args, metrics, timings, log_token, predictions=report['predictions'])
+    print('saved run {} to {}'.format(run_id, args.results_db))
 
 with open("run_log.txt", 'a') as f:
     f.write(log_token)
     f.write(': ')
     f.write('TEST MAE {:5.4f} std {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} R2 {:5.4f} R2s {:5.4f} Var {:5.4f} Vars {:5.4f} Peak {:5.4f}'.format(mae, std_mae, rmse, rmse_states, pcc, pcc_states,r2, r2_states, var, var_states, peak_mae))
+    if args.multi_horizon:
+        f.write('\n')
+        f.write(horizon_log(report['horizons']))
+    if quantiles:
+        f.write('\n')
+        f.write(interval_log(report['intervals']))
     f.write('\n\n')
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# Data-parallel CPU training with DistributedDataParallel over gloo. Every process holds the dataset and a
+# replica of the model, trains on its shard of every batch of windows and the gradients are averaged;
+# rank 0 validates, decides early stopping and writes save/<log_token>.pt (same checkpoint as train.py).
+#
+#   torchrun --standalone --nproc_per_node 8 train_ddp.py --dataset ca48-548 --threads 8
+#
+# By default the global batch is --batch as in train.py (each process takes --batch / world size windows
+# per step); --scale_batch keeps --batch per process instead.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, time, random, math
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+from data import DataBasicLoader
+from models import get_model, NO_TRAIN_MODELS
+from options import get_parser, get_log_token
+from utils import evaluation_metrics, quantile_levels
+from export import predict
+from training import val_loss
+
+def shard_batches(n, batch_size, rank, world, epoch, seed):
+    """This rank's window indices of every step of an epoch. All ranks draw the same permutation and
+    take every world-th window, padded so each rank runs the same number of equally sized steps."""
+    g = torch.Generator()
+    g.manual_seed(seed + epoch)
+    index = torch.randperm(n, generator=g)
+    per_rank = int(math.ceil(n / world))
+    index = torch.cat([index, index[:per_rank * world - n]])[rank::world]
+    return [index[i:i + batch_size] for i in range(0, per_rank, batch_size)]
+
+def train_epoch(model, data, optimizer, batches):
+    model.train()
+    total_loss = 0.
+    X_all, Y_all = data.train
+    for excerpt in batches:
+        X, Y = X_all[excerpt], Y_all[excerpt]
+        optimizer.zero_grad()
+        output, _ = model(X)
+        loss = F.l1_loss(output.view(Y.size()), Y)
+        loss.backward()
+        optimizer.step()
+        total_loss += loss.item() * X.size(0)
+    return total_loss
+
+if __name__ == '__main__':
+    ap = get_parser()
+    ap.add_argument('--threads', type=int, default=0, help='torch threads per process, default cores / processes')
+    ap.add_argument('--scale_batch', action='store_true', default=False, help='--batch windows per process instead of in total')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, train_ddp.py uses point forecasts')
+    args.cuda = False # gloo, cpu only
+
+    # plain `python train_ddp.py` runs as a single process
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', '29500')
+    rank, world = int(os.environ.get('RANK', 0)), int(os.environ.get('WORLD_SIZE', 1))
+    dist.init_process_group('gloo', rank=rank, world_size=world)
+    torch.set_num_threads(args.threads if args.threads > 0 else max(1, (os.cpu_count() or 1) // world))
+    if args.model in NO_TRAIN_MODELS:
+        raise LookupError('{} has nothing to train'.format(args.model))
+    if rank == 0:
+        print(args)
+        print('world size {}, {} threads per process'.format(world, torch.get_num_threads()))
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    data_loader = DataBasicLoader(args)
+    model = DistributedDataParallel(get_model(args, data_loader)) # parameters broadcast from rank 0
+    optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=args.lr, weight_decay=args.weight_decay)
+    batch_size = args.batch if args.scale_batch else max(1, args.batch // world)
+    log_token = get_log_token(args)
+    model_path = '%s/%s.pt' % (args.save_dir, log_token)
+    if rank == 0 and not os.path.exists(args.save_dir):
+        os.makedirs(args.save_dir)
+
+    best_val = 1e+20
+    bad_counter = 0
+    train_time = 0.
+    n_train = data_loader.train[0].size(0)
+    for epoch in range(1, args.epochs+1):
+        epoch_start_time = time.time()
+        batches = shard_batches(n_train, batch_size, rank, world, epoch, args.seed)
+        loss = torch.tensor([train_epoch(model, data_loader, optimizer, batches)])
+        dist.all_reduce(loss)
+        train_time += time.time() - epoch_start_time
+
+        # rank 0 validates and checkpoints, the others wait for its decision
+        stop = torch.zeros(1)
+        if rank == 0:
+            loss_val = val_loss(model.module, data_loader, data_loader.val, args.batch)
+            print('Epoch {:3d}|time:{:5.2f}s|train_loss {:5.8f}|val_loss {:5.8f}'.format(
+                epoch, time.time() - epoch_start_time, loss.item() / (n_train * data_loader.m), loss_val))
+            if loss_val < best_val:
+                best_val = loss_val
+                bad_counter = 0
+                with open(model_path, 'wb') as f:
+                    torch.save(model.module.state_dict(), f)
+            else:
+                bad_counter += 1
+            stop[0] = float(bad_counter == args.patience)
+        dist.broadcast(stop, 0)
+        if stop.item():
+            break
+
+    if rank == 0:
+        print('trained {} epochs in {:.1f}s ({:.1f} windows/s)'.format(epoch, train_time, epoch * n_train / train_time))
+        model = model.module
+        with open(model_path, 'rb') as f:
+            model.load_state_dict(torch.load(f))
+        model.eval()
+        y_true_states, y_pred_states = predict(model, data_loader, data_loader.test, args.batch)
+        y_true_states = y_true_states.reshape(-1, data_loader.m)
+        y_pred_states = y_pred_states.reshape(-1, data_loader.m)
+        mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae = evaluation_metrics(y_true_states, y_pred_states, data_loader.peak_thold)
+        print('Final evaluation')
+        print('TEST MAE {:5.4f} std {:5.4f} RMSE {:5.4f} RMSEs {:5.4f} PCC {:5.4f} PCCs {:5.4f} R2 {:5.4f} R2s {:5.4f} Var {:5.4f} Vars {:5.4f} Peak {:5.4f}'.format(mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae))
+    dist.destroy_process_group()
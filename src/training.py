@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# The training loop of train.py for the scripts that retrain models (backtest, update, ensemble, partition):
+# Adam, one l1 step per minibatch, early stopping on the validation loss and the best weights kept.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import time, copy
+import torch
+import torch.nn.functional as F
+
+def train_epoch(model, data, split, optimizer, batch_size):
+    """One pass over the shuffled windows of split, returns the mean l1 loss."""
+    model.train()
+    total_loss, n = 0., 0
+    for X, Y in data.get_batches(split, batch_size, True):
+        optimizer.zero_grad()
+        output, _ = model(X)
+        loss = F.l1_loss(output.view(Y.size()), Y)
+        loss.backward()
+        optimizer.step()
+        total_loss += loss.item() * Y.numel()
+        n += Y.numel()
+    return total_loss / max(n, 1)
+
+def val_loss(model, data, split, batch_size):
+    """Mean l1 loss over the windows of split."""
+    model.eval()
+    total_loss, n = 0., 0
+    with torch.no_grad():
+        for X, Y in data.get_batches(split, batch_size, False):
+            output, _ = model(X)
+            total_loss += F.l1_loss(output.view(Y.size()), Y, reduction='sum').item()
+            n += Y.numel()
+    return total_loss / max(n, 1)
+
+def fit(model, data, train, val, epochs, patience, args, train_epoch=train_epoch, val_loss=val_loss, verbose=False):
+    """Train with early stopping on val, as in train.py, and keep the best weights.
+
+    train_epoch(model, data, split, optimizer, batch_size) and val_loss(model, data, split, batch_size)
+    replace the plain minibatch pass and validation (partition.py trains and validates per subgraph).
+    Returns the epochs run, the best epoch and its validation loss.
+    """
+    optimizer = torch.optim.Adam(filter(lambda p: p.requires_grad, model.parameters()), lr=args.lr, weight_decay=args.weight_decay)
+    best_val, best_epoch = 1e+20, 0
+    best_state = copy.deepcopy(model.state_dict())
+    bad_counter = 0
+    epoch = 0
+    for epoch in range(1, epochs+1):
+        epoch_start_time = time.time()
+        train_loss = train_epoch(model, data, train, optimizer, args.batch)
+        loss = val_loss(model, data, val, args.batch)
+        if verbose:
+            print('Epoch {:3d}|time:{:5.2f}s|train_loss {:5.8f}|val_loss {:5.8f}'.format(epoch, (time.time() - epoch_start_time), train_loss, loss))
+        if loss < best_val:
+            best_val, best_epoch = loss, epoch
+            best_state = copy.deepcopy(model.state_dict())
+            bad_counter = 0
+        else:
+            bad_counter += 1
+        if bad_counter == patience:
+            break
+    model.load_state_dict(best_state)
+    return epoch, best_epoch, best_val
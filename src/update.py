@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# Daily update of a trained model: append the new days to the cached series of its log_token, re-smooth and
+# rebuild windows only for the tail, and fine-tune save/<log_token>.pt on the recent windows for a bounded
+# number of epochs, keeping the normalization the model was trained with.
+#
+# The first run (or --rebuild) builds cache/<log_token>.npz from ../data/ts/<dataset>.txt.
+
+from __future__ import absolute_import
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import print_function
+
+import os, time, shutil, random
+import numpy as np
+import torch
+
+from data import DataBasicLoader
+from options import get_parser, get_log_token
+from utils import movemedian_6, movemean_7, smooth_tail, SMOOTH_HALF_WINDOW, quantile_levels
+from models import NO_TRAIN_MODELS
+from export import load_model
+from training import fit
+
+def cache_path(args):
+    return '%s/%s.npz' % (args.cache_dir, get_log_token(args))
+
+def build_cache(args):
+    """Cache the raw and smoothed series, the training normalization and the windows of every target day."""
+    raw = np.loadtxt(open("../data/ts/{}.txt".format(args.dataset)), delimiter=',', ndmin=2)
+    smoothed = eval(args.smoothf)(raw) if args.smoothf != "none" else raw
+    data = DataBasicLoader(args, rawdata=smoothed)
+    X, Y = data._batchify(range(data.P + data.h - 1, data.n), data.h)
+    cache = {
+        'raw': raw,
+        'smoothed': smoothed,
+        'min': data.min, 'max': data.max, 'peak_thold': data.peak_thold,
+        'X': X.numpy(), 'Y': Y.numpy(),
+    }
+    save_cache(args, cache)
+    return cache
+
+def load_cache(args):
+    with np.load(cache_path(args)) as f:
+        return {k: f[k] for k in f.files}
+
+def save_cache(args, cache):
+    if not os.path.exists(args.cache_dir):
+        os.makedirs(args.cache_dir)
+    cache['n'] = np.array(cache['raw'].shape[0]) # dataset version: number of days
+    np.savez(cache_path(args), **cache)
+
+def append_days(args, cache, new_rows):
+    """Append new_rows [k, m] and rebuild only what they change. Returns the updated cache and loader."""
+    n_old = cache['raw'].shape[0]
+    raw = np.concatenate([cache['raw'], new_rows], axis=0)
+    if args.smoothf != "none":
+        # smoothed values of the last days before the update used a truncated window, recompute from there
+        start = max(0, n_old - SMOOTH_HALF_WINDOW)
+        smoothed = smooth_tail(eval(args.smoothf), raw, cache['smoothed'], start)
+    else:
+        start = n_old
+        smoothed = raw
+    data = DataBasicLoader(args, rawdata=smoothed, scale=(cache['min'], cache['max'], cache['peak_thold']))
+
+    # windows whose target day is before start only read unchanged days
+    offset = data.P + data.h - 1
+    keep = max(0, start - offset)
+    X, Y = data._batchify(range(offset + keep, data.n), data.h)
+    cache.update(raw=raw, smoothed=smoothed,
+                 X=np.concatenate([cache['X'][:keep], X.numpy()]),
+                 Y=np.concatenate([cache['Y'][:keep], Y.numpy()]))
+    print('appended {} days ({} -> {}), rebuilt {} windows'.format(new_rows.shape[0], n_old, data.n, X.size(0)))
+    return cache, data
+
+if __name__ == '__main__':
+    ap = get_parser()
+    ap.add_argument('--new_days', type=str, default='', help='csv of the new daily rows to append (one row per day, m columns)')
+    ap.add_argument('--cache_dir', type=str, default='cache', help='dir path of the cached series and windows')
+    ap.add_argument('--rebuild', action='store_true', default=False, help='rebuild the cache from the dataset file')
+    ap.add_argument('--update_epochs', type=int, default=20, help='max fine-tuning epochs')
+    ap.add_argument('--tune_days', type=int, default=60, help='most recent windows used for fine-tuning')
+    ap.add_argument('--val_days', type=int, default=7, help='last windows used for early stopping')
+    args = ap.parse_args()
+    if quantile_levels(args):
+        raise LookupError('--quantiles is only supported by train.py, update.py uses point forecasts')
+    args.cuda = args.cuda and torch.cuda.is_available()
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    start_time = time.time()
+    if args.rebuild or not os.path.exists(cache_path(args)):
+        cache = build_cache(args)
+        print('built', cache_path(args))
+    else:
+        cache = load_cache(args)
+
+    if args.new_days:
+        new_rows = np.loadtxt(open(args.new_days), delimiter=',', ndmin=2)
+        cache, data_loader = append_days(args, cache, new_rows)
+        save_cache(args, cache)
+
+    if args.new_days and args.model not in NO_TRAIN_MODELS:
+        model_path = '%s/%s.pt' % (args.save_dir, get_log_token(args))
+        model = load_model(args, data_loader, model_path)
+        if args.cuda:
+            model.cuda()
+        X, Y = torch.from_numpy(cache['X']), torch.from_numpy(cache['Y'])
+        tune = slice(max(0, X.size(0) - args.tune_days), X.size(0) - args.val_days)
+        val = slice(X.size(0) - args.val_days, X.size(0))
+        epochs, _, _ = fit(model, data_loader, [X[tune], Y[tune]], [X[val], Y[val]], args.update_epochs, args.patience, args)
+        shutil.copyfile(model_path, '%s/%s.prev.pt' % (args.save_dir, get_log_token(args)))
+        with open(model_path, 'wb') as f:
+            torch.save(model.state_dict(), f)
+        print('fine-tuned {} epochs, saved {}'.format(epochs, model_path))
+    print('update done in {:.2f}s'.format(time.time() - start_time))
@@ -10,7 +10,9 @@ import string
 import torch
 import torch.nn.functional as F
 from sklearn import preprocessing
-from sklearn.metrics import mean_absolute_error
+from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score, explained_variance_score
+from scipy.stats import pearsonr
+from math import sqrt
 # from scipy.signal import find_peaks
  
  
@@ -29,6 +31,60 @@ def peak_error(y_true_states, y_pred_states, threshold):
     return peak_mae
 
 
+# metrics reported by train.py, on denormalized [n_samples, m] predictions
+def evaluation_metrics(y_true_states, y_pred_states, peak_thold):
+    rmse_states = np.mean(np.sqrt(mean_squared_error(y_true_states, y_pred_states, multioutput='raw_values'))) # mean of 47
+    raw_mae = mean_absolute_error(y_true_states, y_pred_states, multioutput='raw_values')
+    std_mae = np.std(raw_mae) # Standard deviation of MAEs for all states/places 
+    pcc_tmp = []
+    for k in range(y_true_states.shape[1]):
+        pcc_tmp.append(pearsonr(y_true_states[:,k],y_pred_states[:,k])[0])
+    pcc_states = np.mean(np.array(pcc_tmp)) 
+    r2_states = np.mean(r2_score(y_true_states, y_pred_states, multioutput='raw_values'))
+    var_states = np.mean(explained_variance_score(y_true_states, y_pred_states, multioutput='raw_values'))
+
+    # convert y_true & y_pred to real data
+    y_true = np.reshape(y_true_states,(-1))
+    y_pred = np.reshape(y_pred_states,(-1))
+    rmse = sqrt(mean_squared_error(y_true, y_pred))
+    mae = mean_absolute_error(y_true, y_pred)
+    pcc = pearsonr(y_true,y_pred)[0]
+    r2 = r2_score(y_true, y_pred,multioutput='uniform_average') #variance_weighted 
+    var = explained_variance_score(y_true, y_pred, multioutput='uniform_average')
+    peak_mae = peak_error(y_true_states.copy(), y_pred_states.copy(), peak_thold)
+    return mae, std_mae, rmse, rmse_states, pcc, pcc_states, r2, r2_states, var, var_states, peak_mae
+
+
+# quantile levels of --quantiles '0.1,0.5,0.9', [] for point forecasts; the median and symmetric pairs
+# (q, 1 - q) are required, the median is the point forecast and the pairs are the intervals of the WIS
+def quantile_levels(args):
+    levels = sorted(float(q) for q in getattr(args, 'quantiles', '').split(',') if q.strip())
+    if any(not 0 < q < 1 for q in levels):
+        raise LookupError('quantile levels must be in (0, 1), got {}'.format(levels))
+    if levels and (not np.isclose(levels, 0.5).any() or not np.allclose(levels, [1 - q for q in reversed(levels)])):
+        raise LookupError('quantile levels must include 0.5 and be symmetric around it, got {}'.format(levels))
+    return levels
+
+# index of the quantile used as the point forecast, the median
+def point_quantile(levels):
+    return int(np.argmin(np.abs(np.array(levels) - 0.5)))
+
+# mean pinball loss of quantile forecasts [..., q, m] against the targets [..., m]
+def pinball_loss(output, target, levels):
+    q = torch.tensor(levels, dtype=output.dtype, device=output.device).view(-1, 1)
+    err = target.unsqueeze(-2) - output
+    return torch.max(q * err, (q - 1) * err).mean()
+
+# coverage of the [lowest, highest] quantile interval and weighted interval score on denormalized
+# y_true [n_samples, m] and y_quant [n_samples, q, m]; with K symmetric intervals and the median,
+# WIS = 1/(K+1/2) * sum of the pinball losses = 2 * mean pinball loss
+def interval_metrics(y_true_states, y_quant_states, levels):
+    q = np.array(levels).reshape(-1, 1)
+    err = y_true_states[:, None] - y_quant_states
+    wis = 2 * np.maximum(q * err, (q - 1) * err).mean()
+    coverage = np.mean((y_true_states >= y_quant_states[:, 0]) & (y_true_states <= y_quant_states[:, -1]))
+    return coverage, wis
+
     
 def normalize_adj2(adj):
     """Symmetrically normalize adjacency matrix."""
@@ -98,3 +154,13 @@ def movemean_7(data):
         smoothed.append(smoothed_node)
     data = np.array(smoothed)
     return np.transpose(data)
+
+
+# Both smoothers only look 3 days to each side
+SMOOTH_HALF_WINDOW = 3
+
+# Smooth only the rows of data from `start` on, given the rows before it are already smoothed
+def smooth_tail(smoothf, data, smoothed, start):
+    lidx = max(0, start - SMOOTH_HALF_WINDOW)
+    tail = smoothf(data[lidx:])[start - lidx:]
+    return np.concatenate([smoothed[:start], tail], axis=0)